@@ -4,9 +4,56 @@ Módulo para análisis forense usando Google AI (Gemini)
 import os
 import json
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
+from SpooledOutput import SpooledOutput
+from ColumnarRecords import ColumnarRecords, correlate_unsigned_connections
+from BudgetPlanner import TokenBudgetPlanner, estimate_tokens
+from Checkpoints import CheckpointStore
+from ModelBackends import ModelBackend, build_backend_from_env
+from SingleFlight import SingleFlight, default_single_flight, prompt_key
+from SimilarityIndex import SimilarityIndex, SimilarMatch
+from Timeline import Timeline
+
+# Los datos de una tarea pueden llegar como texto, como salida volcada a disco
+# o ya convertidos en registros columnares
+TaskData = Union[str, SpooledOutput, ColumnarRecords]
+
+
+# Formato de salida común a todos los análisis; forma parte del prefijo
+# estático que se envía una vez por sesión junto con Prompt.txt
+OUTPUT_FORMAT_INSTRUCTIONS = """FORMATO DE SALIDA REQUERIDO:
+
+Primero, proporciona un resumen corto (3-5 líneas) en español.
+
+Luego, proporciona un análisis estructurado en JSON con el siguiente formato:
+{
+    "summary": "Resumen general del análisis",
+    "findings": [
+        {
+            "id": "F1",
+            "title": "Título del hallazgo",
+            "description": "Descripción detallada",
+            "confidence": "high/medium/low",
+            "risk_level": "high/medium/low",
+            "evidence": "Evidencia específica de los datos"
+        }
+    ],
+    "recommendations": [
+        "Recomendación 1",
+        "Recomendación 2"
+    ],
+    "statistics": {
+        "total_items_analyzed": 0,
+        "suspicious_items": 0,
+        "clean_items": 0
+    }
+}
+"""
+
 
 # Configurar logging
 def setup_logging():
@@ -38,14 +85,45 @@ logger = setup_logging()
 class AIAnalyzer:
     """Clase para analizar datos forenses usando Google AI"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        prompt_token_budget: int = 4000,
+        checkpoint_store: Optional[CheckpointStore] = None,
+        backend: Optional[ModelBackend] = None,
+        single_flight: Optional[SingleFlight] = None,
+        record_exchanges: bool = False,
+        similarity_index: Optional[SimilarityIndex] = None
+    ):
         """
         Inicializa el analizador de IA
         
         Args:
             api_key: API key de Google AI. Si no se proporciona, se busca en variable de entorno GOOGLE_API_KEY
+            prompt_token_budget: Tokens de datos que admite cada prompt (el de
+                cada tarea o el consolidado de analyze_multiple_tasks)
+            checkpoint_store: Almacén de puntos de control para reutilizar
+                respuestas de prompts idénticos (opcional)
+            backend: Backend de modelo a usar. Si no se proporciona se
+                construye según las variables de entorno (triaje con un
+                modelo rápido y escalado a Gemini 2.5 Pro)
+            single_flight: Agrupador de peticiones idénticas en curso (por
+                defecto, el compartido por todo el proceso)
+            record_exchanges: Conservar los prompts y respuestas de la sesión
+                para el paquete de evidencias (ver pop_exchanges)
+            similarity_index: Índice de análisis anteriores para reutilizar
+                los hallazgos de instantáneas casi idénticas (opcional)
         """
         logger.info("Inicializando AIAnalyzer...")
+        self.prompt_token_budget = prompt_token_budget
+        self.checkpoint_store = checkpoint_store
+        self.similarity_index = similarity_index
+        self.single_flight = single_flight if single_flight is not None else default_single_flight()
+        
+        # Prompts y respuestas de la sesión, para el paquete de evidencias
+        self.record_exchanges = record_exchanges
+        self.exchanges: List[Tuple[str, str]] = []
+        self._exchanges_lock = threading.Lock()
         
         try:
             if api_key is None:
@@ -61,12 +139,17 @@ class AIAnalyzer:
             genai.configure(api_key=api_key)
             logger.info("Google AI configurado correctamente")
             
-            # Usar el modelo Gemini 2.5 Pro
-            self.model = genai.GenerativeModel('gemini-2.5-pro')
-            logger.info("Modelo Gemini 2.5 Pro inicializado")
-            
             # Cargar el prompt del sistema
             self.system_prompt = self._load_system_prompt()
+            
+            # Prefijo estático: se envía una vez por sesión como instrucción
+            # de sistema (con caché de contexto si el proveedor la admite)
+            self.static_prefix = f"{self.system_prompt}\n\n---\n\n{OUTPUT_FORMAT_INSTRUCTIONS}"
+            
+            # Backend de modelo (por defecto triaje rápido + escalado a Gemini 2.5 Pro)
+            self.backend = backend if backend is not None else build_backend_from_env()
+            self.backend.configure_system(self.static_prefix)
+            logger.info(f"Backend de modelo inicializado: {self.backend.name}")
             logger.info("AIAnalyzer inicializado exitosamente")
             
         except Exception as e:
@@ -95,10 +178,146 @@ class AIAnalyzer:
             return """Eres un asistente forense orientado a sistemas Windows. 
             Analiza los datos proporcionados y genera un resumen claro de hallazgos sospechosos."""
     
+    def _generate(self, prompt: str) -> str:
+        """
+        Envía el prompt al modelo y devuelve el texto de la respuesta
+        
+        El prompt contiene solo la parte variable; el prefijo estático ya
+        está configurado en el backend como instrucción de sistema.
+        
+        Si hay almacén de puntos de control y el mismo prompt ya se respondió
+        dentro de la ventana de frescura, se reutiliza esa respuesta. Si el
+        mismo prompt ya está en curso (en otro hilo u otro proceso), se
+        espera a esa llamada en lugar de repetirla.
+        
+        Args:
+            prompt: Prompt completo
+            
+        Returns:
+            Texto de la respuesta
+        """
+        # El prefijo estático forma parte de la clave: si cambia Prompt.txt
+        # no se reutilizan respuestas anteriores
+        full_prompt = f"{self.static_prefix}\n\n---\n\n{prompt}"
+        
+        if self.checkpoint_store is not None:
+            cached = self.checkpoint_store.load_response(full_prompt)
+            if cached is not None:
+                print("  (Respuesta reutilizada del punto de control)")
+                logger.info("Respuesta de IA reutilizada desde punto de control")
+                self._record_exchange(prompt, cached)
+                return cached
+            self.checkpoint_store.save_prompt(full_prompt)
+        
+        analysis_text = self.single_flight.do(
+            prompt_key(full_prompt), lambda: self.backend.generate(prompt)
+        )
+        stats = self.backend.stats_report()
+        if stats:
+            logger.info(f"Estadísticas del modelo:\n{stats}")
+        
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.save_response(full_prompt, analysis_text)
+        self._record_exchange(prompt, analysis_text)
+        return analysis_text
+    
+    def _record_exchange(self, prompt: str, response: str):
+        """Conserva un par prompt/respuesta si se pidió al crear el analizador"""
+        if not self.record_exchanges:
+            return
+        with self._exchanges_lock:
+            self.exchanges.append((prompt, response))
+    
+    def pop_exchanges(self) -> List[Tuple[str, str]]:
+        """
+        Devuelve y vacía los pares (prompt, respuesta) registrados
+        
+        Los prompts no incluyen el prefijo estático (self.static_prefix).
+        """
+        with self._exchanges_lock:
+            exchanges, self.exchanges = self.exchanges, []
+        return exchanges
+    
+    @staticmethod
+    def _parse_response(analysis_text: str, default_summary: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Separa el resumen corto y el JSON estructurado de una respuesta
+        
+        Args:
+            analysis_text: Texto de la respuesta del modelo
+            default_summary: Resumen a usar si no hay JSON válido
+            
+        Returns:
+            Tupla (resumen corto, análisis estructurado)
+        """
+        json_start = analysis_text.find('{')
+        json_end = analysis_text.rfind('}') + 1
+        
+        analysis_json = None
+        if json_start >= 0 and json_end > json_start:
+            json_str = analysis_text[json_start:json_end]
+            try:
+                analysis_json = json.loads(json_str)
+                logger.info("JSON parseado correctamente de la respuesta de IA")
+            except json.JSONDecodeError as e:
+                logger.warning(f"Error al parsear JSON de la respuesta: {str(e)}")
+        else:
+            logger.warning("No se encontró JSON en la respuesta de la IA")
+        
+        if analysis_json is None:
+            # Si no se puede parsear, crear estructura básica
+            analysis_json = {
+                "summary": default_summary,
+                "findings": [],
+                "recommendations": []
+            }
+        
+        # Extraer resumen corto (texto antes del JSON)
+        if json_start > 0:
+            summary_short = analysis_text[:json_start].strip()
+        else:
+            summary_short = analysis_text[:200].strip() + "..."
+        
+        return summary_short, analysis_json
+    
+    @staticmethod
+    def _correlation_section(tasks_data: Dict[str, TaskData]) -> str:
+        """Texto con los procesos sin firma que tienen conexiones de red (por PID)"""
+        connections = tasks_data.get('Get-InternetProcesses')
+        unsigned = tasks_data.get('Get-UnsignedProcesses')
+        if not (isinstance(connections, ColumnarRecords) and isinstance(unsigned, ColumnarRecords)):
+            return ""
+        
+        correlated = correlate_unsigned_connections(connections, unsigned)
+        logger.debug(f"Procesos sin firma con conexiones: {len(correlated)}")
+        if not len(correlated):
+            return ""
+        return (
+            "\n\n=== CORRELACIÓN: procesos sin firma con conexiones de red ===\n"
+            f"{correlated.to_prompt_text(2000)}\n"
+        )
+    
+    @staticmethod
+    def _timeline_section(tasks_data: Dict[str, TaskData]) -> Tuple[str, List[Tuple[str, str, str, int]]]:
+        """
+        Línea de tiempo unificada de las tareas (eventos, conexiones y procesos)
+        
+        Returns:
+            Tupla (texto para el prompt, filas para el reporte)
+        """
+        timeline = Timeline.build(tasks_data)
+        logger.debug(f"Entradas en la línea de tiempo: {len(timeline)}")
+        if not len(timeline):
+            return "", []
+        return (
+            "\n\n=== LÍNEA DE TIEMPO (todas las fuentes, orden cronológico) ===\n"
+            f"{timeline.to_prompt_text(3000)}\n"
+        ), timeline.rows()
+    
     def analyze_forensic_data(
         self,
         task_name: str,
-        data: str,
+        data: TaskData,
         additional_context: Optional[str] = None
     ) -> Dict[str, Any]:
         """
@@ -106,7 +325,7 @@ class AIAnalyzer:
         
         Args:
             task_name: Nombre de la tarea ejecutada (ej: "Get-SuspiciousEvents")
-            data: Datos recopilados en formato texto
+            data: Datos recopilados (texto, SpooledOutput o ColumnarRecords)
             additional_context: Contexto adicional opcional
             
         Returns:
@@ -116,8 +335,28 @@ class AIAnalyzer:
         logger.debug(f"Tamaño de datos a analizar: {len(data)} caracteres")
         
         try:
+            # Buscar un análisis anterior de una instantánea casi idéntica
+            snapshot = match = None
+            if self.similarity_index is not None and isinstance(data, ColumnarRecords) and len(data):
+                snapshot = self.similarity_index.snapshot(task_name, data)
+                match = self.similarity_index.find(snapshot)
+            
+            if match is not None and match.identical:
+                print("  ✓ Datos idénticos a un análisis anterior (se reutilizan sus hallazgos)")
+                logger.info(f"Análisis reutilizado de la entrada {match.entry_id}")
+                return dict(match.result, success=True, error=None)
+            
             # Construir el prompt para la IA
-            prompt = self._build_analysis_prompt(task_name, data, additional_context)
+            if match is not None:
+                print(
+                    f"  Datos similares ({match.similarity:.0%}) a un análisis anterior: "
+                    f"se envían solo {len(match.new_positions)} registros distintos"
+                )
+                prompt = self._build_followup_prompt(
+                    task_name, data.take(match.new_positions), match, additional_context
+                )
+            else:
+                prompt = self._build_analysis_prompt(task_name, data, additional_context)
             logger.debug(f"Prompt construido, tamaño: {len(prompt)} caracteres")
             
             # Generar respuesta
@@ -125,55 +364,30 @@ class AIAnalyzer:
             print("  Esto puede tardar 10-30 segundos...")
             logger.info("Enviando solicitud a Google AI (Gemini)...")
             
-            response = self.model.generate_content(prompt)
+            analysis_text = self._generate(prompt)
             
             print("  ✓ Respuesta recibida de la IA")
             logger.info("Respuesta recibida exitosamente de Google AI")
             
             # Intentar parsear la respuesta como JSON
-            analysis_text = response.text
             logger.debug(f"Longitud de respuesta: {len(analysis_text)} caracteres")
             
-            # Buscar el JSON en la respuesta
-            json_start = analysis_text.find('{')
-            json_end = analysis_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = analysis_text[json_start:json_end]
-                try:
-                    analysis_json = json.loads(json_str)
-                    logger.info("JSON parseado correctamente de la respuesta de IA")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Error al parsear JSON de la respuesta: {str(e)}")
-                    # Si no se puede parsear, crear estructura básica
-                    analysis_json = {
-                        "summary": "Análisis completado",
-                        "findings": [],
-                        "recommendations": []
-                    }
-            else:
-                logger.warning("No se encontró JSON en la respuesta de la IA")
-                analysis_json = {
-                    "summary": "Análisis completado",
-                    "findings": [],
-                    "recommendations": []
-                }
-            
-            # Extraer resumen corto (texto antes del JSON)
-            if json_start > 0:
-                summary_short = analysis_text[:json_start].strip()
-            else:
-                summary_short = analysis_text[:200].strip() + "..."
+            summary_short, analysis_json = self._parse_response(
+                analysis_text, "Análisis completado"
+            )
             
             logger.info(f"Análisis completado exitosamente para tarea: {task_name}")
             
-            return {
+            result = {
                 'success': True,
                 'summary_short': summary_short,
                 'analysis': analysis_json,
                 'full_text': analysis_text,
                 'error': None
             }
+            if snapshot is not None:
+                self.similarity_index.add(snapshot, result)
+            return result
             
         except Exception as e:
             error_msg = f"Error en análisis de IA para {task_name}: {str(e)}"
@@ -187,22 +401,33 @@ class AIAnalyzer:
                 'error': f"Error al analizar con IA: {str(e)}"
             }
     
+    def _task_section(self, task_name: str, data: TaskData) -> str:
+        """
+        Texto de los datos de una tarea ajustado al presupuesto de tokens
+
+        El planificador elige los registros por estratos y puntuación de
+        sospecha; si no caben todos, se indica al modelo qué se omitió.
+        """
+        plan = TokenBudgetPlanner(budget_tokens=self.prompt_token_budget).plan({task_name: data})
+        section = plan.sections[task_name]
+        omitted_report = plan.omitted_report()
+        if omitted_report:
+            logger.info(f"Datos omitidos por presupuesto:\n{omitted_report}")
+            section += f"\n\nDATOS OMITIDOS POR LÍMITE DE TAMAÑO:\n{omitted_report}"
+        return section
+    
     def _build_analysis_prompt(
         self,
         task_name: str,
-        data: str,
+        data: TaskData,
         additional_context: Optional[str] = None
     ) -> str:
         """Construye el prompt para el análisis"""
         
-        prompt = f"""{self.system_prompt}
-
----
-
-TAREA EJECUTADA: {task_name}
+        prompt = f"""TAREA EJECUTADA: {task_name}
 
 DATOS RECOPILADOS:
-{data[:10000]}  
+{self._task_section(task_name, data)}
 
 {"CONTEXTO ADICIONAL: " + additional_context if additional_context else ""}
 
@@ -214,45 +439,56 @@ INSTRUCCIONES:
 3. Evalúa el nivel de riesgo de cada hallazgo
 4. Proporciona recomendaciones específicas
 
-FORMATO DE SALIDA REQUERIDO:
+FORMATO DE SALIDA: el indicado en las instrucciones del sistema (resumen corto + JSON estructurado)
+"""
+        return prompt
+    
+    def _build_followup_prompt(
+        self,
+        task_name: str,
+        new_records: ColumnarRecords,
+        match: SimilarMatch,
+        additional_context: Optional[str] = None
+    ) -> str:
+        """Construye el prompt de seguimiento con solo los registros que cambiaron"""
+        previous = match.result
+        
+        prompt = f"""TAREA EJECUTADA: {task_name} (ANÁLISIS DE SEGUIMIENTO)
 
-Primero, proporciona un resumen corto (3-5 líneas) en español.
+Los datos de esta tarea coinciden en un {match.similarity:.0%} con los de un análisis anterior.
+Solo se envían los registros que no estaban en esa recolección o que aparecen un número distinto de veces ({match.changed_counts} registros cambiaron de frecuencia); {match.removed} registros anteriores ya no aparecen.
 
-Luego, proporciona un análisis estructurado en JSON con el siguiente formato:
-{{
-    "summary": "Resumen general del análisis",
-    "findings": [
-        {{
-            "id": "F1",
-            "title": "Título del hallazgo",
-            "description": "Descripción detallada",
-            "confidence": "high/medium/low",
-            "risk_level": "high/medium/low",
-            "evidence": "Evidencia específica de los datos"
-        }}
-    ],
-    "recommendations": [
-        "Recomendación 1",
-        "Recomendación 2"
-    ],
-    "statistics": {{
-        "total_items_analyzed": 0,
-        "suspicious_items": 0,
-        "clean_items": 0
-    }}
-}}
+ANÁLISIS ANTERIOR:
+Resumen: {previous.get('summary_short', '')}
+{json.dumps(previous.get('analysis', {}), ensure_ascii=False, indent=1)}
+
+REGISTROS NUEVOS O MODIFICADOS ({len(new_records)}):
+{self._task_section(task_name, new_records)}
+
+{"CONTEXTO ADICIONAL: " + additional_context if additional_context else ""}
+
+---
+
+INSTRUCCIONES:
+1. Analiza los registros nuevos o modificados
+2. Conserva los hallazgos del análisis anterior que sigan vigentes y añade los nuevos
+3. Ajusta el nivel de riesgo si los registros nuevos lo justifican
+4. Devuelve el análisis completo actualizado, no solo las diferencias
+
+FORMATO DE SALIDA: el indicado en las instrucciones del sistema (resumen corto + JSON estructurado)
 """
         return prompt
     
     def analyze_multiple_tasks(
         self,
-        tasks_data: Dict[str, str]
+        tasks_data: Dict[str, TaskData]
     ) -> Dict[str, Any]:
         """
         Analiza múltiples tareas forenses juntas
         
         Args:
-            tasks_data: Dict con nombre de tarea como clave y datos como valor
+            tasks_data: Dict con nombre de tarea como clave y datos (texto,
+                SpooledOutput o ColumnarRecords) como valor
             
         Returns:
             Dict con análisis consolidado
@@ -261,26 +497,47 @@ Luego, proporciona un análisis estructurado en JSON con el siguiente formato:
         logger.info(f"Tareas a analizar: {', '.join(tasks_data.keys())}")
         
         try:
-            # Combinar todos los datos
-            combined_data = ""
+            # Correlación de procesos sin firma con conexiones activas (por PID)
+            # y línea de tiempo unificada de todas las fuentes
+            timeline_text, timeline_rows = self._timeline_section(tasks_data)
+            correlation_text = self._correlation_section(tasks_data) + timeline_text
+            
+            # Repartir el presupuesto de tokens según volumen y sospecha de cada tarea
+            planner = TokenBudgetPlanner(
+                budget_tokens=max(self.prompt_token_budget - estimate_tokens(correlation_text), 0)
+            )
+            plan = planner.plan(tasks_data)
+            
+            parts = []
             for task_name, data in tasks_data.items():
-                combined_data += f"\n\n=== {task_name} ===\n{data[:5000]}\n"
-                logger.debug(f"Agregando datos de {task_name}: {len(data)} caracteres")
+                allocation = plan.allocations[task_name]
+                logger.debug(
+                    f"Agregando datos de {task_name}: {len(data)} -> "
+                    f"{allocation.used_tokens}/{allocation.budget_tokens} tokens"
+                )
+                parts.append(f"\n\n=== {task_name} ===\n{plan.sections[task_name]}\n")
+            parts.append(correlation_text)
+            
+            omitted_report = plan.omitted_report()
+            if omitted_report:
+                logger.info(f"Datos omitidos por presupuesto:\n{omitted_report}")
+                parts.append(
+                    "\n\n=== DATOS OMITIDOS POR LÍMITE DE TAMAÑO "
+                    "(se incluyó al menos un registro de cada grupo) ===\n"
+                    f"{omitted_report}\n"
+                )
+            combined_data = "".join(parts)
             
             logger.debug(f"Datos combinados totales: {len(combined_data)} caracteres")
             
             # Construir prompt combinado
-            prompt = f"""{self.system_prompt}
-
----
-
-ANÁLISIS FORENSE MÚLTIPLE
+            prompt = f"""ANÁLISIS FORENSE MÚLTIPLE
 
 Se han ejecutado las siguientes tareas forenses:
 {', '.join(tasks_data.keys())}
 
 DATOS COMBINADOS:
-{combined_data[:15000]}
+{combined_data}
 
 ---
 
@@ -299,42 +556,17 @@ FORMATO DE SALIDA: Igual que el análisis individual (resumen corto + JSON estru
             print("  Esto puede tardar 30-60 segundos...")
             logger.info("Enviando análisis consolidado a Google AI...")
             
-            response = self.model.generate_content(prompt)
+            analysis_text = self._generate(prompt)
             
             print("  ✓ Análisis consolidado recibido")
             logger.info("Análisis consolidado recibido exitosamente de Google AI")
             
-            analysis_text = response.text
             logger.debug(f"Longitud de respuesta consolidada: {len(analysis_text)} caracteres")
             
             # Parsear respuesta
-            json_start = analysis_text.find('{')
-            json_end = analysis_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = analysis_text[json_start:json_end]
-                try:
-                    analysis_json = json.loads(json_str)
-                    logger.info("JSON consolidado parseado correctamente")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Error al parsear JSON consolidado: {str(e)}")
-                    analysis_json = {
-                        "summary": "Análisis múltiple completado",
-                        "findings": [],
-                        "recommendations": []
-                    }
-            else:
-                logger.warning("No se encontró JSON en la respuesta consolidada")
-                analysis_json = {
-                    "summary": "Análisis múltiple completado",
-                    "findings": [],
-                    "recommendations": []
-                }
-            
-            if json_start > 0:
-                summary_short = analysis_text[:json_start].strip()
-            else:
-                summary_short = analysis_text[:200].strip() + "..."
+            summary_short, analysis_json = self._parse_response(
+                analysis_text, "Análisis múltiple completado"
+            )
             
             logger.info("Análisis consolidado completado exitosamente")
             
@@ -343,6 +575,8 @@ FORMATO DE SALIDA: Igual que el análisis individual (resumen corto + JSON estru
                 'summary_short': summary_short,
                 'analysis': analysis_json,
                 'full_text': analysis_text,
+                'omitted': omitted_report,
+                'timeline': timeline_rows,
                 'error': None
             }
             
@@ -357,4 +591,143 @@ FORMATO DE SALIDA: Igual que el análisis individual (resumen corto + JSON estru
                 'full_text': '',
                 'error': f"Error al analizar con IA: {str(e)}"
             }
+    
+    def analyze_tasks_concurrently(
+        self,
+        tasks_data: Dict[str, TaskData],
+        max_workers: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Analiza cada tarea por separado en paralelo y después consolida los
+        hallazgos estructurados en una sola llamada (map-reduce)
+        
+        La latencia total es aproximadamente la de la tarea más lenta más la
+        consolidación, y el prompt final contiene solo los hallazgos (no los
+        datos en bruto).
+        
+        Args:
+            tasks_data: Dict con nombre de tarea como clave y datos como valor
+            max_workers: Análisis simultáneos (por defecto, uno por tarea)
+            
+        Returns:
+            Dict con análisis consolidado; 'task_analyses' contiene el
+            análisis individual de cada tarea
+        """
+        logger.info(f"Iniciando análisis en paralelo de {len(tasks_data)} tareas")
+        
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(tasks_data), 1)) as executor:
+            futures = {
+                task_name: executor.submit(
+                    self.analyze_forensic_data,
+                    task_name=task_name,
+                    data=data,
+                    additional_context=(
+                        "Este análisis forma parte de un análisis completo; "
+                        "sus hallazgos se consolidarán con los de otras tareas."
+                    )
+                )
+                for task_name, data in tasks_data.items()
+            }
+            task_analyses = {task_name: future.result() for task_name, future in futures.items()}
+        
+        timeline_text, timeline_rows = self._timeline_section(tasks_data)
+        consolidated = self.consolidate_analyses(
+            task_analyses,
+            correlation_text=self._correlation_section(tasks_data) + timeline_text
+        )
+        consolidated['task_analyses'] = task_analyses
+        consolidated['timeline'] = timeline_rows
+        return consolidated
+    
+    def consolidate_analyses(
+        self,
+        task_analyses: Dict[str, Dict[str, Any]],
+        correlation_text: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Consolida los análisis individuales de varias tareas
+        
+        Args:
+            task_analyses: Dict tarea -> resultado de analyze_forensic_data
+            correlation_text: Correlaciones calculadas localmente entre tareas
+            
+        Returns:
+            Dict con el análisis consolidado
+        """
+        successful = {name: analysis for name, analysis in task_analyses.items() if analysis['success']}
+        if not successful:
+            errors = "; ".join(f"{name}: {analysis['error']}" for name, analysis in task_analyses.items())
+            return {
+                'success': False,
+                'summary_short': '',
+                'analysis': {},
+                'full_text': '',
+                'error': f"Ningún análisis individual terminó correctamente ({errors})"
+            }
+        
+        logger.info(f"Consolidando hallazgos de {len(successful)} tareas")
+        
+        try:
+            parts = []
+            for task_name, analysis in task_analyses.items():
+                if analysis['success']:
+                    parts.append(
+                        f"\n\n=== {task_name} ===\n"
+                        f"Resumen: {analysis['summary_short']}\n"
+                        f"{json.dumps(analysis['analysis'], ensure_ascii=False, indent=1)}\n"
+                    )
+                else:
+                    parts.append(f"\n\n=== {task_name} ===\nNo se pudo analizar: {analysis['error']}\n")
+            parts.append(correlation_text)
+            
+            prompt = f"""ANÁLISIS FORENSE CONSOLIDADO
+
+Cada tarea ya se analizó por separado. Estos son sus hallazgos estructurados:
+{"".join(parts)}
+
+---
 
+INSTRUCCIONES:
+1. Consolida los hallazgos de todas las tareas sin repetirlos
+2. Busca correlaciones entre diferentes fuentes de datos
+3. Eleva el nivel de riesgo de los hallazgos que se confirman entre tareas
+4. Prioriza hallazgos por nivel de riesgo
+5. Proporciona un análisis integral del estado del sistema
+
+FORMATO DE SALIDA: Igual que el análisis individual (resumen corto + JSON estructurado)
+"""
+            logger.debug(f"Prompt de consolidación construido, tamaño: {len(prompt)} caracteres")
+            
+            print("  Consolidando hallazgos con Google AI...")
+            analysis_text = self._generate(prompt)
+            print("  ✓ Análisis consolidado recibido")
+            
+            summary_short, analysis_json = self._parse_response(
+                analysis_text, "Análisis múltiple completado"
+            )
+            
+            logger.info("Consolidación completada exitosamente")
+            
+            return {
+                'success': True,
+                'summary_short': summary_short,
+                'analysis': analysis_json,
+                'full_text': analysis_text,
+                'error': None
+            }
+            
+        except Exception as e:
+            error_msg = f"Error en la consolidación: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            print(f"  ✗ Error en la consolidación: {str(e)}")
+            return {
+                'success': False,
+                'summary_short': '',
+                'analysis': {},
+                'full_text': '',
+                'error': f"Error al analizar con IA: {str(e)}"
+            }
+    
+    def close(self):
+        """Libera los recursos del backend (por ejemplo, la caché de contexto)"""
+        self.backend.close()
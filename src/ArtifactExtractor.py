@@ -0,0 +1,331 @@
+"""
+Módulo para extraer artefactos (IP, rutas, claves de registro, URL, GUID, base64) de los mensajes de eventos
+"""
+import base64
+import binascii
+import hashlib
+import ipaddress
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from ColumnarRecords import ColumnarRecords
+from CsvIngest import detect_day_first
+from Timeline import normalize_timestamp
+
+# Columna con los artefactos de cada evento (ids separados por espacios)
+ARTIFACT_COLUMN = 'Artefactos'
+
+# Tarea de la tabla de artefactos deduplicada
+ARTIFACT_TASK = 'Artefactos'
+
+# Mensajes distintos por bloque que se reparte entre los procesos
+DEFAULT_BLOCK_MESSAGES = 5000
+
+# Por debajo de estos mensajes distintos no compensa arrancar procesos
+POOL_MIN_MESSAGES = 20000
+
+# Caracteres del texto decodificado que se conservan
+MAX_DECODED_CHARS = 1000
+
+# Longitud mínima de una cadena base64 suelta (las más cortas suelen ser
+# identificadores o palabras que por casualidad usan el mismo alfabeto)
+MIN_BASE64_CHARS = 40
+
+# Artefacto extraído: (tipo, valor); en base64 y powershell el valor es el
+# texto decodificado
+Artifact = Tuple[str, str]
+
+_B64 = r'[A-Za-z0-9+/]'
+_TRAILING = '.,;:)]}\'"'
+
+# Una sola expresión con una alternativa por tipo: cada mensaje se recorre
+# una vez. El orden importa: las URL antes que las rutas y las IP, las
+# claves de registro antes que las rutas y el comando codificado antes que
+# el base64 genérico.
+_ARTIFACT_RE = re.compile(
+    r'(?P<url>\b(?i:https?|ftp)://[^\s"\'<>]+)'
+    r'|(?P<encoded>(?<![\w-])[-/](?i:e(?:c|n[a-z]*)?)\s+[\'"]?(?P<payload>' + _B64 + r'{8,}={0,2}))'
+    r'|(?P<registry>\b(?i:HKEY_[A-Z_]+|HK(?:LM|CU|CR|U|CC)):?\\[^\s"\'<>|]+'
+    r'|\\(?i:REGISTRY\\(?:MACHINE|USER))\\[^\s"\'<>|]+)'
+    r'|"(?P<quoted>[A-Za-z]:\\[^"<>|*?\r\n]+)"'
+    r'|(?P<path>\b[A-Za-z]:\\[^\s"\'<>|*?]*|\\\\[\w.$-]+\\[^\s"\'<>|*?]+)'
+    r'|(?P<guid>\{?\b[0-9A-Fa-f]{8}-(?:[0-9A-Fa-f]{4}-){3}[0-9A-Fa-f]{12}\b\}?)'
+    r'|(?P<ipv4>(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?!\.?\d))'
+    r'|(?P<ipv6>(?<![\w:.])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![\w:]))'
+    r'|(?P<base64>(?<![\w+/])' + _B64 + r'{' + str(MIN_BASE64_CHARS) + r',}={0,2}(?![\w+/=]))'
+)
+
+_HEX_RE = re.compile(r'^[0-9A-Fa-f]+$')
+_NULL_GUID = '00000000-0000-0000-0000-000000000000'
+
+
+def _printable(text: str) -> bool:
+    """Si un texto decodificado parece legible (y no binario)"""
+    if not text:
+        return False
+    readable = sum(1 for char in text if char.isprintable() or char in '\r\n\t')
+    return readable / len(text) >= 0.95
+
+
+def _ip(text: Optional[str]) -> Optional[str]:
+    """Forma normalizada de una dirección IP válida (None si no lo es o es 0.0.0.0/::)"""
+    try:
+        address = ipaddress.ip_address(text or '')
+    except ValueError:
+        return None
+    return None if address.is_unspecified else str(address)
+
+
+def _hostname(url: str) -> Optional[str]:
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+def decode_base64(value: str, utf16: bool = False) -> Optional[str]:
+    """
+    Decodifica una cadena base64 si el resultado es texto legible
+
+    Args:
+        value: Cadena base64 (con o sin relleno)
+        utf16: Interpretar primero como UTF-16LE (el formato de
+            -EncodedCommand de PowerShell)
+
+    Returns:
+        Texto decodificado o None si no es base64 válido o no es legible
+    """
+    try:
+        data = base64.b64decode(value + '=' * (-len(value) % 4), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    encodings = ('utf-16-le', 'utf-8') if utf16 else ('utf-8', 'utf-16-le')
+    for encoding in encodings:
+        try:
+            text = data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        if _printable(text):
+            return text
+    return None
+
+
+def _extract(text: str, nested: bool = True) -> List[Artifact]:
+    """Artefactos de un texto en orden de aparición (sin duplicados)"""
+    artifacts: List[Artifact] = []
+    for match in _ARTIFACT_RE.finditer(text):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'encoded':
+            decoded = decode_base64(match.group('payload'), utf16=True)
+            if decoded is None:
+                continue
+            kind, value = 'powershell', decoded
+        elif kind == 'url':
+            value = value.rstrip(_TRAILING)
+        elif kind in ('registry', 'path', 'quoted'):
+            value = value.rstrip(_TRAILING)
+            kind = 'ruta' if kind != 'registry' else 'registro'
+            if len(value) <= 3:
+                continue
+        elif kind == 'guid':
+            value = value.strip('{}').lower()
+            if value == _NULL_GUID:
+                continue
+        elif kind in ('ipv4', 'ipv6'):
+            kind, value = 'ip', _ip(value)
+            if value is None:
+                continue
+        elif kind == 'base64':
+            # Los hashes hexadecimales también usan el alfabeto base64
+            if _HEX_RE.match(value):
+                continue
+            decoded = decode_base64(value)
+            if decoded is None:
+                continue
+            value = decoded
+
+        if kind == 'url':
+            artifacts.append((kind, value))
+            # Una URL con dirección IP también cuenta como IP
+            address = _ip(_hostname(value))
+            if address is not None:
+                artifacts.append(('ip', address))
+        elif kind in ('powershell', 'base64'):
+            value = value[:MAX_DECODED_CHARS]
+            artifacts.append((kind, value))
+            # Los comandos decodificados suelen llevar la URL o la IP real
+            if nested:
+                artifacts.extend(_extract(value, nested=False))
+        else:
+            artifacts.append((kind, value))
+    return list(dict.fromkeys(artifacts))
+
+
+def _extract_block(messages: Sequence[str]) -> List[List[Artifact]]:
+    """Extrae los artefactos de un bloque de mensajes (se ejecuta en los procesos del pool)"""
+    return [_extract(message) if message else [] for message in messages]
+
+
+def extract_artifacts(
+    messages: Sequence[str],
+    workers: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_MESSAGES
+) -> Iterator[List[Artifact]]:
+    """
+    Extrae los artefactos de cada mensaje conservando el orden
+
+    Los bloques se reparten entre procesos con como mucho 2 bloques por
+    proceso en vuelo, de modo que la memoria no depende del número de
+    mensajes.
+
+    Args:
+        messages: Textos de los mensajes
+        workers: Procesos a usar (por defecto, núcleos disponibles si hay
+            suficientes mensajes; 1 para extraer en el proceso actual)
+        block_size: Mensajes por bloque
+
+    Returns:
+        Iterador con la lista de artefactos (tipo, valor) de cada mensaje
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(messages) >= POOL_MIN_MESSAGES else 1
+    blocks = (messages[start:start + block_size] for start in range(0, len(messages), block_size))
+    if workers <= 1:
+        for block in blocks:
+            yield from _extract_block(block)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for block in blocks:
+            in_flight.append(pool.submit(_extract_block, block))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.pop(0).result()
+        for future in in_flight:
+            yield from future.result()
+
+
+def artifact_id(kind: str, value: str) -> str:
+    """Identificador estable de un artefacto (igual en todas las ejecuciones y equipos)"""
+    key = value.lower() if kind in ('ruta', 'registro') else value
+    # 64 bits: sin colisiones prácticas aunque se acumulen millones de artefactos
+    return hashlib.blake2b(f"{kind}\x1f{key}".encode('utf-8', 'replace'), digest_size=8).hexdigest()
+
+
+def add_artifacts(
+    records: ColumnarRecords,
+    column: str = 'Message',
+    workers: Optional[int] = None
+) -> Tuple[ColumnarRecords, int]:
+    """
+    Agrega a cada evento los artefactos de su mensaje
+
+    Cada mensaje distinto se procesa una sola vez. Los artefactos se
+    guardan como tabla auxiliar de la columna Artefactos (id -> 'tipo
+    valor'), de modo que el prompt incluye cada uno una sola vez aunque
+    aparezca en muchos eventos, y cada evento conserva los ids de los
+    suyos. Debe ejecutarse antes de compress_messages().
+
+    Args:
+        records: Registros con columna de mensajes
+        column: Columna con el texto del mensaje
+        workers: Procesos a usar en la extracción
+
+    Returns:
+        Tupla (contenedor con la columna Artefactos, artefactos distintos).
+        Si no hay mensajes o ninguno contiene artefactos, se devuelven los
+        registros originales.
+    """
+    if column not in records.columns:
+        return records, 0
+
+    messages = records.categories(column)
+    table: Dict[str, str] = {}
+    ids_by_message: Dict[str, Optional[str]] = {}
+    for message, artifacts in zip(messages, extract_artifacts(messages, workers)):
+        ids = []
+        for kind, value in artifacts:
+            identifier = artifact_id(kind, value)
+            table.setdefault(identifier, f"{kind} {value}")
+            ids.append(identifier)
+        ids_by_message[message] = ' '.join(dict.fromkeys(ids)) or None
+    if not table:
+        return records, 0
+
+    schema = dict(records.schema)
+    schema[ARTIFACT_COLUMN] = 'cat'
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    for record in records.iter_records():
+        record[ARTIFACT_COLUMN] = ids_by_message.get(record.get(column))
+        result.append(record)
+    result.lookup_tables[ARTIFACT_COLUMN] = table
+    return result, len(table)
+
+
+def artifact_table(records: ColumnarRecords, max_event_ids: int = 20) -> ColumnarRecords:
+    """
+    Tabla deduplicada de artefactos con los eventos en que aparecen
+
+    Args:
+        records: Eventos procesados con add_artifacts()
+        max_event_ids: IDs de evento distintos que se listan por artefacto
+
+    Returns:
+        Contenedor con una fila por artefacto (id, tipo, valor, número de
+        eventos, IDs de evento y primera y última aparición, en formato
+        'AAAA-MM-DD HH:MM:SS'); vacío si los eventos no tienen artefactos
+    """
+    result = ColumnarRecords(
+        schema={
+            'Artefacto': 'cat', 'Tipo': 'cat', 'Valor': 'cat', 'Eventos': 'int',
+            'IdsEvento': 'cat', 'Primero': 'cat', 'Ultimo': 'cat',
+        },
+        task_name=ARTIFACT_TASK
+    )
+    table = records.lookup_tables.get(ARTIFACT_COLUMN)
+    if not table or ARTIFACT_COLUMN not in records.columns:
+        return result
+
+    # Las fechas localizadas no se ordenan como texto: se normalizan antes
+    day_first = True
+    if 'TimeCreated' in records.columns:
+        day_first = detect_day_first([value for value in records.categories('TimeCreated')[:200] if value])
+
+    rows: Dict[str, Dict] = {}
+    for record in records.iter_records():
+        ids = record.get(ARTIFACT_COLUMN)
+        if not ids:
+            continue
+        time_created = record.get('TimeCreated')
+        time_created = normalize_timestamp(time_created, day_first) if time_created else None
+        for identifier in ids.split(' '):
+            row = rows.get(identifier)
+            if row is None:
+                row = rows[identifier] = {
+                    'count': 0, 'event_ids': {}, 'first': time_created, 'last': time_created,
+                }
+            row['count'] += 1
+            if record.get('Id') is not None:
+                row['event_ids'][record['Id']] = None
+            if time_created:
+                row['first'] = min(row['first'] or time_created, time_created)
+                row['last'] = max(row['last'] or time_created, time_created)
+
+    for identifier, row in sorted(rows.items(), key=lambda item: -item[1]['count']):
+        kind, _, value = table.get(identifier, '').partition(' ')
+        event_ids = list(row['event_ids'])
+        result.append({
+            'Artefacto': identifier,
+            'Tipo': kind,
+            'Valor': value,
+            'Eventos': row['count'],
+            'IdsEvento': ', '.join(str(event_id) for event_id in event_ids[:max_event_ids]),
+            'Primero': row['first'] or None,
+            'Ultimo': row['last'] or None,
+        })
+    return result
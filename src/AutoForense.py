@@ -4,11 +4,35 @@ Código principal del proyecto
 """
 import sys
 import os
+import argparse
+import socket
+import sqlite3
 import subprocess
+from datetime import datetime
 from dotenv import load_dotenv
 from PowershellHelper import PowerShellHelper
 from AIAnalyzer import AIAnalyzer
 from PDFGenerator import PDFGenerator
+from SpooledOutput import SpooledOutput
+from ColumnarRecords import ColumnarRecords
+from TemplateMiner import TemplateMiner, compress_messages
+from ArtifactExtractor import ARTIFACT_COLUMN, add_artifacts, artifact_table
+from WatchMode import WatchScheduler, DEFAULT_INTERVALS
+from Checkpoints import CheckpointStore
+from CsvIngest import load_csv
+from EvtxReader import load_evtx
+from EventFilter import EventFilter, parse_levels
+from BinaryHasher import BinaryHasher, add_hashes
+from SignatureCache import SignatureCache
+from IocMatcher import IocMatcher, add_ioc_matches
+from GeoEnrichment import GeoDatabase, add_geo_info, build_database
+from EvidenceBundle import EvidenceBundle, extract_member, verify_bundle
+from SimilarityIndex import SimilarityIndex, threshold_from_env
+from Deadlines import AdaptiveLimits
+from Profiler import Profiler
+from KnowledgeBase import CONSOLIDATED_TASK, KnowledgeBase
+from Prevalence import PrevalenceStore, merge_stores, suppress_common
+from Prevalence import threshold_from_env as prevalence_threshold
 
 # Cargar variables de entorno
 load_dotenv()
@@ -58,6 +82,397 @@ def verificar_dependencias():
     
     return True
 
+def recolectar(checkpoints, task_name, params, collector, reutilizar=True):
+    """
+    Ejecuta un recolector pasando por los puntos de control
+    
+    Si hay una salida reciente del mismo recolector con los mismos
+    parámetros se reutiliza en lugar de volver a ejecutar PowerShell.
+    Con reutilizar=False se ejecuta siempre, pero la salida se guarda para
+    que las opciones de análisis puedan aprovecharla. Si el recolector agotó
+    su tiempo límite se avisa de que el resultado es parcial.
+    """
+    result = collector() if checkpoints is None else checkpoints.collect(
+        task_name, params, collector, reuse=reutilizar
+    )
+    if result.get('from_checkpoint'):
+        print(f"  (Reutilizando datos de {task_name} del punto de control)")
+    if result.get('truncated'):
+        estado = "se usan los registros recibidos" if result['success'] else "sin registros"
+        print(f"  ⚠ {task_name}: tiempo límite agotado, resultado parcial ({estado})")
+    return result
+
+def crear_filtro_eventos(args):
+    """
+    Construye el filtro de Get-SuspiciousEvents a partir de los argumentos
+    
+    Returns:
+        EventFilter, o None si no se indicó ningún criterio
+        
+    Raises:
+        ValueError: Si algún criterio no es válido
+    """
+    criterios = (args.ids_evento, args.canales, args.niveles, args.proveedores,
+                 args.eventos_desde, args.eventos_hasta)
+    if not any(criterios) and not args.todos_los_eventos:
+        return None
+    
+    ids = set()
+    for valor in args.ids_evento or []:
+        # Se admiten rangos: 4624-4634
+        inicio, _, fin = valor.partition('-')
+        ids.update(range(int(inicio), int(fin or inicio) + 1))
+    
+    opciones = {}
+    if args.canales:
+        opciones['channels'] = tuple(args.canales)
+    return EventFilter(
+        event_ids=tuple(sorted(ids)),
+        levels=parse_levels(args.niveles or []),
+        providers=tuple(args.proveedores or []),
+        start_time=datetime.fromisoformat(args.eventos_desde) if args.eventos_desde else None,
+        end_time=datetime.fromisoformat(args.eventos_hasta) if args.eventos_hasta else None,
+        suspicious_only=not args.todos_los_eventos,
+        **opciones
+    )
+
+def parametros_eventos(max_events, filtro_eventos):
+    """Parámetros de Get-SuspiciousEvents que identifican su punto de control"""
+    params = {'max_events': max_events}
+    if filtro_eventos is not None:
+        params['filtro'] = filtro_eventos.to_xpath()
+        params['canales'] = list(filtro_eventos.channels)
+        params['todos'] = not filtro_eventos.suspicious_only
+    return params
+
+def convertir_a_registros(task_name, output, template_miner=None, checkpoints=None, checkpoint=None,
+                          hasher=None, ioc_matcher=None, geo=None, prevalence_store=None):
+    """
+    Convierte la salida de una tarea en registros columnares
+    
+    Si la salida no contiene objetos reconocibles se devuelve sin cambios
+    para que la IA reciba el texto original. De los mensajes de eventos se
+    extraen los artefactos (IP, rutas, claves de registro, URL, GUID y
+    base64 o PowerShell codificados). Si se proporciona un minero de
+    plantillas, los mensajes de eventos se reducen a plantilla + parámetros.
+    Si se proporciona un calculador de hashes, se agregan los hashes de los
+    binarios de la columna Path. Si se proporciona un motor de IOC, se
+    agrega la columna IOC con las coincidencias de cada registro. Si se
+    proporciona una base de ASN, se agregan el sistema autónomo y el país de
+    cada dirección remota. Si se proporciona un almacén de prevalencia, se
+    agrega la rareza de cada registro en la flota y se omiten los
+    habituales. Si la salida tiene punto de control (hash `checkpoint`), los registros
+    ya procesados se reutilizan en lugar de volver a parsear.
+    """
+    columnar = None
+    if checkpoints is not None and checkpoint:
+        columnar = checkpoints.load_records(checkpoint)
+    if columnar is None:
+        columnar = ColumnarRecords.from_output(output, task_name=task_name)
+        if checkpoints is not None and checkpoint and len(columnar):
+            checkpoints.save_records(checkpoint, columnar)
+    if not len(columnar):
+        return output
+    
+    if 'Message' in columnar.columns:
+        columnar = extraer_artefactos(columnar)
+    if template_miner is not None and 'Message' in columnar.columns:
+        columnar = compress_messages(columnar, template_miner)
+        template_miner.save()
+    if hasher is not None and 'Path' in columnar.columns:
+        columnar = add_hashes(columnar, hasher)
+        hasher.save()
+    if geo is not None:
+        columnar = add_geo_info(columnar, geo)
+    if ioc_matcher is not None:
+        columnar = marcar_iocs(columnar, ioc_matcher)
+    if prevalence_store is not None:
+        columnar = filtrar_habituales(columnar, prevalence_store, socket.gethostname())
+    return columnar
+
+def extraer_artefactos(registros):
+    """Extrae los artefactos de los mensajes de eventos y avisa de cuántos hay"""
+    registros, artefactos = add_artifacts(registros)
+    if artefactos:
+        print(f"  ✓ {artefactos} artefactos extraídos de los mensajes de {registros.task_name}")
+    return registros
+
+def marcar_iocs(registros, ioc_matcher):
+    """Coteja los registros con las listas de IOC y avisa de las coincidencias"""
+    ioc_matcher.refresh()
+    registros, coincidencias = add_ioc_matches(registros, ioc_matcher)
+    if coincidencias:
+        print(f"  ⚠ {coincidencias} registros de {registros.task_name} coinciden con indicadores de compromiso")
+    return registros
+
+def filtrar_habituales(registros, prevalence_store, equipo=None):
+    """
+    Agrega la rareza de cada registro, omite los habituales en la flota y
+    registra los del equipo en el almacén de prevalencia
+    
+    Args:
+        registros: Registros de una tarea (ya cotejados con los IOC)
+        prevalence_store: Almacén de prevalencia
+        equipo: Equipo de origen; si no se conoce, los registros no se
+            añaden al almacén
+        
+    Returns:
+        Registros que se analizan con IA
+    """
+    filtrados, omitidos = suppress_common(registros, prevalence_store, equipo)
+    if equipo is not None:
+        prevalence_store.observe(registros, equipo)
+        try:
+            prevalence_store.save()
+        except OSError as e:
+            print(f"⚠ No se pudo guardar el almacén de prevalencia: {e}")
+    if omitidos:
+        print(f"  ✓ {omitidos} registros de {registros.task_name} habituales en la flota omitidos")
+    return filtrados
+
+def empaquetar_evidencias(ai_analyzer, salidas=None, tasks_data=None, reportes=(), archivos=()):
+    """
+    Genera el paquete de evidencias de un análisis (cadena de custodia)
+    
+    Args:
+        ai_analyzer: Instancia de AIAnalyzer (aporta prompts y respuestas)
+        salidas: Dict tarea -> salida cruda del recolector (str o SpooledOutput)
+        tasks_data: Dict tarea -> registros procesados
+        reportes: Rutas de los reportes generados
+        archivos: Otros archivos de origen (p. ej. CSV importados)
+        
+    Returns:
+        Ruta del paquete generado
+    """
+    print("\n[Empaquetando evidencias...]")
+    with EvidenceBundle() as bundle:
+        for task_name, output in (salidas or {}).items():
+            bundle.add_output(f"salida/{task_name}.txt", output, task_name)
+        for ruta in archivos:
+            bundle.add_file(f"salida/{os.path.basename(ruta)}", ruta, 'importado')
+        for task_name, registros in (tasks_data or {}).items():
+            if isinstance(registros, ColumnarRecords):
+                bundle.add_records(f"registros/{task_name}.json", registros)
+                if ARTIFACT_COLUMN in registros.columns:
+                    bundle.add_records(f"registros/{task_name}_artefactos.json", artifact_table(registros))
+        exchanges = ai_analyzer.pop_exchanges() if ai_analyzer is not None else []
+        if exchanges:
+            bundle.add_text("ia/sistema.txt", ai_analyzer.static_prefix, 'prompt')
+        for numero, (prompt, respuesta) in enumerate(exchanges, 1):
+            bundle.add_text(f"ia/prompt_{numero:03d}.txt", prompt, 'prompt')
+            bundle.add_text(f"ia/respuesta_{numero:03d}.txt", respuesta, ai_analyzer.backend.name)
+        for ruta in reportes:
+            if ruta and os.path.exists(ruta):
+                bundle.add_file(f"reportes/{os.path.basename(ruta)}", ruta, 'reporte')
+    print(f"✓ Paquete de evidencias generado: {bundle.path} ({len(bundle)} archivos)")
+    if not bundle.key:
+        print("⚠ Manifiesto sin firma: configura AUTOFORENSE_CLAVE_EVIDENCIAS para firmarlo")
+    return bundle.path
+
+def analizar_consolidado(ai_analyzer, tasks_data, una_peticion=False):
+    """
+    Analiza varias tareas y consolida los hallazgos
+    
+    Args:
+        ai_analyzer: Instancia de AIAnalyzer
+        tasks_data: Dict tarea -> datos
+        una_peticion: Enviar todas las tareas en una sola petición,
+            repartiendo el presupuesto de tokens entre ellas; si es False,
+            cada tarea se analiza en paralelo y después se consolida
+        
+    Returns:
+        Análisis consolidado; 'task_analyses' contiene los análisis de cada
+        tarea (vacío con una sola petición)
+    """
+    if una_peticion:
+        analysis = ai_analyzer.analyze_multiple_tasks(tasks_data)
+        analysis.setdefault('task_analyses', {})
+        return analysis
+    return ai_analyzer.analyze_tasks_concurrently(tasks_data)
+
+def analizar_importados(rutas, ai_analyzer, pdf_generator, template_miner=None, ioc_matcher=None,
+                        geo=None, evidencias=False, knowledge_base=None, prevalence_store=None,
+                        equipo_origen=None, una_peticion=False):
+    """
+    Analiza reportes CSV exportados previamente o archivos .evtx del Visor
+    de eventos (sin ejecutar PowerShell)
+    
+    Args:
+        rutas: Rutas de los CSV (uno por tarea) o de los .evtx
+        ai_analyzer: Instancia de AIAnalyzer o None
+        pdf_generator: Instancia de PDFGenerator o None
+        template_miner: Minero de plantillas para los mensajes de eventos
+        ioc_matcher: Motor de indicadores de compromiso
+        geo: Base de ASN para enriquecer las direcciones remotas
+        evidencias: Generar el paquete de evidencias al terminar
+        knowledge_base: Base de conocimiento donde guardar los hallazgos
+        prevalence_store: Almacén de prevalencia en la flota
+        equipo_origen: Equipo del que proceden los datos (si no se indica,
+            no se añaden al almacén de prevalencia)
+        una_peticion: Analizar todas las tareas en una sola petición
+        
+    Returns:
+        Código de salida del programa
+    """
+    tasks_data = {}
+    for ruta in rutas:
+        print(f"\n[Importando {ruta}...]")
+        try:
+            if ruta.lower().endswith('.evtx'):
+                registros = load_evtx(ruta)
+            else:
+                registros = load_csv(ruta)
+        except (OSError, ValueError) as e:
+            print(f"✗ No se pudo leer {ruta}: {e}")
+            return 1
+        
+        task_name = registros.task_name
+        if task_name is None:
+            print(f"✗ No se reconocen las columnas de {ruta}")
+            return 1
+        print(f"✓ {len(registros)} registros de {task_name}")
+        
+        if 'Message' in registros.columns:
+            registros = extraer_artefactos(registros)
+        if template_miner is not None and 'Message' in registros.columns:
+            registros = compress_messages(registros, template_miner)
+            template_miner.save()
+        if geo is not None:
+            registros = add_geo_info(registros, geo)
+        if ioc_matcher is not None:
+            registros = marcar_iocs(registros, ioc_matcher)
+        if prevalence_store is not None:
+            registros = filtrar_habituales(registros, prevalence_store, equipo_origen)
+        if task_name in tasks_data:
+            tasks_data[task_name].merge(registros)
+        else:
+            tasks_data[task_name] = registros
+    
+    if ai_analyzer is None or pdf_generator is None:
+        print("\n✗ Las funciones de IA no están disponibles; resumen de los datos importados:")
+        for registros in tasks_data.values():
+            print(registros.summary_text())
+            if ARTIFACT_COLUMN in registros.columns:
+                print(artifact_table(registros).to_prompt_text())
+        if evidencias:
+            empaquetar_evidencias(None, tasks_data=tasks_data, archivos=rutas)
+        return 0
+    
+    print("\n[Analizando datos importados con IA...]")
+    pdf_path = None
+    if len(tasks_data) == 1:
+        task_name, registros = next(iter(tasks_data.items()))
+        analysis = ai_analyzer.analyze_forensic_data(
+            task_name=task_name,
+            data=registros,
+            additional_context="Datos importados de un reporte CSV exportado previamente."
+        )
+        if analysis['success']:
+            print(analysis['full_text'])
+            pdf_path = pdf_generator.generate_forensic_report(
+                analysis_data=analysis,
+                task_name=task_name
+            )
+    else:
+        analysis = analizar_consolidado(ai_analyzer, tasks_data, una_peticion)
+        if analysis['success']:
+            print(analysis['full_text'])
+            pdf_path = pdf_generator.generate_multiple_tasks_report(
+                tasks_analyses=analysis['task_analyses'],
+                consolidated_analysis=analysis
+            )
+    
+    if knowledge_base is not None:
+        # Sin equipo de origen, los hallazgos se guardan como importados
+        guardar_conocimiento(
+            knowledge_base, analysis, task_name if len(tasks_data) == 1 else CONSOLIDATED_TASK,
+            pdf_path, equipo=equipo_origen or 'importado'
+        )
+    if evidencias:
+        empaquetar_evidencias(ai_analyzer, tasks_data=tasks_data, reportes=[pdf_path], archivos=rutas)
+    if not analysis['success']:
+        print(f"\n✗ Error en el análisis de IA: {analysis['error']}")
+        return 1
+    print(f"✓ Reporte PDF generado: {pdf_path}")
+    return 0
+
+def guardar_conocimiento(knowledge_base, analysis, task_name, pdf_path=None, equipo=None):
+    """
+    Guarda los hallazgos de un análisis en la base de conocimiento; un
+    error de la base no interrumpe el análisis
+    """
+    if knowledge_base is None:
+        return
+    try:
+        knowledge_base.add_analysis(analysis, task_name, host=equipo, report_path=pdf_path)
+    except sqlite3.Error as e:
+        print(f"⚠ No se pudo guardar el análisis en la base de conocimiento: {e}")
+
+def buscar_conocimiento(args):
+    """
+    Busca en la base de conocimiento y muestra los resultados y sus facetas
+    
+    Returns:
+        Código de salida del programa
+    """
+    try:
+        knowledge_base = KnowledgeBase()
+    except sqlite3.Error as e:
+        print(f"✗ No se pudo abrir la base de conocimiento: {e}")
+        return 1
+    
+    filtros = {
+        'risk_level': args.riesgo,
+        'confidence': args.confianza,
+        'task': args.tarea,
+        'host': args.equipo,
+        'since': args.desde,
+        'until': args.hasta,
+    }
+    try:
+        resultados = knowledge_base.search(args.buscar, limit=args.limite, **filtros)
+        facetas = knowledge_base.facets(args.buscar, **filtros)
+    except sqlite3.Error as e:
+        print(f"✗ Consulta no válida: {e}")
+        return 1
+    finally:
+        knowledge_base.close()
+    
+    total = sum(facetas['task'].values())
+    print(f"\n{total} resultados en la base de conocimiento"
+          + (f" (se muestran {len(resultados)})" if total > len(resultados) else ""))
+    for resultado in resultados:
+        nivel = "/".join(filter(None, [resultado['risk_level'], resultado['confidence']]))
+        print(f"\n[{resultado['created']}] {resultado['host']} · {resultado['task']} · "
+              f"{resultado['kind']}" + (f" ({nivel})" if nivel else ""))
+        print(f"  {resultado['title']}")
+        if resultado['snippet']:
+            print(f"  {resultado['snippet']}")
+        if resultado['report_path']:
+            print(f"  Reporte: {resultado['report_path']}")
+    
+    nombres = {'risk_level': 'Riesgo', 'confidence': 'Confianza', 'task': 'Tarea', 'host': 'Equipo'}
+    if total:
+        print()
+    for faceta, conteos in facetas.items():
+        if conteos:
+            print(f"{nombres[faceta]}: " + ", ".join(f"{valor} ({n})" for valor, n in list(conteos.items())[:10]))
+    return 0
+
+def cerrar_ia(ai_analyzer):
+    """
+    Muestra las llamadas y latencias de cada modelo y las peticiones
+    agrupadas, y libera la caché de contexto del proveedor
+    """
+    if ai_analyzer is None:
+        return
+    stats = [ai_analyzer.backend.stats_report(), ai_analyzer.single_flight.stats_report()]
+    stats = [text for text in stats if text]
+    if stats:
+        print("\n[Uso de modelos de IA]")
+        print("\n".join(stats))
+    ai_analyzer.close()
+
 def mostrar_bienvenida():
     art = r"""
       .~~~~`\~~\\
@@ -82,11 +497,216 @@ def print_menu():
     print("3. Get-UnsignedProcesses - Procesos sin firma digital")
     print("4. Análisis Forense con IA - Ejecuta una tarea y analiza con IA")
     print("5. Análisis Forense Completo - Ejecuta todas las tareas y genera reporte PDF")
-    print("6. Salir")
+    print("6. Perfilado de CPU y memoria - Activa o desactiva el perfilado de cada etapa")
+    print("7. Salir")
     print()
 
-def main():
+def parse_args(argv=None):
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(
+        description="AutoForense - Automatización Inteligente de Análisis Forense"
+    )
+    parser.add_argument(
+        '--vigilancia', action='store_true',
+        help="Modo vigilancia continua: ejecuta los recolectores periódicamente"
+    )
+    parser.add_argument(
+        '--intervalo-eventos', type=float,
+        default=DEFAULT_INTERVALS['Get-SuspiciousEvents'],
+        help="Segundos entre recolecciones de eventos (0 para desactivar)"
+    )
+    parser.add_argument(
+        '--intervalo-conexiones', type=float,
+        default=DEFAULT_INTERVALS['Get-InternetProcesses'],
+        help="Segundos entre recolecciones de conexiones de red (0 para desactivar)"
+    )
+    parser.add_argument(
+        '--intervalo-firmas', type=float,
+        default=DEFAULT_INTERVALS['Get-UnsignedProcesses'],
+        help="Segundos entre recolecciones de procesos sin firma (0 para desactivar)"
+    )
+    parser.add_argument(
+        '--jitter', type=float, default=0.1,
+        help="Variación aleatoria relativa de los intervalos (0.1 = ±10%%)"
+    )
+    parser.add_argument(
+        '--umbral', type=float, default=0.5,
+        help="Puntuación mínima de sospecha para analizar con IA en modo vigilancia"
+    )
+    parser.add_argument(
+        '--frescura', type=float, default=900,
+        help="Segundos durante los que se reutilizan datos y respuestas de los "
+             "puntos de control (0 para desactivarlos)"
+    )
+    parser.add_argument(
+        '--importar', nargs='+', metavar='ARCHIVO',
+        help="Analiza reportes CSV exportados previamente o archivos .evtx sin ejecutar "
+             "PowerShell (por ejemplo, evidencias recogidas en otro equipo)"
+    )
+    parser.add_argument(
+        '--construir-geo', metavar='FUENTE',
+        help="Genera la base de ASN y países a partir de un volcado ip2asn (TSV o CSV) y termina"
+    )
+    parser.add_argument(
+        '--evidencias', action='store_true',
+        help="Guarda las salidas, registros, prompts, respuestas y reportes de cada "
+             "análisis en un paquete ZIP con manifiesto firmado (reportes/evidencias)"
+    )
+    parser.add_argument(
+        '--verificar-evidencias', nargs='+', metavar=('ZIP', 'MIEMBRO'),
+        help="Verifica la firma y los hashes de un paquete de evidencias (o solo de los "
+             "miembros indicados) y termina"
+    )
+    parser.add_argument(
+        '--extraer-evidencia', nargs=2, metavar=('ZIP', 'MIEMBRO'),
+        help="Extrae un miembro de un paquete de evidencias al directorio actual, "
+             "comprobando su hash, y termina"
+    )
+    parser.add_argument(
+        '--buscar', nargs='?', const='', metavar='TEXTO',
+        help="Busca en los hallazgos, recomendaciones y resúmenes de los análisis "
+             "anteriores (sin texto, lista los más recientes) y termina"
+    )
+    parser.add_argument(
+        '--riesgo', nargs='+', metavar='NIVEL',
+        help="Con --buscar: niveles de riesgo (low, medium, high, critical)"
+    )
+    parser.add_argument(
+        '--confianza', nargs='+', metavar='NIVEL',
+        help="Con --buscar: niveles de confianza (low, medium, high)"
+    )
+    parser.add_argument(
+        '--tarea', nargs='+', metavar='TAREA',
+        help="Con --buscar: tareas analizadas (por ejemplo, Get-SuspiciousEvents)"
+    )
+    parser.add_argument(
+        '--equipo', nargs='+', metavar='EQUIPO',
+        help="Con --buscar: equipos analizados"
+    )
+    parser.add_argument(
+        '--desde', metavar='FECHA',
+        help="Con --buscar: análisis desde esta fecha (AAAA-MM-DD)"
+    )
+    parser.add_argument(
+        '--hasta', metavar='FECHA',
+        help="Con --buscar: análisis anteriores a esta fecha (AAAA-MM-DD)"
+    )
+    parser.add_argument(
+        '--limite', type=int, default=20,
+        help="Con --buscar: máximo de resultados mostrados"
+    )
+    parser.add_argument(
+        '--tiempo-recolector', type=float, default=900,
+        help="Segundos máximos de cada llamada a PowerShell; al vencer se termina el "
+             "proceso y se usan los registros recibidos (0 para no limitar)"
+    )
+    parser.add_argument(
+        '--tiempo-total', type=float, default=0,
+        help="Segundos máximos del conjunto de recolectores del análisis completo "
+             "(opción 5; 0 para no limitar)"
+    )
+    parser.add_argument(
+        '--adaptativo', action='store_true',
+        help="Reduce el número de eventos leídos en las siguientes ejecuciones cuando "
+             "Get-SuspiciousEvents supera su presupuesto de tiempo"
+    )
+    parser.add_argument(
+        '--una-peticion', action='store_true',
+        help="Análisis completo en una sola petición a la IA, repartiendo el presupuesto "
+             "de tokens entre las tareas según volumen y sospecha (sin análisis por tarea)"
+    )
+    parser.add_argument(
+        '--perfil', action='store_true',
+        help="Perfila CPU (cProfile) y memoria (tracemalloc) de cada etapa y guarda los "
+             "resultados junto al reporte PDF"
+    )
+    parser.add_argument(
+        '--ids-evento', nargs='+', metavar='ID',
+        help="Get-SuspiciousEvents solo lee estos IDs de evento (admite rangos: 4624-4634)"
+    )
+    parser.add_argument(
+        '--canales', nargs='+', metavar='CANAL',
+        help="Logs que lee Get-SuspiciousEvents (por defecto System, Application y Security)"
+    )
+    parser.add_argument(
+        '--niveles', nargs='+', metavar='NIVEL',
+        help="Get-SuspiciousEvents solo lee estos niveles (critical, error, warning, "
+             "information, verbose o su número)"
+    )
+    parser.add_argument(
+        '--proveedores', nargs='+', metavar='PROVEEDOR',
+        help="Get-SuspiciousEvents solo lee eventos de estos proveedores"
+    )
+    parser.add_argument(
+        '--eventos-desde', metavar='FECHA',
+        help="Get-SuspiciousEvents solo lee eventos desde esta fecha (AAAA-MM-DD[THH:MM])"
+    )
+    parser.add_argument(
+        '--eventos-hasta', metavar='FECHA',
+        help="Get-SuspiciousEvents solo lee eventos hasta esta fecha (AAAA-MM-DD[THH:MM])"
+    )
+    parser.add_argument(
+        '--todos-los-eventos', action='store_true',
+        help="Devuelve todos los eventos del filtro, no solo los que cumplen las reglas de sospecha"
+    )
+    parser.add_argument(
+        '--fusionar-prevalencia', nargs='+', metavar='ARCHIVO',
+        help="Fusiona los almacenes de prevalencia de otros equipos en el local y termina"
+    )
+    parser.add_argument(
+        '--equipo-origen', metavar='EQUIPO',
+        help="Equipo del que proceden los datos de --importar (se añaden a la prevalencia)"
+    )
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Función principal del programa"""
+    args = parse_args(argv)
+    
+    if args.construir_geo:
+        total = build_database(args.construir_geo)
+        print(f"✓ Base de ASN generada con {total} rangos")
+        return 0
+    
+    if args.verificar_evidencias:
+        ruta, *miembros = args.verificar_evidencias
+        verificacion = verify_bundle(ruta, miembros)
+        print(verificacion['output'])
+        if not verificacion['success']:
+            print(f"✗ Verificación fallida: {verificacion['error']}")
+            return 1
+        print("✓ Paquete de evidencias íntegro")
+        return 0
+    
+    if args.buscar is not None:
+        return buscar_conocimiento(args)
+    
+    if args.fusionar_prevalencia:
+        try:
+            equipos = merge_stores(args.fusionar_prevalencia, PrevalenceStore())
+        except (OSError, ValueError) as e:
+            print(f"✗ No se pudo fusionar la prevalencia: {e}")
+            return 1
+        print(f"✓ Almacén de prevalencia fusionado ({equipos} equipos)")
+        return 0
+    
+    if args.extraer_evidencia:
+        ruta, miembro = args.extraer_evidencia
+        try:
+            destino = extract_member(ruta, miembro, os.getcwd())
+        except (OSError, KeyError, ValueError) as e:
+            print(f"✗ No se pudo extraer {miembro}: {e}")
+            return 1
+        print(f"✓ Evidencia extraída y verificada: {destino}")
+        return 0
+    
+    # Criterios de Get-SuspiciousEvents que se evalúan en el origen
+    try:
+        filtro_eventos = crear_filtro_eventos(args)
+    except ValueError as e:
+        print(f"✗ Filtro de eventos no válido: {e}")
+        return 1
+    
     # Mostrar arte ASCII de bienvenida
     mostrar_bienvenida()
     
@@ -95,20 +715,60 @@ def main():
     if not verificar_dependencias():
         return 0
     
-    # Inicializar el helper de PowerShell
+    # Tabla de plantillas de mensajes de eventos (persistida entre ejecuciones)
+    template_miner = TemplateMiner()
+    
+    # Verificaciones de firma (guardan también el SHA-256 de cada binario)
+    signature_cache = SignatureCache()
+    
+    # Hashes de los binarios señalados (reutiliza el SHA-256 de las firmas)
+    hasher = BinaryHasher(signature_cache=signature_cache)
+    
+    # Listas de indicadores de compromiso (se recargan al cambiar)
+    ioc_matcher = IocMatcher()
+    if len(ioc_matcher):
+        print(f"✓ {len(ioc_matcher)} indicadores de compromiso cargados")
+    
+    # Base de ASN y países de las direcciones remotas (opcional)
     try:
-        ps_helper = PowerShellHelper()
-        print("✓ Módulo PowerShell cargado correctamente")
-    except FileNotFoundError as e:
-        print(f"✗ Error: {e}")
-        return 1
+        geo = GeoDatabase()
+        print(f"✓ Base de ASN cargada ({geo.ranges} rangos)")
+    except (OSError, ValueError):
+        geo = None
+    
+    # Puntos de control para reanudar ejecuciones interrumpidas
+    checkpoints = CheckpointStore(freshness_seconds=args.frescura) if args.frescura > 0 else None
+    
+    # Reutilización de análisis de recolecciones casi idénticas (SimHash)
+    umbral_similitud = threshold_from_env()
+    similarity_index = SimilarityIndex(threshold=umbral_similitud) if umbral_similitud > 0 else None
+    
+    # Base de conocimiento con los hallazgos de todos los análisis
+    try:
+        knowledge_base = KnowledgeBase()
+    except sqlite3.Error as e:
+        print(f"⚠ Base de conocimiento no disponible: {e}")
+        knowledge_base = None
+    
+    # Prevalencia de cada registro en la flota (AUTOFORENSE_PREVALENCIA=0 la desactiva)
+    umbral_prevalencia = prevalence_threshold()
+    prevalence_store = None
+    if umbral_prevalencia > 0:
+        try:
+            prevalence_store = PrevalenceStore(threshold=umbral_prevalencia)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Almacén de prevalencia no disponible: {e}")
     
     # Inicializar IA y generador de PDF (opcional)
     ai_analyzer = None
     pdf_generator = None
     
     try:
-        ai_analyzer = AIAnalyzer()
+        ai_analyzer = AIAnalyzer(
+            checkpoint_store=checkpoints,
+            record_exchanges=args.evidencias,
+            similarity_index=similarity_index
+        )
         pdf_generator = PDFGenerator(output_dir="reportes")
         print("✓ Módulo de IA cargado correctamente")
     except ValueError as e:
@@ -119,20 +779,78 @@ def main():
         print(f"⚠ Advertencia: No se pudo cargar módulo de IA - {e}")
         print("⚠ Ejecuta: pip install -r requirements.txt")
     
+    # Perfilado de CPU y memoria por etapas (sin coste mientras está desactivado)
+    profiler = Profiler(enabled=args.perfil, output_dir="reportes").instrument(ai_analyzer, pdf_generator)
+    
+    # Modo sin conexión: no necesita PowerShell
+    if args.importar:
+        try:
+            return analizar_importados(
+                args.importar, ai_analyzer, pdf_generator, template_miner, ioc_matcher, geo,
+                args.evidencias, knowledge_base, prevalence_store, args.equipo_origen,
+                args.una_peticion
+            )
+        finally:
+            profiler.flush()
+            cerrar_ia(ai_analyzer)
+    
+    # Inicializar el helper de PowerShell
+    try:
+        ps_helper = PowerShellHelper(
+            signature_cache=signature_cache,
+            timeout=args.tiempo_recolector or None,
+            adaptive_limits=AdaptiveLimits() if args.adaptativo else None
+        )
+        print("✓ Módulo PowerShell cargado correctamente")
+        profiler.instrument(ps_helper)
+    except FileNotFoundError as e:
+        print(f"✗ Error: {e}")
+        return 1
+    
+    if args.vigilancia:
+        scheduler = WatchScheduler(
+            ps_helper,
+            ai_analyzer=ai_analyzer,
+            pdf_generator=pdf_generator,
+            intervals={
+                'Get-SuspiciousEvents': args.intervalo_eventos,
+                'Get-InternetProcesses': args.intervalo_conexiones,
+                'Get-UnsignedProcesses': args.intervalo_firmas,
+            },
+            jitter=args.jitter,
+            score_threshold=args.umbral,
+            template_miner=template_miner,
+            hasher=hasher,
+            ioc_matcher=ioc_matcher,
+            geo=geo,
+            knowledge_base=knowledge_base,
+            event_filter=filtro_eventos,
+            prevalence_store=prevalence_store
+        )
+        scheduler.run()
+        profiler.flush()
+        cerrar_ia(ai_analyzer)
+        return 0
     
     while True:
+        opcion = None
         try:
             print_menu()
-            opcion = input("Seleccione una opción (1-6): ").strip()
+            opcion = input("Seleccione una opción (1-7): ").strip()
             
             if opcion == "1":
                 print("\n[Ejecutando Get-SuspiciousEvents...]")
                 max_events = input("Max eventos (Enter para 2000): ").strip()
                 max_events = int(max_events) if max_events else 2000
                 
-                result = ps_helper.get_suspicious_events(
-                    max_events=max_events,
-                    dont_save_report=False
+                result = recolectar(
+                    checkpoints, "Get-SuspiciousEvents", parametros_eventos(max_events, filtro_eventos),
+                    lambda: ps_helper.get_suspicious_events(
+                        max_events=max_events,
+                        dont_save_report=False,
+                        event_filter=filtro_eventos
+                    ),
+                    reutilizar=False
                 )
                 
                 if result['success']:
@@ -144,7 +862,11 @@ def main():
             
             elif opcion == "2":
                 print("\n[Ejecutando Get-InternetProcesses...]")
-                result = ps_helper.get_internet_processes(dont_save_report=False)
+                result = recolectar(
+                    checkpoints, "Get-InternetProcesses", {},
+                    lambda: ps_helper.get_internet_processes(dont_save_report=False),
+                    reutilizar=False
+                )
                 
                 if result['success']:
                     print("\n✓ Ejecución exitosa")
@@ -155,7 +877,11 @@ def main():
             
             elif opcion == "3":
                 print("\n[Ejecutando Get-UnsignedProcesses...]")
-                result = ps_helper.get_unsigned_processes()
+                result = recolectar(
+                    checkpoints, "Get-UnsignedProcesses", {},
+                    ps_helper.get_unsigned_processes,
+                    reutilizar=False
+                )
                 
                 if result['success']:
                     print("\n✓ Ejecución exitosa")
@@ -185,16 +911,27 @@ def main():
                     task_name = "Get-SuspiciousEvents"
                     max_events = input("Max eventos (Enter para 2000): ").strip()
                     max_events = int(max_events) if max_events else 2000
-                    result = ps_helper.get_suspicious_events(
-                        max_events=max_events,
-                        dont_save_report=True
+                    result = recolectar(
+                        checkpoints, task_name, parametros_eventos(max_events, filtro_eventos),
+                        lambda: ps_helper.get_suspicious_events(
+                            max_events=max_events,
+                            dont_save_report=True,
+                            spool=True,
+                            event_filter=filtro_eventos
+                        )
                     )
                 elif sub_opcion == "2":
                     task_name = "Get-InternetProcesses"
-                    result = ps_helper.get_internet_processes(dont_save_report=True)
+                    result = recolectar(
+                        checkpoints, task_name, {},
+                        lambda: ps_helper.get_internet_processes(dont_save_report=True, spool=True)
+                    )
                 elif sub_opcion == "3":
                     task_name = "Get-UnsignedProcesses"
-                    result = ps_helper.get_unsigned_processes()
+                    result = recolectar(
+                        checkpoints, task_name, {},
+                        lambda: ps_helper.get_unsigned_processes(spool=True)
+                    )
                 else:
                     print("\n✗ Opción no válida")
                     continue
@@ -203,10 +940,16 @@ def main():
                     print(f"\n✓ Datos recopilados de {task_name}")
                     print("\n[Analizando con IA...]")
                     
+                    registros = convertir_a_registros(
+                        task_name, result['output'], template_miner,
+                        checkpoints, result.get('checkpoint'), hasher, ioc_matcher, geo,
+                        prevalence_store
+                    )
                     analysis = ai_analyzer.analyze_forensic_data(
                         task_name=task_name,
-                        data=result['output']
+                        data=registros
                     )
+                    pdf_path = None
                     
                     if analysis['success']:
                         print("\n" + "="*60)
@@ -224,8 +967,19 @@ def main():
                         print(f"✓ Reporte PDF generado: {pdf_path}")
                     else:
                         print(f"\n✗ Error en el análisis de IA: {analysis['error']}")
+                    guardar_conocimiento(knowledge_base, analysis, task_name, pdf_path)
+                    
+                    if args.evidencias:
+                        empaquetar_evidencias(
+                            ai_analyzer, {task_name: result['output']},
+                            {task_name: registros}, [pdf_path]
+                        )
                 else:
                     print(f"\n✗ Error al ejecutar {task_name}")
+                
+                # Liberar el archivo temporal de la salida volcada a disco
+                if result and isinstance(result['output'], SpooledOutput):
+                    result['output'].close()
             
             elif opcion == "5":
                 if ai_analyzer is None or pdf_generator is None:
@@ -241,35 +995,61 @@ def main():
                     print("Operación cancelada")
                     continue
                 
-                # Ejecutar todas las tareas
-                print("\n[1/3] Extrayendo eventos sospechosos...")
-                events_result = ps_helper.get_suspicious_events(
-                    max_events=2000,
-                    dont_save_report=True
-                )
-                
-                print("[2/3] Analizando procesos con conexiones de red...")
-                internet_result = ps_helper.get_internet_processes(dont_save_report=True)
-                
-                print("[3/3] Detectando procesos sin firma digital...")
-                unsigned_result = ps_helper.get_unsigned_processes()
+                # Ejecutar todas las tareas con un límite de tiempo común
+                with ps_helper.deadline(args.tiempo_total):
+                    print("\n[1/3] Extrayendo eventos sospechosos...")
+                    events_result = recolectar(
+                        checkpoints, 'Get-SuspiciousEvents', parametros_eventos(2000, filtro_eventos),
+                        lambda: ps_helper.get_suspicious_events(
+                            max_events=2000,
+                            dont_save_report=True,
+                            spool=True,
+                            event_filter=filtro_eventos
+                        )
+                    )
+                    
+                    print("[2/3] Analizando procesos con conexiones de red...")
+                    internet_result = recolectar(
+                        checkpoints, 'Get-InternetProcesses', {},
+                        lambda: ps_helper.get_internet_processes(dont_save_report=True, spool=True)
+                    )
+                    
+                    print("[3/3] Detectando procesos sin firma digital...")
+                    unsigned_result = recolectar(
+                        checkpoints, 'Get-UnsignedProcesses', {},
+                        lambda: ps_helper.get_unsigned_processes(spool=True)
+                    )
                 
                 # Recopilar datos
                 tasks_data = {}
                 if events_result['success']:
-                    tasks_data['Get-SuspiciousEvents'] = events_result['output']
+                    tasks_data['Get-SuspiciousEvents'] = convertir_a_registros(
+                        'Get-SuspiciousEvents', events_result['output'], template_miner,
+                        checkpoints, events_result.get('checkpoint'), ioc_matcher=ioc_matcher,
+                        prevalence_store=prevalence_store
+                    )
                 if internet_result['success']:
-                    tasks_data['Get-InternetProcesses'] = internet_result['output']
+                    tasks_data['Get-InternetProcesses'] = convertir_a_registros(
+                        'Get-InternetProcesses', internet_result['output'],
+                        checkpoints=checkpoints, checkpoint=internet_result.get('checkpoint'),
+                        ioc_matcher=ioc_matcher, geo=geo, prevalence_store=prevalence_store
+                    )
                 if unsigned_result['success']:
-                    tasks_data['Get-UnsignedProcesses'] = unsigned_result['output']
+                    tasks_data['Get-UnsignedProcesses'] = convertir_a_registros(
+                        'Get-UnsignedProcesses', unsigned_result['output'],
+                        checkpoints=checkpoints, checkpoint=unsigned_result.get('checkpoint'),
+                        hasher=hasher, ioc_matcher=ioc_matcher, prevalence_store=prevalence_store
+                    )
                 
                 if not tasks_data:
                     print("\n✗ No se pudieron recopilar datos")
                     continue
                 
-                # Analizar con IA
+                # Analizar cada tarea en paralelo y consolidar los hallazgos
+                # (o todas en una sola petición con --una-peticion)
                 print("\n[Analizando todos los datos con IA...]")
-                consolidated_analysis = ai_analyzer.analyze_multiple_tasks(tasks_data)
+                consolidated_analysis = analizar_consolidado(ai_analyzer, tasks_data, args.una_peticion)
+                pdf_path = None
                 
                 if consolidated_analysis['success']:
                     print("\n" + "="*60)
@@ -281,31 +1061,63 @@ def main():
                     # Generar reporte PDF consolidado
                     print("\n[Generando reporte PDF consolidado...]")
                     
-                    # Usar solo el análisis consolidado (evita múltiples requests a la API)
+                    # Análisis consolidado y detalle de cada tarea
                     pdf_path = pdf_generator.generate_multiple_tasks_report(
-                        tasks_analyses={},  # Sin análisis individuales
+                        tasks_analyses=consolidated_analysis['task_analyses'],
                         consolidated_analysis=consolidated_analysis
                     )
                     print(f"✓ Reporte PDF consolidado generado: {pdf_path}")
                 else:
                     print(f"\n✗ Error en el análisis consolidado: {consolidated_analysis['error']}")
+                guardar_conocimiento(knowledge_base, consolidated_analysis, CONSOLIDATED_TASK, pdf_path)
+                
+                task_results = {
+                    'Get-SuspiciousEvents': events_result,
+                    'Get-InternetProcesses': internet_result,
+                    'Get-UnsignedProcesses': unsigned_result,
+                }
+                if args.evidencias:
+                    empaquetar_evidencias(
+                        ai_analyzer,
+                        {name: task_result['output'] for name, task_result in task_results.items()
+                         if task_result['success']},
+                        tasks_data, [pdf_path]
+                    )
+                
+                # Liberar los archivos temporales de la salida volcada a disco
+                for task_result in task_results.values():
+                    if isinstance(task_result['output'], SpooledOutput):
+                        task_result['output'].close()
             
             elif opcion == "6":
+                if profiler.toggle():
+                    print("\n✓ Perfilado activado: los perfiles se guardan junto a cada reporte PDF")
+                else:
+                    print("\n✓ Perfilado desactivado")
+            
+            elif opcion == "7":
                 print("\nSaliendo...")
                 break
             
             else:
-                print("\n✗ Opción no válida. Por favor seleccione 1-6.")
+                print("\n✗ Opción no válida. Por favor seleccione 1-7.")
                 print_menu()
             print("\n" + "-" * 60 + "\n")
         
         except KeyboardInterrupt:
-            print("\n\nSaliendo...")
-            break
+            if opcion is None:
+                print("\n\nSaliendo...")
+                break
+            # Ctrl+C durante una opción la cancela (los procesos de
+            # PowerShell ya se han terminado) y vuelve al menú
+            print("\n\n✗ Operación cancelada")
+            print("\n" + "-" * 60 + "\n")
         except Exception as e:
             print(f"\n✗ Error: {e}")
             print("\n" + "-" * 60 + "\n")
     
+    profiler.flush()
+    cerrar_ia(ai_analyzer)
     return 0
 
 
@@ -0,0 +1,257 @@
+"""
+Módulo para calcular los hashes de los binarios señalados por los recolectores
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Sequence
+
+from ColumnarRecords import ColumnarRecords
+from SignatureCache import SignatureCache
+
+logger = logging.getLogger(__name__)
+
+# Algoritmos por defecto (AUTOFORENSE_HASHES="sha256,sha1,md5" para añadir otros)
+DEFAULT_ALGORITHMS = ('sha256',)
+
+# Ruta por defecto de la caché de hashes
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'cache_hashes.json')
+
+# Bytes que se pasan a los algoritmos en cada actualización
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def algorithms_from_env() -> Sequence[str]:
+    """Algoritmos configurados en AUTOFORENSE_HASHES (sha256 siempre incluido)"""
+    names = [
+        name.strip().lower()
+        for name in os.getenv('AUTOFORENSE_HASHES', '').split(',')
+        if name.strip()
+    ]
+    algorithms = list(DEFAULT_ALGORITHMS)
+    for name in names:
+        if name not in hashlib.algorithms_available:
+            logger.warning(f"Algoritmo de hash no disponible: {name}")
+        elif name not in algorithms:
+            algorithms.append(name)
+    return tuple(algorithms)
+
+
+def hash_file(path: str, algorithms: Sequence[str] = DEFAULT_ALGORITHMS) -> Dict[str, str]:
+    """
+    Calcula los hashes de un archivo sin cargarlo en memoria
+
+    El archivo se mapea en memoria y se recorre por bloques; hashlib libera
+    el GIL en cada actualización, así que varios hilos calculan en paralelo.
+
+    Args:
+        path: Ruta del archivo
+        algorithms: Nombres de algoritmos de hashlib
+
+    Returns:
+        Dict algoritmo -> hash hexadecimal
+
+    Raises:
+        OSError: Si el archivo no se puede leer
+    """
+    hashers = [hashlib.new(name) for name in algorithms]
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # mmap no admite archivos vacíos
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    for offset in range(0, size, CHUNK_SIZE):
+                        with view[offset:offset + CHUNK_SIZE] as chunk:
+                            for hasher in hashers:
+                                hasher.update(chunk)
+    return {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+
+
+class BinaryHasher:
+    """
+    Calcula en paralelo los hashes de los binarios y los guarda en caché
+
+    Las rutas repetidas (varios procesos con el mismo ejecutable) se
+    calculan una sola vez. El SHA-256 se toma de la caché de firmas
+    (SignatureCache), que ya lo calcula al verificar Authenticode; solo se
+    leen los binarios que no están en ella y los algoritmos adicionales.
+    Lo calculado aquí se guarda en una caché propia indexada por
+    dispositivo e inodo (o índice de archivo en NTFS) que se invalida si
+    cambian el tamaño o la fecha de modificación, de modo que un binario
+    renombrado o accesible por varias rutas tampoco se vuelve a leer.
+    """
+
+    def __init__(
+        self,
+        algorithms: Optional[Sequence[str]] = None,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        max_workers: Optional[int] = None,
+        signature_cache: Optional[SignatureCache] = None
+    ):
+        """
+        Inicializa el calculador y carga la caché guardada
+
+        Args:
+            algorithms: Algoritmos a calcular (por defecto, los de AUTOFORENSE_HASHES)
+            cache_path: Archivo JSON de la caché (None para no persistir)
+            max_workers: Hilos de cálculo (por defecto, núcleos disponibles)
+            signature_cache: Caché de firmas de la que reutilizar el SHA-256
+        """
+        self.algorithms = tuple(algorithms) if algorithms else algorithms_from_env()
+        self.cache_path = cache_path
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.signature_cache = signature_cache
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_path and os.path.exists(cache_path):
+            self.load()
+
+    @staticmethod
+    def _key(path: str, stat: os.stat_result) -> str:
+        # Sin número de inodo (algunos sistemas de archivos) se usa la ruta
+        if stat.st_ino:
+            return f"{stat.st_dev}:{stat.st_ino}"
+        return os.path.normcase(os.path.abspath(path))
+
+    def _hash_one(self, path: str) -> Optional[Dict[str, str]]:
+        """Hashes de un archivo desde la caché o calculándolos"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        known = {}
+        if self.signature_cache is not None and 'sha256' in self.algorithms:
+            sha256 = self.signature_cache.digest(path, stat.st_size, stat.st_mtime_ns)
+            if sha256:
+                known['sha256'] = sha256
+
+        key = self._key(path, stat)
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry['size'] == stat.st_size
+                and entry['mtime_ns'] == stat.st_mtime_ns
+            ):
+                for name in self.algorithms:
+                    if name not in known and name in entry['digests']:
+                        known[name] = entry['digests'][name]
+            missing = [name for name in self.algorithms if name not in known]
+            if not missing:
+                self.hits += 1
+                return {name: known[name] for name in self.algorithms}
+            self.misses += 1
+
+        try:
+            digests = hash_file(path, missing)
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudo calcular el hash de {path}: {str(e)}")
+            return None
+
+        with self._lock:
+            # Solo se guarda lo que no tiene ya la caché de firmas
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                digests = dict(entry['digests'], **digests)
+            self._entries[key] = {
+                'path': path,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'digests': digests,
+            }
+        known.update(digests)
+        return {name: known[name] for name in self.algorithms}
+
+    def hash_paths(self, paths: Iterable[str]) -> Dict[str, Optional[Dict[str, str]]]:
+        """
+        Calcula los hashes de varias rutas
+
+        Args:
+            paths: Rutas de los binarios (pueden repetirse)
+
+        Returns:
+            Dict ruta -> {algoritmo: hash}, o None si el archivo no se puede leer
+        """
+        paths = [path for path in paths if path]
+        unique = {}
+        for path in paths:
+            unique.setdefault(os.path.normcase(path), path)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            digests = dict(zip(unique.values(), pool.map(self._hash_one, unique.values())))
+
+        return {
+            path: digests[unique[os.path.normcase(path)]]
+            for path in paths
+        }
+
+    def load(self):
+        """Carga la caché desde JSON (si está dañada se empieza vacía)"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            self._entries = {}
+
+    def save(self):
+        """Guarda la caché en JSON descartando los archivos que ya no existen"""
+        if not self.cache_path:
+            return
+        with self._lock:
+            self._entries = {
+                key: entry for key, entry in self._entries.items()
+                if os.path.exists(entry['path'])
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+
+    def stats_report(self) -> str:
+        """Texto con los binarios leídos y los tomados de la caché"""
+        with self._lock:
+            return f"  Hashes: {self.misses} binarios leídos, {self.hits} desde caché"
+
+
+def add_hashes(
+    records: ColumnarRecords,
+    hasher: BinaryHasher,
+    column: str = 'Path'
+) -> ColumnarRecords:
+    """
+    Agrega una columna por algoritmo (SHA256, MD5, ...) con el hash del binario
+
+    Args:
+        records: Registros con columna de rutas
+        hasher: Calculador de hashes
+        column: Columna con la ruta del binario
+
+    Returns:
+        Nuevo contenedor con las columnas de hashes (vacías si el archivo no
+        se pudo leer)
+    """
+    if column not in records.columns:
+        return records
+
+    digests = hasher.hash_paths(records.column(column))
+    schema = dict(records.schema)
+    for name in hasher.algorithms:
+        schema[name.upper()] = 'cat'
+
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    for record in records.iter_records():
+        found = digests.get(record.get(column)) or {}
+        for name in hasher.algorithms:
+            record[name.upper()] = found.get(name)
+        result.append(record)
+    logger.info(hasher.stats_report().strip())
+    return result
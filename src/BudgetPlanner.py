@@ -0,0 +1,351 @@
+"""
+Módulo para repartir el presupuesto de tokens del prompt entre varias tareas
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ColumnarRecords import ColumnarRecords, lookup_keys
+from SpooledOutput import SpooledOutput
+
+# Caracteres por token usados para estimar (aproximación para Gemini)
+CHARS_PER_TOKEN = 4
+
+# IDs de eventos sospechosos (mismos que usa Get-SuspiciousEvents)
+SUSPICIOUS_EVENT_IDS = {4625, 4672, 4648, 6008, 41, 7034, 7031, 1000, 1002}
+
+# Palabras clave en los mensajes (mismas que usa Get-SuspiciousEvents)
+SUSPICIOUS_KEYWORDS = ('fail', 'denied', 'unauthorized', 'error', 'critical', 'malware', 'attack')
+
+# Puertos remotos habituales en un equipo de escritorio
+COMMON_REMOTE_PORTS = {80, 443}
+
+# Fragmentos de ruta desde donde no suelen ejecutarse binarios legítimos
+UNUSUAL_PATH_MARKERS = ('\\appdata\\', '\\temp\\', '\\downloads\\', '\\users\\public\\')
+
+# Columnas que definen los estratos del muestreo de cada tarea
+STRATA_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'Get-SuspiciousEvents': ('Id', 'LevelDisplayName'),
+    'Get-InternetProcesses': ('ProcessName', 'RemotePort'),
+    'Get-UnsignedProcesses': ('SignatureStatus', 'ProcessName'),
+}
+
+TaskInput = Union[str, SpooledOutput, ColumnarRecords]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estima los tokens de un texto"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def score_record(task_name: str, record: Dict[str, Any]) -> float:
+    """
+    Calcula una puntuación previa de sospecha (0 a 1) para un registro
+
+    Args:
+        task_name: Tarea que generó el registro
+        record: Registro a evaluar
+
+    Returns:
+        Puntuación entre 0 (normal) y 1 (muy sospechoso)
+    """
+    score = 0.0
+
+    if task_name == 'Get-SuspiciousEvents':
+        if _as_int(record.get('Id')) in SUSPICIOUS_EVENT_IDS:
+            score += 0.5
+        level = str(record.get('LevelDisplayName') or '').lower()
+        if level in ('critical', 'crítico'):
+            score += 0.4
+        elif level == 'error':
+            score += 0.2
+        elif level in ('warning', 'advertencia'):
+            score += 0.1
+        text = str(record.get('Message') or record.get('Params') or '').lower()
+        # 'error' aparece en casi todos los mensajes y no aporta señal
+        if any(keyword in text for keyword in SUSPICIOUS_KEYWORDS if keyword != 'error'):
+            score += 0.3
+
+    elif task_name == 'Get-InternetProcesses':
+        if _as_int(record.get('RemotePort')) not in COMMON_REMOTE_PORTS:
+            score += 0.4
+        if not str(record.get('ProcessName') or '').strip():
+            score += 0.3
+
+    elif task_name == 'Get-UnsignedProcesses':
+        status = str(record.get('SignatureStatus') or '')
+        if status == 'NotSigned':
+            score += 0.5
+        elif status:
+            score += 0.3
+        path = str(record.get('Path') or '').lower()
+        if any(marker in path for marker in UNUSUAL_PATH_MARKERS):
+            score += 0.4
+
+    # Coincidencia con una lista de indicadores de compromiso (IocMatcher)
+    if record.get('IOC'):
+        score = 1.0
+
+    return min(score, 1.0)
+
+
+@dataclass
+class TaskAllocation:
+    """Resultado del reparto para una tarea"""
+    task_name: str
+    total_items: int
+    demand_tokens: int
+    budget_tokens: int = 0
+    selected: List[int] = field(default_factory=list)
+    used_tokens: int = 0
+    mean_score: float = 0.0
+    # Unidad de total_items: registros, caracteres (texto) o bytes (SpooledOutput)
+    unit: str = 'registros'
+    kept_items: int = 0
+    # Estrato -> registros omitidos
+    omitted_strata: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def omitted_items(self) -> int:
+        return self.total_items - self.kept_items
+
+
+@dataclass
+class BudgetPlan:
+    """Plan de presupuesto para un prompt consolidado"""
+    budget_tokens: int
+    allocations: Dict[str, TaskAllocation]
+    sections: Dict[str, str]
+
+    @property
+    def used_tokens(self) -> int:
+        return sum(allocation.used_tokens for allocation in self.allocations.values())
+
+    def omitted_report(self, max_strata: int = 8) -> str:
+        """Texto con lo que quedó fuera del prompt"""
+        lines = []
+        for allocation in self.allocations.values():
+            if allocation.omitted_items <= 0:
+                continue
+            lines.append(
+                f"- {allocation.task_name}: {allocation.omitted_items} de "
+                f"{allocation.total_items} {allocation.unit} omitidos"
+            )
+            strata = sorted(allocation.omitted_strata.items(), key=lambda item: -item[1])
+            for stratum, count in strata[:max_strata]:
+                lines.append(f"    {stratum}: {count} omitidos")
+            if len(strata) > max_strata:
+                lines.append(f"    ... y {len(strata) - max_strata} grupos más")
+        return '\n'.join(lines)
+
+
+class TokenBudgetPlanner:
+    """
+    Reparte un presupuesto de tokens entre las tareas de un análisis múltiple
+
+    El reparto es proporcional al volumen de datos y a la puntuación de
+    sospecha de cada tarea; lo que una tarea no necesita se redistribuye.
+    Dentro de cada tarea se hace un muestreo estratificado: primero un
+    registro (el más sospechoso) de cada estrato y después el resto por
+    puntuación, de modo que los tipos de registro poco frecuentes sobreviven.
+    """
+
+    def __init__(self, budget_tokens: int = 4000, min_task_tokens: int = 200):
+        """
+        Inicializa el planificador
+
+        Args:
+            budget_tokens: Tokens disponibles para los datos de todas las tareas
+            min_task_tokens: Tokens mínimos garantizados a cada tarea
+        """
+        self.budget_tokens = budget_tokens
+        self.min_task_tokens = min_task_tokens
+
+    def plan(self, tasks_data: Dict[str, TaskInput]) -> BudgetPlan:
+        """
+        Calcula el reparto y genera el texto de cada tarea
+
+        Args:
+            tasks_data: Dict tarea -> datos (texto, SpooledOutput o ColumnarRecords)
+
+        Returns:
+            BudgetPlan con asignaciones y secciones de texto
+        """
+        prepared = {}
+        allocations = {}
+        for task_name, data in tasks_data.items():
+            if isinstance(data, ColumnarRecords):
+                lines, scores, strata = self._score_rows(task_name, data)
+                allocation = TaskAllocation(
+                    task_name=task_name,
+                    total_items=len(data),
+                    demand_tokens=self._header_tokens(data) + sum(
+                        estimate_tokens(line) + 1 for line in lines
+                    ) + sum(
+                        sum(costs.values()) for costs in self._lookup_costs(data).values()
+                    ),
+                    mean_score=sum(scores) / len(scores) if scores else 0.0,
+                )
+                prepared[task_name] = (lines, scores, strata)
+            else:
+                allocation = TaskAllocation(
+                    task_name=task_name,
+                    total_items=len(data),
+                    demand_tokens=math.ceil(len(data) / CHARS_PER_TOKEN),
+                    # len() y los cortes de SpooledOutput van en bytes
+                    unit='bytes' if isinstance(data, SpooledOutput) else 'caracteres',
+                )
+            allocations[task_name] = allocation
+
+        self._distribute(allocations)
+
+        sections = {}
+        for task_name, data in tasks_data.items():
+            allocation = allocations[task_name]
+            if task_name in prepared:
+                sections[task_name] = self._render_records(data, allocation, *prepared[task_name])
+            else:
+                sections[task_name] = self._render_text(data, allocation)
+
+        return BudgetPlan(self.budget_tokens, allocations, sections)
+
+    @staticmethod
+    def _header_tokens(data: ColumnarRecords) -> int:
+        """Tokens del resumen y de la cabecera de columnas"""
+        return estimate_tokens(data.summary_text()) + estimate_tokens(' | '.join(data.columns))
+
+    @staticmethod
+    def _lookup_costs(data: ColumnarRecords) -> Dict[str, Dict[Any, int]]:
+        """Tokens de cada entrada de las tablas auxiliares (se pagan al primer uso)"""
+        return {
+            name: {key: estimate_tokens(f"  {key}: {text}") + 1 for key, text in table.items()}
+            for name, table in data.lookup_tables.items()
+            if name in data.columns
+        }
+
+    @staticmethod
+    def _score_rows(
+        task_name: str,
+        data: ColumnarRecords
+    ) -> Tuple[List[str], List[float], Dict[str, List[int]]]:
+        """Genera la línea, la puntuación y el estrato de cada registro"""
+        lines = []
+        scores = []
+        strata: Dict[str, List[int]] = {}
+        strata_columns = [name for name in STRATA_COLUMNS.get(task_name, ()) if name in data.columns]
+        for position, record in enumerate(data.iter_records()):
+            lines.append(' | '.join('' if value is None else str(value) for value in record.values()))
+            scores.append(score_record(task_name, record))
+            key = ' / '.join(f"{name}={record.get(name)}" for name in strata_columns) or 'registros'
+            strata.setdefault(key, []).append(position)
+        return lines, scores, strata
+
+    def _distribute(self, allocations: Dict[str, TaskAllocation]):
+        """Reparte el presupuesto por peso y redistribuye el sobrante"""
+        pending = {
+            name: allocation for name, allocation in allocations.items()
+            if allocation.demand_tokens > 0
+        }
+        remaining = self.budget_tokens
+
+        while pending and remaining > 0:
+            weights = {
+                name: math.log1p(allocation.total_items) * (1.0 + 2.0 * allocation.mean_score) or 1.0
+                for name, allocation in pending.items()
+            }
+            total_weight = sum(weights.values())
+            # El mínimo por tarea nunca supera el presupuesto: si no alcanza
+            # para todas, se reparte a partes iguales
+            floor = min(self.min_task_tokens, remaining // len(pending))
+            spare = remaining - floor * len(pending)
+            shares = {
+                name: floor + int(spare * weights[name] / total_weight)
+                for name in pending
+            }
+            satisfied = []
+            for name, allocation in pending.items():
+                missing = allocation.demand_tokens - allocation.budget_tokens
+                if missing <= shares[name]:
+                    allocation.budget_tokens += missing
+                    satisfied.append(name)
+
+            if not satisfied:
+                # Ninguna tarea cabe entera: repartir lo que queda y terminar
+                for name, allocation in pending.items():
+                    allocation.budget_tokens += shares[name]
+                break
+
+            for name in satisfied:
+                pending.pop(name)
+            remaining = self.budget_tokens - sum(a.budget_tokens for a in allocations.values())
+
+    def _render_records(
+        self,
+        data: ColumnarRecords,
+        allocation: TaskAllocation,
+        lines: List[str],
+        scores: List[float],
+        strata: Dict[str, List[int]]
+    ) -> str:
+        """Selecciona registros por estratos y genera el texto de la tarea"""
+        for positions in strata.values():
+            positions.sort(key=lambda pos: -scores[pos])
+
+        # Un representante por estrato (los más sospechosos primero) y luego el resto
+        representatives = sorted((positions[0] for positions in strata.values()), key=lambda pos: -scores[pos])
+        chosen = set(representatives)
+        rest = sorted((pos for pos in range(len(data)) if pos not in chosen), key=lambda pos: -scores[pos])
+
+        header = self._header_tokens(data)
+        lookup_costs = self._lookup_costs(data)
+        paid = {name: set() for name in lookup_costs}
+        used = header
+        selected = []
+        for position in representatives + rest:
+            cost = estimate_tokens(lines[position]) + 1
+            new_keys = []
+            if lookup_costs:
+                record = data.record(position)
+                for name, costs in lookup_costs.items():
+                    for key in lookup_keys(costs, record.get(name)):
+                        if key not in paid[name]:
+                            new_keys.append((name, key))
+                            cost += costs[key]
+            if used + cost > allocation.budget_tokens:
+                continue
+            for name, key in new_keys:
+                paid[name].add(key)
+            selected.append(position)
+            used += cost
+
+        selected.sort()
+        allocation.selected = selected
+        allocation.kept_items = len(selected)
+
+        kept = set(selected)
+        for stratum, positions in strata.items():
+            omitted = sum(1 for pos in positions if pos not in kept)
+            if omitted:
+                allocation.omitted_strata[stratum] = omitted
+
+        # Sin límite propio: el texto contiene exactamente las filas elegidas
+        text = data.to_prompt_text(None, positions=selected)
+        allocation.used_tokens = estimate_tokens(text)
+        return text
+
+    @staticmethod
+    def _render_text(data: Union[str, SpooledOutput], allocation: TaskAllocation) -> str:
+        """Recorta el texto sin estructura al presupuesto de la tarea"""
+        limit = allocation.budget_tokens * CHARS_PER_TOKEN
+        text = data[:limit]
+        allocation.used_tokens = estimate_tokens(text)
+        # En la unidad de total_items (bytes en SpooledOutput)
+        allocation.kept_items = min(len(data), limit)
+        return text
@@ -0,0 +1,319 @@
+"""
+Módulo de puntos de control (checkpoints) para reanudar ejecuciones del pipeline
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from ColumnarRecords import ColumnarRecords
+from SpooledOutput import SpooledOutput
+
+# Etapas del pipeline en orden
+STAGES = ('raw', 'records', 'prompt', 'response')
+
+# Directorio por defecto de los puntos de control
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), 'reportes', 'checkpoints')
+
+
+def make_key(*parts: Any) -> str:
+    """Calcula una clave estable (SHA-256) a partir de valores serializables"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """
+    Almacén de puntos de control direccionado por contenido
+
+    Cada etapa (salida cruda del recolector, registros procesados, prompt y
+    respuesta del modelo) se guarda como un objeto identificado por el
+    SHA-256 de su contenido. Un manifiesto por ejecución indica qué objeto
+    produjo cada etapa, cuándo y a partir de qué entrada (hash de la etapa
+    anterior). Una etapa solo se reutiliza si está dentro de la ventana de
+    frescura y su entrada coincide, así que una nueva ejecución continúa
+    desde la primera etapa que no terminó.
+    """
+
+    def __init__(
+        self,
+        base_dir: str = DEFAULT_CHECKPOINT_DIR,
+        freshness_seconds: float = 900,
+        retention_seconds: Optional[float] = None
+    ):
+        """
+        Inicializa el almacén y elimina los puntos de control caducados
+
+        Args:
+            base_dir: Directorio donde guardar objetos y manifiestos
+            freshness_seconds: Antigüedad máxima de una etapa reutilizable
+            retention_seconds: Antigüedad a partir de la cual se borran los
+                puntos de control (por defecto, 4 veces la ventana de frescura)
+        """
+        self.base_dir = base_dir
+        self.freshness_seconds = freshness_seconds
+        self.retention_seconds = (
+            retention_seconds if retention_seconds is not None else max(freshness_seconds * 4, 3600)
+        )
+        self.objects_dir = os.path.join(base_dir, 'objetos')
+        self.runs_dir = os.path.join(base_dir, 'ejecuciones')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self.prune()
+
+    # -- Objetos direccionados por contenido ------------------------------
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _store_file(self, digest: str, tmp_path: str) -> str:
+        final_path = self._object_path(digest)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        return digest
+
+    def put_bytes(self, data: bytes) -> str:
+        """Guarda un objeto y devuelve su hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        final_path = self._object_path(digest)
+        if not os.path.exists(final_path):
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            tmp_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, final_path)
+        return digest
+
+    def put_spooled(self, output: SpooledOutput) -> str:
+        """Copia una salida volcada a disco al almacén sin decodificarla"""
+        tmp_path = os.path.join(self.objects_dir, f"entrada.{os.getpid()}.{time.time_ns()}.tmp")
+        hasher = hashlib.sha256()
+        chunk_size = 1024 * 1024
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(output), chunk_size):
+                view = output.view(start, start + chunk_size)
+                try:
+                    hasher.update(view)
+                    f.write(view)
+                finally:
+                    view.release()
+        return self._store_file(hasher.hexdigest(), tmp_path)
+
+    def get_bytes(self, digest: str) -> Optional[bytes]:
+        """Lee un objeto completo"""
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def open_spooled(self, digest: str) -> Optional[SpooledOutput]:
+        """Abre un objeto como SpooledOutput mapeado en memoria"""
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            return None
+        return SpooledOutput(open(path, 'rb'))
+
+    # -- Manifiestos por ejecución ----------------------------------------
+
+    def _manifest_path(self, run_key: str) -> str:
+        return os.path.join(self.runs_dir, f"{run_key}.json")
+
+    def _read_manifest(self, run_key: str) -> Dict[str, Any]:
+        path = self._manifest_path(run_key)
+        if not os.path.exists(path):
+            return {'stages': {}}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'stages': {}}
+
+    def _write_manifest(self, run_key: str, manifest: Dict[str, Any]):
+        path = self._manifest_path(run_key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def record_stage(
+        self,
+        run_key: str,
+        stage: str,
+        digest: str,
+        input_digest: Optional[str] = None,
+        info: Optional[Dict[str, Any]] = None
+    ):
+        """Registra en el manifiesto que una etapa terminó"""
+        manifest = self._read_manifest(run_key)
+        if info:
+            manifest.setdefault('info', {}).update(info)
+        manifest['stages'][stage] = {
+            'hash': digest,
+            'input': input_digest,
+            'created': time.time(),
+        }
+        # Las etapas posteriores dependían de la versión anterior de esta
+        for later in STAGES[STAGES.index(stage) + 1:] if stage in STAGES else ():
+            entry = manifest['stages'].get(later)
+            if entry is not None and entry.get('input') not in (None, digest):
+                manifest['stages'].pop(later)
+        self._write_manifest(run_key, manifest)
+
+    def fresh_stage(
+        self,
+        run_key: str,
+        stage: str,
+        input_digest: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Devuelve el hash de una etapa reutilizable
+
+        Args:
+            run_key: Clave de la ejecución
+            stage: Nombre de la etapa
+            input_digest: Hash de la entrada esperada (None para no comprobarlo)
+
+        Returns:
+            Hash del objeto de la etapa o None si no existe, caducó o su
+            entrada no coincide
+        """
+        entry = self._read_manifest(run_key)['stages'].get(stage)
+        if entry is None:
+            return None
+        if time.time() - entry.get('created', 0) > self.freshness_seconds:
+            return None
+        if input_digest is not None and entry.get('input') != input_digest:
+            return None
+        if not os.path.exists(self._object_path(entry['hash'])):
+            return None
+        return entry['hash']
+
+    def first_pending_stage(self, run_key: str) -> Optional[str]:
+        """Primera etapa que no tiene un punto de control vigente"""
+        for stage in STAGES:
+            if self.fresh_stage(run_key, stage) is None:
+                return stage
+        return None
+
+    # -- Operaciones de alto nivel ----------------------------------------
+
+    def collect(
+        self,
+        task_name: str,
+        params: Dict[str, Any],
+        collector: Callable[[], Dict[str, Any]],
+        reuse: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Ejecuta un recolector reutilizando su salida si hay una reciente
+
+        Args:
+            task_name: Nombre de la tarea
+            params: Parámetros que determinan el resultado (por ejemplo max_events)
+            collector: Función que ejecuta el recolector y devuelve el dict
+                de PowerShellHelper
+            reuse: Si False, siempre se ejecuta el recolector (pero se guarda)
+
+        Returns:
+            Dict de PowerShellHelper; 'checkpoint' indica el hash de la salida
+            y 'from_checkpoint' si se reutilizó
+        """
+        run_key = make_key('collect', task_name, params)
+        if reuse:
+            digest = self.fresh_stage(run_key, 'raw')
+            if digest is not None:
+                output = self.open_spooled(digest)
+                if output is not None:
+                    return {
+                        'success': True,
+                        'output': output,
+                        'error': '',
+                        'returncode': 0,
+                        'checkpoint': digest,
+                        'from_checkpoint': True,
+                    }
+
+        result = collector()
+        result['from_checkpoint'] = False
+        if result['success']:
+            output = result['output']
+            if isinstance(output, SpooledOutput):
+                digest = self.put_spooled(output)
+            else:
+                digest = self.put_bytes(output.encode('utf-8'))
+            # Una salida parcial (tiempo agotado) no se reutiliza como completa
+            if not result.get('truncated'):
+                self.record_stage(run_key, 'raw', digest, info={'task': task_name, 'params': params})
+            result['checkpoint'] = digest
+        return result
+
+    def load_records(self, raw_digest: str) -> Optional[ColumnarRecords]:
+        """Recupera los registros procesados a partir de una salida cruda"""
+        run_key = make_key('records', raw_digest)
+        digest = self.fresh_stage(run_key, 'records', input_digest=raw_digest)
+        if digest is None:
+            return None
+        data = self.get_bytes(digest)
+        return ColumnarRecords.from_dict(json.loads(data.decode('utf-8'))) if data else None
+
+    def save_records(self, raw_digest: str, records: ColumnarRecords):
+        """Guarda los registros procesados de una salida cruda"""
+        data = json.dumps(records.to_dict(), ensure_ascii=False).encode('utf-8')
+        digest = self.put_bytes(data)
+        self.record_stage(make_key('records', raw_digest), 'records', digest, input_digest=raw_digest)
+
+    def load_response(self, prompt: str) -> Optional[str]:
+        """Recupera la respuesta del modelo para un prompt idéntico"""
+        prompt_digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        digest = self.fresh_stage(prompt_digest, 'response', input_digest=prompt_digest)
+        if digest is None:
+            return None
+        data = self.get_bytes(digest)
+        return data.decode('utf-8') if data is not None else None
+
+    def save_prompt(self, prompt: str) -> str:
+        """Guarda el prompt antes de enviarlo; devuelve su hash"""
+        prompt_digest = self.put_bytes(prompt.encode('utf-8'))
+        self.record_stage(prompt_digest, 'prompt', prompt_digest)
+        return prompt_digest
+
+    def save_response(self, prompt: str, response_text: str):
+        """Guarda la respuesta del modelo asociada a un prompt"""
+        prompt_digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        digest = self.put_bytes(response_text.encode('utf-8'))
+        self.record_stage(prompt_digest, 'response', digest, input_digest=prompt_digest)
+
+    # -- Mantenimiento ----------------------------------------------------
+
+    def prune(self):
+        """Borra manifiestos caducados y los objetos que ya nadie referencia"""
+        now = time.time()
+        referenced = set()
+        for name in os.listdir(self.runs_dir):
+            path = os.path.join(self.runs_dir, name)
+            if not name.endswith('.json'):
+                continue
+            manifest = self._read_manifest(name[:-5])
+            stages = manifest.get('stages', {})
+            newest = max((entry.get('created', 0) for entry in stages.values()), default=0)
+            if now - newest > self.retention_seconds:
+                os.remove(path)
+                continue
+            referenced.update(entry['hash'] for entry in stages.values())
+
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name not in referenced:
+                    os.remove(os.path.join(prefix_dir, name))
+            if not os.listdir(prefix_dir):
+                shutil.rmtree(prefix_dir, ignore_errors=True)
@@ -0,0 +1,608 @@
+"""
+Módulo con una representación columnar y compacta de los registros forenses
+"""
+import sys
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from RecordParser import iter_records
+from SpooledOutput import SpooledOutput
+
+# Tipos de columna: 'cat' (categórica internada) o 'int' (numérica en array)
+TASK_SCHEMAS: Dict[str, Dict[str, str]] = {
+    'Get-SuspiciousEvents': {
+        'LogName': 'cat',
+        'TimeCreated': 'cat',
+        'Id': 'int',
+        'LevelDisplayName': 'cat',
+        'Message': 'cat',
+    },
+    'Get-InternetProcesses': {
+        'ProcessName': 'cat',
+        'PID': 'int',
+        'LocalAddress': 'cat',
+        'LocalPort': 'int',
+        'RemoteAddress': 'cat',
+        'RemotePort': 'int',
+        'State': 'cat',
+    },
+    'Get-UnsignedProcesses': {
+        'ProcessName': 'cat',
+        'PID': 'int',
+        'Path': 'cat',
+        'SignatureStatus': 'cat',
+        'Signer': 'cat',
+    },
+}
+
+# Columnas usadas para el resumen agregado de cada tarea
+AGGREGATE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'Get-SuspiciousEvents': ('LogName', 'Id', 'LevelDisplayName'),
+    'Get-InternetProcesses': ('ProcessName', 'RemoteAddress', 'RemotePort'),
+    'Get-UnsignedProcesses': ('SignatureStatus', 'ProcessName'),
+}
+
+# Valor usado en columnas numéricas cuando el dato falta o no es un entero
+MISSING_INT = -1
+
+
+class _CategoricalColumn:
+    """Columna de texto con valores internados y códigos en un array"""
+
+    kind = 'cat'
+
+    def __init__(self, categories: Optional[List[str]] = None):
+        # El código 0 siempre corresponde al valor vacío
+        self.categories: List[str] = categories if categories is not None else ['']
+        self.index: Dict[str, int] = {value: code for code, value in enumerate(self.categories)}
+        self.codes = array('I')
+
+    def encode(self, value: Any) -> int:
+        text = '' if value is None else str(value)
+        code = self.index.get(text)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(sys.intern(text))
+            self.index[text] = code
+        return code
+
+    def append(self, value: Any):
+        self.codes.append(self.encode(value))
+
+    def get(self, position: int) -> str:
+        return self.categories[self.codes[position]]
+
+    def take(self, positions: Iterable[int]) -> '_CategoricalColumn':
+        # Las categorías se comparten entre la columna original y la derivada
+        column = _CategoricalColumn.__new__(_CategoricalColumn)
+        column.categories = self.categories
+        column.index = self.index
+        column.codes = array('I', (self.codes[pos] for pos in positions))
+        return column
+
+    def memory_usage(self) -> int:
+        size = self.codes.buffer_info()[1] * self.codes.itemsize
+        size += sys.getsizeof(self.categories) + sys.getsizeof(self.index)
+        size += sum(sys.getsizeof(value) for value in self.categories)
+        return size
+
+
+class _IntColumn:
+    """Columna numérica almacenada en un array de enteros de 32 bits"""
+
+    kind = 'int'
+
+    def __init__(self):
+        self.values = array('i')
+
+    @staticmethod
+    def encode(value: Any) -> int:
+        if isinstance(value, int):
+            return value
+        try:
+            return int(str(value).strip())
+        except (TypeError, ValueError):
+            return MISSING_INT
+
+    def append(self, value: Any):
+        self.values.append(self.encode(value))
+
+    def get(self, position: int) -> Optional[int]:
+        value = self.values[position]
+        return None if value == MISSING_INT else value
+
+    def take(self, positions: Iterable[int]) -> '_IntColumn':
+        column = _IntColumn()
+        column.values = array('i', (self.values[pos] for pos in positions))
+        return column
+
+    def memory_usage(self) -> int:
+        return self.values.buffer_info()[1] * self.values.itemsize
+
+
+class ColumnarRecords:
+    """
+    Contenedor columnar de registros forenses
+
+    Los textos repetidos (LogName, LevelDisplayName, mensajes, rutas) se
+    guardan una sola vez y cada fila solo almacena un código entero. Los
+    campos numéricos (Id, PID, puertos) se guardan en arrays. Los filtros y
+    agrupaciones trabajan sobre los códigos sin reconstruir los dicts.
+    """
+
+    def __init__(self, schema: Optional[Dict[str, str]] = None, task_name: Optional[str] = None):
+        """
+        Inicializa un contenedor vacío
+
+        Args:
+            schema: Dict columna -> tipo ('cat' o 'int'). Si no se indica se
+                usa el esquema de la tarea o se infieren columnas categóricas.
+            task_name: Nombre de la tarea que generó los registros
+        """
+        if schema is None:
+            schema = TASK_SCHEMAS.get(task_name, {})
+        self.task_name = task_name
+        self._columns: Dict[str, Any] = {}
+        self._length = 0
+        # Tablas auxiliares que resuelven los valores de una columna
+        # (columna -> valor -> texto); el prompt incluye cada entrada una vez.
+        # Un valor puede ser también varias claves separadas por espacios
+        self.lookup_tables: Dict[str, Dict[Any, str]] = {}
+        for name, kind in schema.items():
+            self._add_column(name, kind)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Dict[str, Any]],
+        task_name: Optional[str] = None,
+        schema: Optional[Dict[str, str]] = None
+    ) -> 'ColumnarRecords':
+        """
+        Construye el contenedor a partir de dicts (por ejemplo, los que
+        produce SpooledOutput.iter_records)
+
+        Args:
+            records: Iterable de registros
+            task_name: Nombre de la tarea
+            schema: Esquema opcional
+
+        Returns:
+            Contenedor con todos los registros
+        """
+        container = cls(schema=schema, task_name=task_name)
+        container.extend(records)
+        return container
+
+    @classmethod
+    def from_output(
+        cls,
+        output: Union[str, SpooledOutput],
+        task_name: Optional[str] = None
+    ) -> 'ColumnarRecords':
+        """
+        Construye el contenedor a partir de la salida de texto de PowerShell
+
+        Args:
+            output: Texto o SpooledOutput devuelto por PowerShellHelper
+            task_name: Nombre de la tarea
+
+        Returns:
+            Contenedor con los objetos reconocidos (vacío si no hay ninguno)
+        """
+        if isinstance(output, SpooledOutput):
+            records = output.iter_records()
+        else:
+            records = iter_records(output.splitlines())
+        return cls.from_records(records, task_name=task_name)
+
+    def _add_column(self, name: str, kind: str = 'cat'):
+        column = _IntColumn() if kind == 'int' else _CategoricalColumn()
+        # Rellenar filas anteriores con el valor vacío
+        for _ in range(self._length):
+            column.append(None if kind == 'cat' else MISSING_INT)
+        self._columns[name] = column
+
+    def append(self, record: Dict[str, Any]):
+        """Agrega un registro; las columnas nuevas se crean como categóricas"""
+        for name in record:
+            if name not in self._columns:
+                self._add_column(name)
+        for name, column in self._columns.items():
+            value = record.get(name)
+            column.append(value if value is not None or column.kind == 'cat' else MISSING_INT)
+        self._length += 1
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        """Agrega varios registros"""
+        for record in records:
+            self.append(record)
+
+    def merge(self, other: 'ColumnarRecords'):
+        """
+        Agrega al final los registros de otro contenedor
+
+        Las columnas categóricas se fusionan traduciendo los códigos (cada
+        categoría se interna una sola vez), sin reconstruir los registros.
+        """
+        for name, column in other._columns.items():
+            if name not in self._columns:
+                self._add_column(name, column.kind)
+
+        for name, column in self._columns.items():
+            source = other._columns.get(name)
+            if source is None:
+                for _ in range(other._length):
+                    column.append(None if column.kind == 'cat' else MISSING_INT)
+            elif column.kind == 'cat' and source.kind == 'cat':
+                remap = [column.encode(value) for value in source.categories]
+                column.codes.extend(array('I', [remap[code] for code in source.codes]))
+            elif column.kind == 'int' and source.kind == 'int':
+                column.values.extend(source.values)
+            else:
+                for position in range(other._length):
+                    column.append(source.get(position))
+
+        self._length += other._length
+        for name, table in other.lookup_tables.items():
+            self.lookup_tables.setdefault(name, {}).update(table)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_records()
+
+    @property
+    def columns(self) -> List[str]:
+        """Nombres de las columnas en orden"""
+        return list(self._columns)
+
+    @property
+    def schema(self) -> Dict[str, str]:
+        """Esquema actual (columna -> tipo)"""
+        return {name: column.kind for name, column in self._columns.items()}
+
+    def record(self, position: int) -> Dict[str, Any]:
+        """Reconstruye un registro como dict"""
+        return {name: column.get(position) for name, column in self._columns.items()}
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Itera los registros como dicts (se construyen bajo demanda)"""
+        for position in range(self._length):
+            yield self.record(position)
+
+    def column(self, name: str) -> List[Any]:
+        """Devuelve los valores decodificados de una columna"""
+        column = self._columns[name]
+        if column.kind == 'cat':
+            categories = column.categories
+            return [categories[code] for code in column.codes]
+        return [None if value == MISSING_INT else value for value in column.values]
+
+    def categories(self, name: str) -> List[str]:
+        """Valores distintos de una columna categórica"""
+        return list(self._columns[name].categories)
+
+    def mask(self, name: str, condition: Any) -> bytearray:
+        """
+        Calcula una máscara booleana sobre una columna
+
+        Args:
+            name: Columna a evaluar
+            condition: Valor exacto, conjunto/lista/tupla de valores
+                aceptados o función que recibe el valor y devuelve bool
+
+        Returns:
+            bytearray con 1 en las filas que cumplen la condición
+        """
+        column = self._columns.get(name)
+        if column is None:
+            return bytearray(self._length)
+
+        if column.kind == 'cat':
+            # La condición se evalúa una vez por categoría, no por fila
+            categories = column.categories
+            if callable(condition):
+                accepted = {code for code, value in enumerate(categories) if condition(value)}
+            elif isinstance(condition, (set, frozenset, list, tuple)):
+                wanted = {str(value) for value in condition}
+                accepted = {code for code, value in enumerate(categories) if value in wanted}
+            else:
+                code = column.index.get(str(condition))
+                accepted = set() if code is None else {code}
+            return bytearray(code in accepted for code in column.codes)
+
+        values = column.values
+        if callable(condition):
+            return bytearray(value != MISSING_INT and bool(condition(value)) for value in values)
+        if isinstance(condition, (set, frozenset, list, tuple)):
+            wanted = {_IntColumn.encode(value) for value in condition}
+            return bytearray(value in wanted for value in values)
+        target = _IntColumn.encode(condition)
+        return bytearray(value == target for value in values)
+
+    def where(self, **conditions: Any) -> 'ColumnarRecords':
+        """
+        Filtra los registros que cumplen todas las condiciones
+
+        Ejemplo: records.where(LevelDisplayName={'Error', 'Critical'}, Id=4625)
+
+        Returns:
+            Nuevo contenedor con las filas seleccionadas
+        """
+        combined = bytearray(b'\x01') * self._length
+        for name, condition in conditions.items():
+            column_mask = self.mask(name, condition)
+            combined = bytearray(a & b for a, b in zip(combined, column_mask))
+        return self.take(position for position, keep in enumerate(combined) if keep)
+
+    def take(self, positions: Iterable[int]) -> 'ColumnarRecords':
+        """Devuelve un contenedor con las filas indicadas (en ese orden)"""
+        positions = array('I', positions)
+        result = ColumnarRecords(schema={}, task_name=self.task_name)
+        result._columns = {name: column.take(positions) for name, column in self._columns.items()}
+        result._length = len(positions)
+        result.lookup_tables = dict(self.lookup_tables)
+        return result
+
+    def _keys(self, name: str) -> Tuple[List[Any], array]:
+        """Devuelve (tabla de valores, códigos por fila) para agrupar"""
+        column = self._columns[name]
+        if column.kind == 'cat':
+            return column.categories, column.codes
+        return [], column.values
+
+    def group_by(self, name: str) -> Dict[Any, array]:
+        """
+        Agrupa las filas por el valor de una columna
+
+        Returns:
+            Dict valor -> array con las posiciones de las filas del grupo
+        """
+        table, codes = self._keys(name)
+        groups: Dict[int, array] = {}
+        for position, code in enumerate(codes):
+            group = groups.get(code)
+            if group is None:
+                group = groups[code] = array('I')
+            group.append(position)
+
+        if table:
+            return {table[code]: positions for code, positions in groups.items()}
+        return {
+            (None if code == MISSING_INT else code): positions
+            for code, positions in groups.items()
+        }
+
+    def count_by(self, *names: str) -> Counter:
+        """
+        Cuenta las filas por combinación de valores de varias columnas
+
+        Returns:
+            Counter con tuplas de valores como clave
+        """
+        keyed = [self._keys(name) for name in names if name in self._columns]
+        counts = Counter(zip(*(codes for _, codes in keyed)))
+        decoded = Counter()
+        for codes, count in counts.items():
+            key = tuple(
+                table[code] if table else (None if code == MISSING_INT else code)
+                for (table, _), code in zip(keyed, codes)
+            )
+            decoded[key] = count
+        return decoded
+
+    def join(self, other: 'ColumnarRecords', on: str) -> List[Tuple[int, int]]:
+        """
+        Une dos contenedores por igualdad en una columna (hash join)
+
+        Args:
+            other: Otro contenedor
+            on: Columna presente en ambos
+
+        Returns:
+            Lista de pares (posición en self, posición en other)
+        """
+        if on not in self._columns or on not in other._columns:
+            return []
+        right = other.group_by(on)
+        pairs = []
+        for value, left_positions in self.group_by(on).items():
+            if value in (None, ''):
+                continue
+            right_positions = right.get(value)
+            if right_positions is None:
+                continue
+            for left in left_positions:
+                for matched in right_positions:
+                    pairs.append((left, matched))
+        return pairs
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serializa el contenedor en un dict apto para JSON
+
+        Las columnas categóricas se guardan como (categorías, códigos), de
+        modo que el tamaño serializado conserva la compresión en memoria.
+        """
+        columns = {}
+        for name, column in self._columns.items():
+            if column.kind == 'cat':
+                columns[name] = {
+                    'kind': 'cat',
+                    'categories': column.categories,
+                    'codes': column.codes.tolist(),
+                }
+            else:
+                columns[name] = {'kind': 'int', 'values': column.values.tolist()}
+        return {
+            'task_name': self.task_name,
+            'length': self._length,
+            'columns': columns,
+            'lookup_tables': {
+                name: [[key, text] for key, text in table.items()]
+                for name, table in self.lookup_tables.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ColumnarRecords':
+        """Reconstruye un contenedor serializado con to_dict()"""
+        result = cls(schema={}, task_name=data.get('task_name'))
+        for name, spec in data['columns'].items():
+            if spec['kind'] == 'cat':
+                column = _CategoricalColumn(list(spec['categories']))
+                column.codes = array('I', spec['codes'])
+            else:
+                column = _IntColumn()
+                column.values = array('i', spec['values'])
+            result._columns[name] = column
+        result._length = data['length']
+        result.lookup_tables = {
+            name: {key: text for key, text in entries}
+            for name, entries in data.get('lookup_tables', {}).items()
+        }
+        return result
+
+    def memory_usage(self) -> int:
+        """Estimación en bytes de la memoria ocupada por las columnas"""
+        return sum(column.memory_usage() for column in self._columns.values())
+
+    def summary_text(self, top: int = 10) -> str:
+        """
+        Genera un resumen agregado (conteos por columnas clave) para el prompt
+
+        Args:
+            top: Número máximo de valores por columna
+
+        Returns:
+            Texto con los valores más frecuentes de cada columna agregada
+        """
+        lines = [f"Total de registros: {self._length}"]
+        for name in AGGREGATE_COLUMNS.get(self.task_name, ()):
+            if name not in self._columns:
+                continue
+            counts = self.count_by(name).most_common(top)
+            values = ', '.join(f"{key[0]} ({count})" for key, count in counts)
+            lines.append(f"{name}: {values}")
+        return '\n'.join(lines)
+
+    def to_prompt_text(self, limit: Optional[int] = 10000, positions: Optional[Iterable[int]] = None) -> str:
+        """
+        Serializa los registros en un formato compacto separado por '|'
+
+        Primero se incluye el resumen agregado, después las entradas de las
+        tablas auxiliares (por ejemplo, las plantillas de mensajes) que usan
+        las filas incluidas y por último las filas hasta alcanzar el límite
+        de caracteres.
+
+        Args:
+            limit: Máximo de caracteres del texto generado (None para incluir
+                todas las filas indicadas)
+            positions: Filas a incluir (por defecto todas). El resumen
+                agregado se calcula siempre sobre el conjunto completo.
+
+        Returns:
+            Texto listo para incluir en un prompt
+        """
+        summary = self.summary_text()
+        header = ' | '.join(self.columns)
+        used = len(summary) + len(header) + 2
+        # Espacio reservado para la nota de registros omitidos
+        budget = None if limit is None else limit - 64
+
+        tables = {
+            name: table for name, table in self.lookup_tables.items() if name in self._columns
+        }
+        entries: Dict[str, Dict[Any, str]] = {name: {} for name in tables}
+        lines = []
+        rows = range(self._length) if positions is None else positions
+        for position in rows:
+            record = self.record(position)
+            line = ' | '.join('' if value is None else str(value) for value in record.values())
+            cost = len(line) + 1
+
+            new_entries = []
+            for name, table in tables.items():
+                for key in lookup_keys(table, record.get(name)):
+                    if key not in entries[name]:
+                        entry = f"  {key}: {table[key]}"
+                        new_entries.append((name, key, entry))
+                        cost += len(entry) + 1
+
+            if budget is not None and used + cost > budget:
+                break
+            for name, key, entry in new_entries:
+                entries[name][key] = entry
+            lines.append(line)
+            used += cost
+
+        parts = [summary, '']
+        for name, table_entries in entries.items():
+            if table_entries:
+                parts.append(f"Tabla {name}:")
+                parts.extend(table_entries.values())
+                parts.append('')
+        parts.append(header)
+        parts.extend(lines)
+
+        if len(lines) < self._length:
+            parts.append(f"... ({self._length - len(lines)} registros adicionales omitidos)")
+        text = '\n'.join(parts)
+        return text if limit is None else text[:limit]
+
+
+def lookup_keys(table: Dict[Any, str], value: Any) -> List[Any]:
+    """
+    Claves de una tabla auxiliar que usa un valor de la columna
+
+    Args:
+        table: Tabla auxiliar (valor -> texto)
+        value: Valor de la columna: una clave o varias separadas por espacios
+
+    Returns:
+        Claves presentes en la tabla
+    """
+    if value in table:
+        return [value]
+    if isinstance(value, str):
+        return [key for key in value.split(' ') if key in table]
+    return []
+
+
+def correlate_unsigned_connections(
+    connections: ColumnarRecords,
+    unsigned: ColumnarRecords
+) -> ColumnarRecords:
+    """
+    Correlaciona conexiones de red con procesos sin firma por PID
+
+    Args:
+        connections: Registros de Get-InternetProcesses
+        unsigned: Registros de Get-UnsignedProcesses
+
+    Returns:
+        Registros combinados de procesos sin firma con conexiones activas
+    """
+    result = ColumnarRecords(schema={
+        'ProcessName': 'cat',
+        'PID': 'int',
+        'Path': 'cat',
+        'SignatureStatus': 'cat',
+        'RemoteAddress': 'cat',
+        'RemotePort': 'int',
+    })
+    for conn_pos, proc_pos in connections.join(unsigned, on='PID'):
+        conn = connections.record(conn_pos)
+        proc = unsigned.record(proc_pos)
+        result.append({
+            'ProcessName': proc.get('ProcessName'),
+            'PID': proc.get('PID'),
+            'Path': proc.get('Path'),
+            'SignatureStatus': proc.get('SignatureStatus'),
+            'RemoteAddress': conn.get('RemoteAddress'),
+            'RemotePort': conn.get('RemotePort'),
+        })
+    return result
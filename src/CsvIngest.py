@@ -0,0 +1,263 @@
+"""
+Módulo para importar reportes CSV exportados por los recolectores (modo sin conexión)
+"""
+import codecs
+import csv
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from ColumnarRecords import TASK_SCHEMAS, ColumnarRecords
+
+# Tamaño de cada bloque que se reparte entre los procesos
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Columnas con fecha y hora que se normalizan a ISO 8601
+TIMESTAMP_COLUMNS = ('TimeCreated',)
+
+# Fecha y hora tal como las escribe Export-Csv según la configuración regional:
+# "07/11/2025 09:18:54 a. m.", "11/7/2025 9:18:54 AM", "2025-11-07 09:18:54"
+_TIMESTAMP_RE = re.compile(
+    r'^\s*(\d{1,4})[/.-](\d{1,2})[/.-](\d{1,4})'
+    r'(?:[ T]+(\d{1,2}):(\d{2})(?::(\d{2}))?(?:[.,]\d+)?'
+    r'\s*(?:(a\.?\s*m\.?|am)|(p\.?\s*m\.?|pm))?)?\s*$',
+    re.IGNORECASE
+)
+
+
+def parse_timestamp(text: str, day_first: bool = True) -> str:
+    """
+    Convierte una fecha localizada a 'AAAA-MM-DD HH:MM:SS'
+
+    Args:
+        text: Fecha tal como aparece en el CSV
+        day_first: Si la fecha es ambigua (ambos campos <= 12), interpretar
+            el primero como día (configuración regional en español)
+
+    Returns:
+        Fecha normalizada, o el texto original si no se reconoce
+    """
+    match = _TIMESTAMP_RE.match(text)
+    if match is None:
+        return text
+
+    first, second, third, hour, minute, second_s, am, pm = match.groups()
+    if len(first) == 4:
+        year, month, day = int(first), int(second), int(third)
+    else:
+        a, b = int(first), int(second)
+        if a > 12 or (day_first and b <= 12):
+            day, month = a, b
+        else:
+            month, day = a, b
+        year = int(third)
+        if year < 100:
+            year += 2000
+
+    hour = int(hour or 0)
+    if pm and hour < 12:
+        hour += 12
+    elif am and hour == 12:
+        hour = 0
+
+    if not (1 <= month <= 12 and 1 <= day <= 31 and hour < 24):
+        return text
+    return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{int(minute or 0):02d}:{int(second_s or 0):02d}"
+
+
+def detect_day_first(values: Sequence[str], default: bool = True) -> bool:
+    """
+    Deduce el orden día/mes a partir de una muestra de fechas
+
+    Args:
+        values: Fechas de muestra
+        default: Valor si ninguna fecha permite decidirlo
+
+    Returns:
+        True si el primer campo es el día
+    """
+    for value in values:
+        match = _TIMESTAMP_RE.match(value)
+        if match is None or len(match.group(1)) == 4:
+            continue
+        if int(match.group(1)) > 12:
+            return True
+        if int(match.group(2)) > 12:
+            return False
+    return default
+
+
+def detect_task(header: Sequence[str]) -> Optional[str]:
+    """Identifica la tarea que generó un CSV a partir de sus columnas"""
+    columns = set(header)
+    for task_name, schema in TASK_SCHEMAS.items():
+        if set(schema) <= columns:
+            return task_name
+    return None
+
+
+def _split_complete(block: bytes) -> Tuple[bytes, bytes]:
+    """
+    Separa un bloque en (registros completos, resto)
+
+    Un salto de línea solo termina un registro si el número de comillas
+    anteriores es par; así se respetan los mensajes con saltos de línea
+    dentro de campos entrecomillados.
+    """
+    cut = -1
+    inside = False
+    position = 0
+    for piece in block.split(b'\n'):
+        inside ^= piece.count(b'"') & 1
+        position += len(piece) + 1
+        if not inside and position <= len(block):
+            cut = position
+    if cut < 0:
+        return b'', block
+    return block[:cut], block[cut:]
+
+
+def _iter_blocks(path: str, block_size: int) -> Iterator[bytes]:
+    """Lee el archivo en bloques UTF-8 (sin BOM) que terminan en un registro completo"""
+    with open(path, 'rb') as raw:
+        bom = raw.read(4)
+        if bom.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            # Export-Csv -Encoding Unicode: se transcodifica a UTF-8 por bloques
+            raw.seek(0)
+            text = io.TextIOWrapper(raw, encoding='utf-16', newline='')
+            read = lambda: text.read(block_size // 2).encode('utf-8')
+        else:
+            raw.seek(len(codecs.BOM_UTF8) if bom.startswith(codecs.BOM_UTF8) else 0)
+            read = lambda: raw.read(block_size)
+
+        pending = b''
+        while True:
+            data = read()
+            if not data:
+                break
+            complete, pending = _split_complete(pending + data)
+            if complete:
+                yield complete
+        if pending.strip():
+            yield pending
+
+
+def _parse_rows(
+    block: bytes,
+    header: List[str],
+    timestamp_positions: List[int],
+    day_first: bool
+) -> Iterator[List[str]]:
+    """Parsea las filas CSV de un bloque"""
+    width = len(header)
+    for row in csv.reader(io.StringIO(block.decode('utf-8', errors='replace'), newline='')):
+        if not row:
+            continue
+        if len(row) < width:
+            row.extend([''] * (width - len(row)))
+        for position in timestamp_positions:
+            row[position] = parse_timestamp(row[position], day_first)
+        yield row[:width]
+
+
+def _parse_block(
+    block: bytes,
+    header: List[str],
+    timestamp_positions: List[int],
+    day_first: bool,
+    task_name: Optional[str]
+) -> ColumnarRecords:
+    """
+    Convierte un bloque en registros columnares (se ejecuta en los procesos
+    del pool; el resultado compacto es barato de devolver al proceso principal)
+    """
+    return ColumnarRecords.from_records(
+        (dict(zip(header, row)) for row in _parse_rows(block, header, timestamp_positions, day_first)),
+        task_name=task_name
+    )
+
+
+def iter_csv_blocks(
+    path: str,
+    task_name: Optional[str] = None,
+    workers: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    day_first: Optional[bool] = None
+) -> Iterator[ColumnarRecords]:
+    """
+    Lee un CSV por bloques y los parsea en paralelo conservando el orden
+
+    Como mucho hay 2 bloques por proceso en vuelo, de modo que la memoria
+    usada en la lectura no depende del tamaño del archivo.
+
+    Args:
+        path: Ruta del CSV
+        task_name: Tarea que generó el CSV (None para detectarla por las columnas)
+        workers: Procesos a usar (por defecto, núcleos disponibles; 1 para
+            parsear en el proceso actual)
+        block_size: Bytes por bloque
+        day_first: Orden día/mes de las fechas (None para detectarlo)
+
+    Returns:
+        Iterador de contenedores, uno por bloque
+    """
+    blocks = _iter_blocks(path, block_size)
+    first = next(blocks, b'')
+    header_line, first = first.split(b'\n', 1) if b'\n' in first else (first, b'')
+    header = next(csv.reader([header_line.decode('utf-8', errors='replace').strip('\r')]), [])
+    timestamp_positions = [header.index(name) for name in TIMESTAMP_COLUMNS if name in header]
+    task_name = task_name or detect_task(header)
+
+    if day_first is None:
+        sample = _parse_rows(first[:256 * 1024].rsplit(b'\n', 1)[0], header, [], True)
+        day_first = detect_day_first([row[pos] for row in sample for pos in timestamp_positions])
+
+    args = (header, timestamp_positions, day_first, task_name)
+    yield _parse_block(first, *args)
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for block in blocks:
+            yield _parse_block(block, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for block in blocks:
+            in_flight.append(pool.submit(_parse_block, block, *args))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
+
+
+def load_csv(
+    path: str,
+    task_name: Optional[str] = None,
+    workers: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> ColumnarRecords:
+    """
+    Importa un reporte CSV como registros columnares
+
+    Args:
+        path: Ruta del CSV (UTF-8 con o sin BOM, o UTF-16)
+        task_name: Tarea que generó el CSV (None para detectarla por las columnas)
+        workers: Procesos a usar en el parseo
+        block_size: Bytes por bloque
+
+    Returns:
+        Contenedor con los mismos registros que produce el recolector en vivo
+    """
+    if os.path.getsize(path) <= block_size:
+        workers = 1
+
+    records = None
+    for block in iter_csv_blocks(path, task_name, workers=workers, block_size=block_size):
+        if records is None:
+            records = block
+        else:
+            records.merge(block)
+    return records if records is not None else ColumnarRecords(task_name=task_name)
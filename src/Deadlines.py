@@ -0,0 +1,268 @@
+"""
+Módulo para ejecutar subprocesos con tiempo límite, cancelación y límites adaptativos
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Límites adaptativos persistidos entre ejecuciones
+DEFAULT_LIMITS_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'limites_adaptativos.json')
+
+# Cada cuánto se comprueba la cancelación mientras el proceso sigue vivo
+POLL_SECONDS = 0.25
+
+# Espera máxima para recoger la salida tras matar el árbol de procesos
+DRAIN_SECONDS = 5.0
+
+
+class Deadline:
+    """
+    Instante límite absoluto (reloj monotónico) compartido por varias llamadas
+
+    Un Deadline de pipeline se combina con el tiempo de cada llamada con
+    sooner(): la llamada termina en el primero de los dos límites.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Args:
+            seconds: Segundos desde ahora; None o <= 0 para no tener límite
+        """
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.expires_at = time.monotonic() + self.seconds if self.seconds else None
+
+    def remaining(self) -> Optional[float]:
+        """Segundos restantes (0 si ya venció) o None si no hay límite"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def sooner(self, seconds: Optional[float]) -> 'Deadline':
+        """
+        Devuelve el límite más cercano entre este y 'seconds' desde ahora
+
+        Args:
+            seconds: Tiempo máximo de una llamada (None para no añadir límite)
+
+        Returns:
+            Nuevo Deadline
+        """
+        deadline = Deadline(seconds)
+        if self.expires_at is not None and (
+            deadline.expires_at is None or self.expires_at < deadline.expires_at
+        ):
+            deadline.expires_at = self.expires_at
+            deadline.seconds = self.remaining()
+        return deadline
+
+
+@dataclass
+class ProcessResult:
+    """Resultado de un subproceso ejecutado con límite de tiempo"""
+    returncode: int
+    stdout: Optional[bytes]
+    stderr: bytes
+    elapsed: float
+    timed_out: bool = False
+    cancelled: bool = False
+
+
+def _process_group_options() -> Dict[str, int]:
+    """Crea el proceso en su propio grupo para poder terminar todo el árbol"""
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def kill_process_tree(process: subprocess.Popen):
+    """
+    Termina un proceso y todos sus descendientes
+
+    En Windows se usa taskkill /T (PowerShell lanza procesos hijos que
+    mantendrían abierta la salida); en POSIX se mata el grupo de procesos.
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            subprocess.run(
+                ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"No se pudo terminar el árbol del proceso {process.pid}: {e}")
+    if process.poll() is None:
+        process.kill()
+
+
+def run_with_deadline(
+    args: List[str],
+    deadline: Optional[Deadline] = None,
+    stdout: Union[int, object] = subprocess.PIPE,
+    cancel_event: Optional[threading.Event] = None
+) -> ProcessResult:
+    """
+    Ejecuta un proceso hasta que termina, vence el límite o se cancela
+
+    Al vencer el límite o activarse cancel_event se termina el árbol de
+    procesos completo y se devuelve la salida recibida hasta ese momento.
+    Ctrl+C también termina el árbol antes de propagar KeyboardInterrupt, de
+    modo que no quedan procesos de PowerShell huérfanos.
+
+    Args:
+        args: Comando y argumentos
+        deadline: Instante límite (None para esperar indefinidamente)
+        stdout: subprocess.PIPE o un archivo abierto donde volcar la salida
+        cancel_event: Evento que cancela la ejecución al activarse
+
+    Returns:
+        ProcessResult; stdout es None si se volcó a un archivo
+    """
+    deadline = deadline or Deadline()
+    started = time.monotonic()
+    process = subprocess.Popen(args, stdout=stdout, stderr=subprocess.PIPE, **_process_group_options())
+    timed_out = cancelled = False
+    try:
+        while True:
+            remaining = deadline.remaining()
+            wait = POLL_SECONDS if remaining is None else min(POLL_SECONDS, remaining)
+            try:
+                # Reintentar communicate() tras TimeoutExpired no pierde salida
+                out, err = process.communicate(timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                elif deadline.expired:
+                    timed_out = True
+                else:
+                    continue
+            kill_process_tree(process)
+            try:
+                out, err = process.communicate(timeout=DRAIN_SECONDS)
+            except subprocess.TimeoutExpired:
+                out, err = None, b''
+            break
+    except KeyboardInterrupt:
+        kill_process_tree(process)
+        raise
+
+    return ProcessResult(
+        returncode=process.returncode if process.returncode is not None else -1,
+        stdout=out,
+        stderr=err or b'',
+        elapsed=time.monotonic() - started,
+        timed_out=timed_out,
+        cancelled=cancelled
+    )
+
+
+class AdaptiveLimits:
+    """
+    Ajusta el número de elementos pedidos a un recolector según su duración
+
+    Si una ejecución agota su tiempo, la siguiente pide la mitad; si supera
+    el presupuesto (una fracción del tiempo límite), se reduce en
+    proporción. Cuando vuelve a terminar con holgura, el límite crece de
+    nuevo hasta el valor solicitado. Los límites se guardan en disco para
+    que se apliquen también en la siguiente ejecución del programa.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_LIMITS_PATH,
+        budget_fraction: float = 0.8,
+        min_value: int = 100
+    ):
+        """
+        Args:
+            path: Archivo JSON con los límites
+            budget_fraction: Fracción del tiempo límite que se considera presupuesto
+            min_value: Límite mínimo
+        """
+        self.path = path
+        self.budget_fraction = budget_fraction
+        self.min_value = min_value
+        self._lock = threading.Lock()
+        self.limits: Dict[str, int] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.limits = {key: int(value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def limit(self, key: str, requested: int) -> int:
+        """Valor a pedir en la próxima ejecución (nunca mayor que el solicitado)"""
+        with self._lock:
+            return min(requested, self.limits.get(key, requested))
+
+    def record(
+        self,
+        key: str,
+        requested: int,
+        used: int,
+        elapsed: float,
+        timeout: Optional[float],
+        timed_out: bool
+    ) -> int:
+        """
+        Registra la duración de una ejecución y calcula el próximo límite
+
+        Args:
+            key: Recolector
+            requested: Valor solicitado por el usuario
+            used: Valor usado en esta ejecución
+            elapsed: Segundos que tardó
+            timeout: Tiempo límite de la llamada (None si no tenía)
+            timed_out: Si se agotó el tiempo límite
+
+        Returns:
+            Límite para la próxima ejecución
+        """
+        if not timeout:
+            return used
+        budget = timeout * self.budget_fraction
+        if timed_out:
+            new = used // 2
+        elif elapsed > budget:
+            new = int(used * budget / elapsed * 0.9)
+        elif elapsed < budget / 2 and used < requested:
+            new = int(used * 1.5) + 1
+        else:
+            new = used
+        new = min(requested, max(self.min_value, new))
+
+        with self._lock:
+            previous = self.limits.get(key, requested)
+            if new >= requested:
+                self.limits.pop(key, None)
+            else:
+                self.limits[key] = new
+            if new != previous:
+                logger.info(f"Límite adaptativo de {key}: {previous} -> {new} ({elapsed:.1f} s)")
+                self._save()
+        return new
+
+    def _save(self):
+        """Guarda los límites de forma atómica"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.limits, f, indent=2)
+        os.replace(tmp_path, self.path)
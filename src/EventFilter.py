@@ -0,0 +1,167 @@
+"""
+Módulo para construir filtros de eventos que se evalúan en el origen (XPath de Get-WinEvent)
+"""
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Logs que revisa Get-SuspiciousEvents por defecto
+DEFAULT_CHANNELS = ('System', 'Application', 'Security')
+
+# Niveles de evento por nombre (el log de Seguridad registra con nivel 0)
+LEVELS = {
+    'critical': (1,), 'critico': (1,), 'crítico': (1,),
+    'error': (2,),
+    'warning': (3,), 'advertencia': (3,),
+    'information': (0, 4), 'informacion': (0, 4), 'información': (0, 4),
+    'verbose': (5,), 'detallado': (5,),
+}
+
+# Condiciones de EventID admitidas: el motor XPath del registro de eventos
+# rechaza las consultas con demasiados operadores
+MAX_ID_TERMS = 20
+
+
+def _id_terms(event_ids: Iterable[int]) -> List[str]:
+    """Agrupa los IDs consecutivos en rangos para acortar la consulta"""
+    terms = []
+    ordered = sorted(set(event_ids))
+    start = 0
+    for position in range(1, len(ordered) + 1):
+        if position < len(ordered) and ordered[position] == ordered[position - 1] + 1:
+            continue
+        low, high = ordered[start], ordered[position - 1]
+        if high - low >= 2:
+            terms.append(f"(EventID>={low} and EventID<={high})")
+        else:
+            terms.extend(f"EventID={event_id}" for event_id in range(low, high + 1))
+        start = position
+    return terms
+
+
+def _system_time(value: datetime) -> str:
+    """Formato de @SystemTime (UTC); las fechas sin zona se toman como hora local"""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _quoted(value: str, what: str) -> str:
+    if "'" in value or '"' in value:
+        raise ValueError(f"{what} no válido: {value!r}")
+    return f"'{value}'"
+
+
+def parse_levels(values: Iterable[Union[str, int]]) -> Tuple[int, ...]:
+    """
+    Convierte nombres o números de nivel en los valores de System/Level
+
+    Args:
+        values: Niveles ('error', 'Warning', 2...)
+
+    Returns:
+        Tupla ordenada de niveles numéricos
+
+    Raises:
+        ValueError: Si un nivel no existe
+    """
+    levels = set()
+    for value in values:
+        text = str(value).strip().lower()
+        if text.isdigit():
+            levels.add(int(text))
+        elif text in LEVELS:
+            levels.update(LEVELS[text])
+        else:
+            raise ValueError(f"Nivel de evento desconocido: {value}")
+    return tuple(sorted(levels))
+
+
+@dataclass(frozen=True)
+class EventFilter:
+    """
+    Criterios de selección de eventos que se compilan a XPath
+
+    Get-WinEvent evalúa el XPath en el propio servicio de registro de
+    eventos, de modo que los eventos descartados no se leen, no se
+    convierten en objetos de PowerShell ni se transfieren a Python.
+    Los criterios vacíos no restringen nada.
+    """
+    event_ids: Tuple[int, ...] = ()
+    channels: Tuple[str, ...] = DEFAULT_CHANNELS
+    levels: Tuple[int, ...] = ()
+    providers: Tuple[str, ...] = ()
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    # Si es False se devuelven todos los eventos del filtro, no solo los
+    # que además cumplen las reglas de sospecha de Get-SuspiciousEvents
+    suspicious_only: bool = True
+
+    def __post_init__(self):
+        if len(_id_terms(self.event_ids)) > MAX_ID_TERMS:
+            raise ValueError(
+                f"Demasiados IDs de evento no consecutivos (máximo {MAX_ID_TERMS} condiciones)"
+            )
+        if self.start_time and self.end_time and self.start_time > self.end_time:
+            raise ValueError("La fecha inicial es posterior a la final")
+        if not self.channels:
+            raise ValueError("Se necesita al menos un canal")
+        for channel in self.channels:
+            _quoted(channel, "Canal")
+        for provider in self.providers:
+            _quoted(provider, "Proveedor")
+
+    def since(self, start_time: Optional[datetime]) -> 'EventFilter':
+        """
+        Devuelve el filtro con la fecha inicial más reciente de las dos
+
+        Args:
+            start_time: Fecha inicial de una recolección incremental
+
+        Returns:
+            Nuevo filtro (o el mismo si no cambia)
+        """
+        if start_time is None or (self.start_time is not None and self.start_time >= start_time):
+            return self
+        if self.end_time is not None and start_time > self.end_time:
+            start_time = self.end_time
+        return replace(self, start_time=start_time)
+
+    def to_xpath(self) -> str:
+        """
+        Compila los criterios a un selector XPath (parámetro -FilterXPath)
+
+        Returns:
+            Selector XPath; '*' si no hay criterios
+        """
+        conditions = []
+        if self.event_ids:
+            conditions.append(f"({' or '.join(_id_terms(self.event_ids))})")
+        if self.levels:
+            conditions.append(f"({' or '.join(f'Level={level}' for level in sorted(set(self.levels)))})")
+        if self.providers:
+            names = ' or '.join(f"@Name={_quoted(provider, 'Proveedor')}" for provider in self.providers)
+            conditions.append(f"Provider[{names}]")
+        times = []
+        if self.start_time is not None:
+            times.append(f"@SystemTime>='{_system_time(self.start_time)}'")
+        if self.end_time is not None:
+            times.append(f"@SystemTime<='{_system_time(self.end_time)}'")
+        if times:
+            conditions.append(f"TimeCreated[{' and '.join(times)}]")
+
+        if not conditions:
+            return '*'
+        return f"*[System[{' and '.join(conditions)}]]"
+
+    def to_query_list(self) -> str:
+        """
+        Compila los criterios a un QueryList XML con todos los canales
+        (-FilterXml de Get-WinEvent, wevtutil qe /sq o el Visor de eventos)
+
+        Returns:
+            Documento XML de la consulta
+        """
+        xpath = self.to_xpath().replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        selects = '\n'.join(
+            f'    <Select Path="{channel}">{xpath}</Select>' for channel in self.channels
+        )
+        return f'<QueryList>\n  <Query Id="0">\n{selects}\n  </Query>\n</QueryList>'
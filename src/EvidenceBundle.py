@@ -0,0 +1,425 @@
+"""
+Módulo para empaquetar las evidencias de un análisis con manifiesto firmado
+"""
+import getpass
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import zipfile
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from BinaryHasher import hash_file
+from ColumnarRecords import ColumnarRecords
+from SpooledOutput import SpooledOutput
+
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto de los paquetes de evidencias
+DEFAULT_BUNDLE_DIR = os.path.join(os.path.dirname(__file__), 'reportes', 'evidencias')
+
+MANIFEST_NAME = 'manifest.json'
+SIGNATURE_NAME = 'manifest.sig'
+MANIFEST_FORMAT = 'autoforense-evidencias/1'
+
+# Bytes que se comprimen en cada escritura
+STREAM_CHUNK = 1024 * 1024
+
+
+def signing_key_from_env() -> Optional[bytes]:
+    """Clave HMAC configurada en AUTOFORENSE_CLAVE_EVIDENCIAS (None si no hay)"""
+    key = os.getenv('AUTOFORENSE_CLAVE_EVIDENCIAS', '')
+    return key.encode('utf-8') if key else None
+
+
+def sign_manifest(manifest: bytes, key: Optional[bytes]) -> str:
+    """
+    Firma el manifiesto
+
+    Con clave se usa HMAC-SHA256; sin clave solo se guarda el SHA-256, que
+    detecta daños en el archivo pero no una modificación intencionada.
+
+    Returns:
+        Firma en la forma 'algoritmo:hex'
+    """
+    if key:
+        return 'hmac-sha256:' + hmac.new(key, manifest, hashlib.sha256).hexdigest()
+    return 'sha256:' + hashlib.sha256(manifest).hexdigest()
+
+
+def _hash_buffer(buffer) -> str:
+    """SHA-256 de un bloque en memoria (hashlib libera el GIL)"""
+    digest = hashlib.sha256()
+    for offset in range(0, len(buffer), STREAM_CHUNK):
+        digest.update(buffer[offset:offset + STREAM_CHUNK])
+    return digest.hexdigest()
+
+
+class EvidenceBundle:
+    """
+    Paquete ZIP con las evidencias de un análisis
+
+    Cada miembro se comprime por separado (deflate) mientras se escribe, así
+    que el paquete no se construye en memoria y cualquier miembro se puede
+    verificar o extraer sin descomprimir el resto. El SHA-256 de cada
+    miembro se calcula en otros hilos a la vez que la compresión. Al cerrar
+    se agregan el manifiesto (nombre, tamaño, hash y origen de cada
+    miembro) y su firma.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        key: Optional[bytes] = None,
+        compresslevel: int = 6,
+        max_workers: Optional[int] = None
+    ):
+        """
+        Crea el paquete
+
+        Args:
+            path: Archivo ZIP a generar (por defecto
+                reportes/evidencias/evidencias_<fecha>.zip)
+            key: Clave de firma (por defecto, AUTOFORENSE_CLAVE_EVIDENCIAS)
+            compresslevel: Nivel de compresión deflate (1-9)
+            max_workers: Hilos para calcular los hashes
+        """
+        if path is None:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(DEFAULT_BUNDLE_DIR, f"evidencias_{timestamp}.zip")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.key = key if key is not None else signing_key_from_env()
+        self._tmp_path = f"{path}.tmp"
+        self._zip = zipfile.ZipFile(
+            self._tmp_path, 'w', compression=zipfile.ZIP_DEFLATED,
+            compresslevel=compresslevel, allowZip64=True
+        )
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='evidencias')
+        self._members: List[Dict[str, Any]] = []
+        self._hashes: List[Future] = []
+        self._closed = False
+
+    def __enter__(self) -> 'EvidenceBundle':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def _check_name(self, name: str) -> str:
+        name = name.replace('\\', '/').lstrip('/')
+        if name in (MANIFEST_NAME, SIGNATURE_NAME):
+            raise ValueError(f"Nombre de miembro reservado: {name}")
+        if any(member['name'] == name for member in self._members):
+            raise ValueError(f"Miembro duplicado en el paquete: {name}")
+        return name
+
+    def _write(self, name: str, buffer, digest: Future, source: str, meta: Dict[str, Any]):
+        """Comprime un bloque en memoria mientras otro hilo calcula su hash"""
+        with self._zip.open(name, 'w', force_zip64=True) as dest:
+            for offset in range(0, len(buffer), STREAM_CHUNK):
+                dest.write(buffer[offset:offset + STREAM_CHUNK])
+        self._members.append({'name': name, 'size': len(buffer), 'source': source, **meta})
+        self._hashes.append(digest)
+
+    def add_bytes(self, name: str, data: bytes, source: str = 'datos', **meta: Any):
+        """
+        Agrega un bloque de bytes
+
+        Args:
+            name: Ruta del miembro dentro del paquete
+            data: Contenido
+            source: Origen de la evidencia (recolector, modelo, reporte...)
+            **meta: Datos adicionales para el manifiesto
+        """
+        name = self._check_name(name)
+        self._write(name, data, self._pool.submit(_hash_buffer, data), source, meta)
+
+    def add_text(self, name: str, text: str, source: str = 'datos', **meta: Any):
+        """Agrega un texto (se guarda en UTF-8)"""
+        self.add_bytes(name, text.encode('utf-8', errors='replace'), source, **meta)
+
+    def add_output(self, name: str, output: Union[str, SpooledOutput], source: str, **meta: Any):
+        """
+        Agrega la salida cruda de un recolector
+
+        Una salida volcada a disco se comprime directamente desde el mapeo
+        en memoria, sin decodificarla ni copiarla.
+
+        Args:
+            name: Ruta del miembro dentro del paquete
+            output: Salida de PowerShell (str o SpooledOutput)
+            source: Recolector que la generó
+        """
+        if not isinstance(output, SpooledOutput):
+            self.add_text(name, output or '', source, **meta)
+            return
+        name = self._check_name(name)
+        with output.view() as view:
+            digest = self._pool.submit(_hash_buffer, view)
+            self._write(name, view, digest, source, meta)
+            # La vista debe seguir viva hasta que termine el hash
+            digest.result()
+
+    def add_records(self, name: str, records: ColumnarRecords, **meta: Any):
+        """Agrega registros procesados en el formato de ColumnarRecords.to_dict"""
+        data = json.dumps(records.to_dict(), ensure_ascii=False).encode('utf-8')
+        self.add_bytes(name, data, records.task_name or 'registros', records=len(records), **meta)
+
+    def add_file(self, name: str, path: str, source: str = 'archivo', **meta: Any):
+        """
+        Agrega un archivo del disco (p. ej. un reporte PDF)
+
+        El hash se calcula con su propia lectura del archivo mientras este
+        hilo lo comprime.
+
+        Args:
+            name: Ruta del miembro dentro del paquete
+            path: Archivo a agregar
+            source: Origen de la evidencia
+        """
+        name = self._check_name(name)
+        digest = self._pool.submit(hash_file, path)
+        size = 0
+        with open(path, 'rb') as src, self._zip.open(name, 'w', force_zip64=True) as dest:
+            while True:
+                chunk = src.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                size += len(chunk)
+        self._members.append({'name': name, 'size': size, 'source': source, **meta})
+        self._hashes.append(digest)
+
+    def close(self) -> str:
+        """
+        Escribe el manifiesto y su firma y cierra el paquete
+
+        Returns:
+            Ruta del paquete generado
+        """
+        if self._closed:
+            return self.path
+        for member, digest in zip(self._members, self._hashes):
+            result = digest.result()
+            member['sha256'] = result['sha256'] if isinstance(result, dict) else result
+        self._pool.shutdown()
+
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'host': socket.gethostname(),
+            'user': getpass.getuser(),
+            'algorithm': 'sha256',
+            'members': self._members,
+        }
+        manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        self._zip.writestr(MANIFEST_NAME, manifest_bytes)
+        self._zip.writestr(SIGNATURE_NAME, sign_manifest(manifest_bytes, self.key))
+        self._zip.close()
+        os.replace(self._tmp_path, self.path)
+        self._closed = True
+        if not self.key:
+            logger.warning("Paquete de evidencias sin clave de firma (AUTOFORENSE_CLAVE_EVIDENCIAS)")
+        logger.info(f"Paquete de evidencias generado: {self.path} ({len(self._members)} miembros)")
+        return self.path
+
+    def discard(self):
+        """Cierra el paquete sin generarlo"""
+        if self._closed:
+            return
+        self._pool.shutdown(cancel_futures=True)
+        self._zip.close()
+        os.remove(self._tmp_path)
+        self._closed = True
+
+
+def read_manifest(path: str, key: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Lee el manifiesto de un paquete y comprueba su firma
+
+    Args:
+        path: Paquete ZIP
+        key: Clave de firma (por defecto, AUTOFORENSE_CLAVE_EVIDENCIAS)
+
+    Con clave configurada solo se acepta la firma HMAC-SHA256: un paquete
+    con el hash simple ('sha256:') no es válido, porque cualquiera puede
+    recalcularlo tras modificar un miembro y su hash en el manifiesto. El
+    hash simple solo se acepta (como paquete sin firmar) si no hay clave.
+
+    Returns:
+        Dict con 'manifest', 'signed' (si la firma es HMAC),
+        'key_required' (si hay clave configurada) y 'signature_valid'
+    """
+    key = key if key is not None else signing_key_from_env()
+    with zipfile.ZipFile(path) as bundle:
+        manifest_bytes = bundle.read(MANIFEST_NAME)
+        signature = bundle.read(SIGNATURE_NAME).decode('ascii').strip()
+    signed = signature.startswith('hmac-sha256:')
+    if key:
+        valid = signed and hmac.compare_digest(signature, sign_manifest(manifest_bytes, key))
+    else:
+        valid = not signed and hmac.compare_digest(signature, sign_manifest(manifest_bytes, None))
+    return {
+        'manifest': json.loads(manifest_bytes),
+        'signed': signed,
+        'key_required': bool(key),
+        'signature_valid': valid,
+    }
+
+
+# Errores al leer un miembro dañado o ausente del ZIP
+_MEMBER_ERRORS = (KeyError, zipfile.BadZipFile, zlib.error, OSError, EOFError)
+
+
+def _member_digest(path: str, name: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    SHA-256 de un miembro descomprimido por bloques (solo ese miembro)
+
+    Returns:
+        Tupla (hash, error); si el miembro falta o está dañado, el hash es
+        None y el error describe el motivo
+    """
+    digest = hashlib.sha256()
+    try:
+        with zipfile.ZipFile(path) as bundle, bundle.open(name) as src:
+            while True:
+                chunk = src.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    except KeyError:
+        return None, "falta en el paquete"
+    except _MEMBER_ERRORS as e:
+        return None, f"ilegible: {e}"
+    return digest.hexdigest(), None
+
+
+def verify_bundle(
+    path: str,
+    members: Optional[List[str]] = None,
+    key: Optional[bytes] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Verifica la firma del manifiesto y los hashes de los miembros
+
+    Cada miembro se descomprime por separado y en paralelo; si se indican
+    miembros concretos, el resto del paquete no se lee.
+
+    Args:
+        path: Paquete ZIP
+        members: Miembros a verificar (por defecto todos)
+        key: Clave de firma (por defecto, AUTOFORENSE_CLAVE_EVIDENCIAS)
+        max_workers: Hilos de verificación
+
+    Returns:
+        Dict con 'success', 'output' (informe), 'error' y 'members'
+        (miembro -> correcto)
+    """
+    try:
+        info = read_manifest(path, key)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        return {'success': False, 'output': '', 'error': f"Paquete no válido: {e}", 'members': {}}
+
+    expected = {member['name']: member for member in info['manifest']['members']}
+    names = list(expected) if not members else [name.replace('\\', '/') for name in members]
+    unknown = [name for name in names if name not in expected]
+    names = [name for name in names if name in expected]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        digests = dict(zip(names, pool.map(lambda name: _member_digest(path, name), names)))
+    results = {name: digests[name][0] == expected[name]['sha256'] for name in names}
+
+    if info['key_required'] and not info['signed']:
+        signature = "NO VÁLIDA (el paquete no tiene firma HMAC y hay clave configurada)"
+    elif not info['signed']:
+        signature = "sin clave (solo integridad)" if info['signature_valid'] else "NO VÁLIDA"
+    else:
+        signature = "válida (HMAC-SHA256)" if info['signature_valid'] else "NO VÁLIDA"
+    lines = [
+        f"Paquete: {path}",
+        f"Creado: {info['manifest'].get('created')} en {info['manifest'].get('host')}",
+        f"Firma del manifiesto: {signature}",
+    ]
+    for name, ok in results.items():
+        reason = digests[name][1]
+        lines.append(f"  {'✓' if ok else '✗'} {name}" + (f" ({reason})" if reason else ''))
+    lines.extend(f"  ✗ {name} (no está en el manifiesto)" for name in unknown)
+
+    errors = []
+    if not info['signature_valid']:
+        errors.append("la firma del manifiesto no es válida")
+    if unknown:
+        errors.append(f"{len(unknown)} miembros no están en el manifiesto")
+    if not all(results.values()):
+        errors.append(f"{sum(not ok for ok in results.values())} miembros ausentes, dañados o con hash distinto")
+    return {
+        'success': not errors,
+        'output': '\n'.join(lines),
+        'error': '; '.join(errors) if errors else None,
+        'members': results,
+    }
+
+
+def extract_member(path: str, name: str, dest_dir: str, key: Optional[bytes] = None) -> str:
+    """
+    Extrae un miembro comprobando su hash mientras se descomprime
+
+    Args:
+        path: Paquete ZIP
+        name: Miembro a extraer
+        dest_dir: Directorio de destino
+        key: Clave de firma (por defecto, AUTOFORENSE_CLAVE_EVIDENCIAS)
+
+    Returns:
+        Ruta del archivo extraído
+
+    Raises:
+        KeyError: Si el miembro no está en el manifiesto
+        ValueError: Si la firma del manifiesto o el hash no coinciden, o si
+            el miembro está dañado o falta en el ZIP
+    """
+    info = read_manifest(path, key)
+    if not info['signature_valid']:
+        raise ValueError("La firma del manifiesto no es válida")
+    expected = {member['name']: member for member in info['manifest']['members']}
+    name = name.replace('\\', '/')
+    if name not in expected:
+        raise KeyError(name)
+
+    target = os.path.join(dest_dir, *name.split('/'))
+    if not os.path.abspath(target).startswith(os.path.abspath(dest_dir) + os.sep):
+        raise ValueError(f"Nombre de miembro no válido: {name}")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    digest = hashlib.sha256()
+    tmp_path = f"{target}.tmp"
+    try:
+        with zipfile.ZipFile(path) as bundle, bundle.open(name) as src, open(tmp_path, 'wb') as dest:
+            while True:
+                chunk = src.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dest.write(chunk)
+    except (KeyError, zipfile.BadZipFile, zlib.error, EOFError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise ValueError(f"El miembro {name} está dañado o falta en el paquete: {e}") from e
+    if digest.hexdigest() != expected[name]['sha256']:
+        os.remove(tmp_path)
+        raise ValueError(f"El hash de {name} no coincide con el manifiesto")
+    os.replace(tmp_path, target)
+    return target
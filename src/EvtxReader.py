@@ -0,0 +1,667 @@
+"""
+Módulo para leer archivos .evtx del Visor de eventos sin Windows (modo sin conexión)
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from BudgetPlanner import SUSPICIOUS_EVENT_IDS, SUSPICIOUS_KEYWORDS
+from ColumnarRecords import ColumnarRecords
+
+logger = logging.getLogger(__name__)
+
+TASK_NAME = 'Get-SuspiciousEvents'
+
+FILE_SIGNATURE = b'ElfFile\0'
+CHUNK_SIGNATURE = b'ElfChnk\0'
+RECORD_SIGNATURE = b'**\0\0'
+FILE_HEADER_SIZE = 4096
+CHUNK_SIZE = 64 * 1024
+CHUNK_HEADER_SIZE = 512
+
+# Bloques de 64 KB que procesa cada tarea del pool (4 MB)
+CHUNKS_PER_TASK = 64
+
+# Nombre de cada nivel tal como lo muestra Get-WinEvent (LevelDisplayName)
+LEVEL_NAMES = {0: 'Information', 1: 'Critical', 2: 'Error', 3: 'Warning', 4: 'Information', 5: 'Verbose'}
+
+# Niveles que Get-SuspiciousEvents considera sospechosos (Critical, Error, Warning)
+SUSPICIOUS_LEVELS = {1, 2, 3}
+
+_KEYWORDS_RE = re.compile('|'.join(map(re.escape, SUSPICIOUS_KEYWORDS)), re.IGNORECASE)
+
+# Las mismas palabras en UTF-16LE y ASCII para descartar registros sobre los
+# bytes sin decodificar (una coincidencia falsa solo obliga a decodificar)
+_RAW_KEYWORDS = tuple(
+    keyword.encode(encoding)
+    for keyword in SUSPICIOUS_KEYWORDS
+    for encoding in ('utf-16-le', 'ascii')
+)
+
+_U16 = struct.Struct('<H').unpack_from
+_U32 = struct.Struct('<I').unpack_from
+_U64 = struct.Struct('<Q').unpack_from
+_RECORD_HEADER = struct.Struct('<4sIQQ').unpack_from
+
+_FILETIME_EPOCH = datetime(1601, 1, 1)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Tipos de valor de BinXML
+_TYPE_NULL = 0x00
+_TYPE_STRING = 0x01
+_TYPE_ANSI = 0x02
+_TYPE_FILETIME = 0x11
+_TYPE_BINXML = 0x21
+_TYPE_ARRAY = 0x80
+
+_NUMBER_FORMATS = {
+    0x03: 'b', 0x04: 'B', 0x05: 'h', 0x06: 'H', 0x07: 'i', 0x08: 'I',
+    0x09: 'q', 0x0a: 'Q', 0x0b: 'f', 0x0c: 'd',
+}
+_HEX_WIDTHS = {0x14: 8, 0x15: 16}
+_ITEM_SIZES = {
+    0x03: 1, 0x04: 1, 0x05: 2, 0x06: 2, 0x07: 4, 0x08: 4, 0x09: 8, 0x0a: 8,
+    0x0b: 4, 0x0c: 8, 0x0d: 4, 0x0f: 16, 0x11: 8, 0x12: 16, 0x14: 4, 0x15: 8,
+}
+_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+# Descriptores de la tabla de sustituciones (tamaño, tipo) por número de valores
+_DESCRIPTOR_STRUCTS: Dict[int, struct.Struct] = {}
+
+# Plantillas ya analizadas en este proceso, por GUID y tamaño
+_PLAN_CACHE: Dict[bytes, '_Plan'] = {}
+
+# Parte de un valor: texto literal o índice de sustitución
+Part = Union[str, int]
+
+
+def filetime_to_text(filetime: int) -> str:
+    """Convierte un FILETIME (intervalos de 100 ns desde 1601, UTC) a 'AAAA-MM-DD HH:MM:SS'"""
+    return (_FILETIME_EPOCH + timedelta(microseconds=filetime // 10)).strftime(TIMESTAMP_FORMAT)
+
+
+def datetime_to_filetime(moment: datetime) -> int:
+    """Convierte una fecha UTC (sin zona horaria) a FILETIME"""
+    return (moment - _FILETIME_EPOCH) // timedelta(microseconds=1) * 10
+
+
+def _decode_item(data: bytes, offset: int, size: int, value_type: int) -> str:
+    """Texto de un valor escalar de BinXML"""
+    if value_type == _TYPE_STRING:
+        return data[offset:offset + size].decode('utf-16-le', 'replace').rstrip('\0')
+    if value_type == _TYPE_NULL or size == 0:
+        return ''
+    if value_type in _NUMBER_FORMATS:
+        return str(struct.unpack_from('<' + _NUMBER_FORMATS[value_type], data, offset)[0])
+    if value_type in _HEX_WIDTHS:
+        width = _HEX_WIDTHS[value_type]
+        return f"0x{int.from_bytes(data[offset:offset + width // 2], 'little'):0{width}x}"
+    if value_type == _TYPE_FILETIME:
+        return filetime_to_text(_U64(data, offset)[0])
+    if value_type == _TYPE_ANSI:
+        return data[offset:offset + size].decode('cp1252', 'replace').rstrip('\0')
+    if value_type == 0x0d:
+        return 'true' if _U32(data, offset)[0] else 'false'
+    if value_type == 0x0f:
+        return '{' + str(uuid.UUID(bytes_le=data[offset:offset + 16])).upper() + '}'
+    if value_type == 0x10:
+        return f"0x{int.from_bytes(data[offset:offset + size], 'little'):0{size * 2}x}"
+    if value_type == 0x12:
+        year, month, _, day, hour, minute, second, _ = struct.unpack_from('<8H', data, offset)
+        return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}"
+    if value_type == 0x13:
+        count = data[offset + 1]
+        authority = int.from_bytes(data[offset + 2:offset + 8], 'big')
+        parts = struct.unpack_from(f'<{count}I', data, offset + 8)
+        return f"S-{data[offset]}-{authority}" + ''.join(f"-{part}" for part in parts)
+    return data[offset:offset + size].hex().upper()
+
+
+def _decode_value(data: bytes, offset: int, size: int, value_type: int) -> str:
+    """Texto de un valor de BinXML (los arrays se unen con comas)"""
+    if not value_type & _TYPE_ARRAY:
+        return _decode_item(data, offset, size, value_type)
+    item_type = value_type & ~_TYPE_ARRAY
+    if item_type == _TYPE_STRING:
+        items = data[offset:offset + size].decode('utf-16-le', 'replace').rstrip('\0').split('\0')
+    elif item_type == _TYPE_ANSI:
+        items = data[offset:offset + size].decode('cp1252', 'replace').rstrip('\0').split('\0')
+    else:
+        step = _ITEM_SIZES.get(item_type, size or 1)
+        items = [
+            _decode_item(data, position, step, item_type)
+            for position in range(offset, offset + size - step + 1, step)
+        ]
+    return ', '.join(items)
+
+
+class _Element:
+    """Elemento de BinXML: nombre, atributos e hijos (elementos o partes de texto)"""
+
+    __slots__ = ('name', 'attributes', 'children')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attributes: Dict[str, List[Part]] = {}
+        self.children: List[Union['_Element', Part]] = []
+
+    def elements(self) -> Iterator['_Element']:
+        return (child for child in self.children if isinstance(child, _Element))
+
+    def text(self) -> List[Part]:
+        return [child for child in self.children if not isinstance(child, _Element)]
+
+    def leaves(self) -> Iterator[Tuple[List[Part], List[Part]]]:
+        """Pares (nombre, valor) de los elementos sin elementos hijos"""
+        children = list(self.elements())
+        if not children:
+            yield [self.name], self.text()
+            return
+        for child in children:
+            yield from child.leaves()
+
+
+class _Plan:
+    """
+    Campos de una plantilla que necesita el registro de Get-SuspiciousEvents
+
+    Cada campo es la lista de partes de su valor (texto literal o índice
+    de sustitución), de modo que cada registro solo decodifica los valores
+    que se usan.
+    """
+
+    __slots__ = ('provider', 'event_id', 'level', 'time', 'channel', 'data', 'literal_keyword')
+
+    def __init__(self, root: _Element):
+        self.provider: List[Part] = []
+        self.event_id: List[Part] = []
+        self.level: List[Part] = []
+        self.time: List[Part] = []
+        self.channel: List[Part] = []
+        self.data: List[Tuple[List[Part], List[Part]]] = []
+
+        for section in root.elements():
+            if section.name == 'System':
+                for field in section.elements():
+                    if field.name == 'Provider':
+                        self.provider = field.attributes.get('Name', [])
+                    elif field.name == 'EventID':
+                        self.event_id = field.text()
+                    elif field.name == 'Level':
+                        self.level = field.text()
+                    elif field.name == 'TimeCreated':
+                        self.time = field.attributes.get('SystemTime', [])
+                    elif field.name == 'Channel':
+                        self.channel = field.text()
+            elif section.name == 'EventData':
+                for child in section.children:
+                    if isinstance(child, _Element):
+                        self.data.append((child.attributes.get('Name', []), child.text()))
+                    else:
+                        self.data.append(([], [child]))
+            elif section.name == 'UserData':
+                for child in section.children:
+                    if isinstance(child, _Element):
+                        self.data.extend(child.leaves())
+                    else:
+                        self.data.append(([], [child]))
+
+        # Si el texto fijo de la plantilla ya contiene una palabra clave,
+        # todos sus registros pasan el filtro
+        literals = [
+            part
+            for parts in [self.provider] + [part for pair in self.data for part in pair]
+            for part in parts if isinstance(part, str)
+        ]
+        self.literal_keyword = bool(_KEYWORDS_RE.search(' '.join(literals)))
+
+
+class _Substitutions:
+    """Valores de sustitución de una instancia de plantilla"""
+
+    __slots__ = ('chunk', 'offsets', 'sizes', 'types')
+
+    def __init__(self, chunk: '_Chunk', position: int = 0, count: int = 0):
+        self.chunk = chunk
+        if not count:
+            self.offsets, self.sizes, self.types = [position], (), ()
+            return
+        descriptors = _DESCRIPTOR_STRUCTS.get(count)
+        if descriptors is None:
+            descriptors = _DESCRIPTOR_STRUCTS[count] = struct.Struct('<' + 'HBx' * count)
+        values = descriptors.unpack_from(chunk.data, position)
+        self.sizes = values[0::2]
+        self.types = values[1::2]
+        self.offsets = list(accumulate(self.sizes, initial=position + 4 * count))
+
+    def raw(self) -> bytes:
+        """Bytes de todos los valores, sin decodificar"""
+        return self.chunk.data[self.offsets[0]:self.offsets[-1]]
+
+    def has_binxml(self) -> bool:
+        return _TYPE_BINXML in self.types
+
+    def pairs(self, index: int) -> Optional[List[Tuple[str, str]]]:
+        """Pares (nombre, valor) si el valor es un fragmento BinXML incrustado"""
+        if index >= len(self.types) or self.types[index] != _TYPE_BINXML:
+            return None
+        return self.chunk.fragment_pairs(self.offsets[index])
+
+    def text(self, index: int) -> str:
+        if index >= len(self.types):
+            return ''
+        if self.types[index] == _TYPE_BINXML:
+            return ' '.join(f"{name}: {value}" for name, value in self.pairs(index) if value)
+        return _decode_value(self.chunk.data, self.offsets[index], self.sizes[index], self.types[index])
+
+    def resolve(self, parts: List[Part]) -> str:
+        """Texto de una lista de partes"""
+        if len(parts) == 1:
+            part = parts[0]
+            return part if isinstance(part, str) else self.text(part)
+        return ''.join(part if isinstance(part, str) else self.text(part) for part in parts)
+
+
+class _Chunk:
+    """Analizador de BinXML de un bloque de 64 KB"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._names: Dict[int, str] = {}
+        self._plans: Dict[int, _Plan] = {}
+
+    def _name(self, start: int, field: int, end: int) -> Tuple[str, int]:
+        """
+        Lee la referencia al nombre de un nodo
+
+        Los nombres se guardan una vez por bloque; si el desplazamiento
+        apunta más allá del inicio del nodo, el nombre está en línea justo
+        después de la cabecera del nodo y hay que saltarlo.
+
+        Args:
+            start: Inicio del nodo
+            field: Posición del desplazamiento del nombre
+            end: Fin de la cabecera del nodo
+
+        Returns:
+            Tupla (nombre, posición siguiente)
+        """
+        offset = _U32(self.data, field)[0]
+        length = _U16(self.data, offset + 6)[0]
+        name = self._names.get(offset)
+        if name is None:
+            name = self._names[offset] = self.data[offset + 8:offset + 8 + 2 * length].decode('utf-16-le', 'replace')
+        if offset > start:
+            end += 10 + 2 * length
+        return name, end
+
+    def _value(self, position: int) -> Tuple[Part, int]:
+        """Lee un nodo de valor (texto, sustitución, CDATA o referencia)"""
+        data = self.data
+        token = data[position] & 0xbf
+        if token == 0x05:
+            length = _U16(data, position + 2)[0]
+            end = position + 4 + 2 * length
+            return data[position + 4:end].decode('utf-16-le', 'replace'), end
+        if token in (0x0d, 0x0e):
+            return _U16(data, position + 1)[0], position + 4
+        if token == 0x07:
+            length = _U16(data, position + 1)[0]
+            end = position + 3 + 2 * length
+            return data[position + 3:end].decode('utf-16-le', 'replace'), end
+        if token == 0x08:
+            return chr(_U16(data, position + 1)[0]), position + 3
+        if token == 0x09:
+            name, end = self._name(position, position + 1, position + 5)
+            return _ENTITIES.get(name, ''), end
+        raise ValueError(f"Token de valor BinXML desconocido: 0x{data[position]:02x}")
+
+    def _element(self, position: int) -> Tuple[_Element, int]:
+        """Lee un elemento completo (apertura, atributos, contenido y cierre)"""
+        data = self.data
+        # Token, dependencia, tamaño, nombre y, si hay atributos, tamaño de la lista
+        header = 15 if data[position] & 0x40 else 11
+        name, position = self._name(position, position + 7, position + header)
+        element = _Element(name)
+
+        while data[position] & 0xbf == 0x06:
+            attribute, position = self._name(position, position + 1, position + 5)
+            value, position = self._value(position)
+            element.attributes[attribute] = [value]
+
+        token = data[position]
+        position += 1
+        if token == 0x02:
+            position = self._content(position, element.children)
+        elif token != 0x03:
+            raise ValueError(f"Cierre de elemento BinXML inesperado: 0x{token:02x}")
+        return element, position
+
+    def _content(self, position: int, children: list) -> int:
+        """Lee el contenido de un elemento hasta su cierre"""
+        data = self.data
+        while True:
+            token = data[position] & 0xbf
+            if token == 0x01:
+                child, position = self._element(position)
+                children.append(child)
+            elif token == 0x04:
+                return position + 1
+            elif token == 0x00:
+                return position
+            elif token == 0x0a:
+                _, position = self._name(position, position + 1, position + 5)
+            elif token == 0x0b:
+                position += 3 + 2 * _U16(data, position + 1)[0]
+            else:
+                value, position = self._value(position)
+                children.append(value)
+
+    def _plan(self, offset: int) -> _Plan:
+        """Plan de la plantilla definida en el desplazamiento indicado"""
+        plan = self._plans.get(offset)
+        if plan is None:
+            key = self.data[offset + 4:offset + 24]
+            plan = _PLAN_CACHE.get(key)
+            if plan is None:
+                position = offset + 24
+                if self.data[position] == 0x0f:
+                    position += 4
+                root, _ = self._element(position)
+                plan = _PLAN_CACHE[key] = _Plan(root)
+            self._plans[offset] = plan
+        return plan
+
+    def fragment(self, position: int) -> Tuple[_Plan, _Substitutions]:
+        """
+        Lee un fragmento BinXML
+
+        Returns:
+            Tupla (plan de la plantilla, valores de sustitución)
+        """
+        data = self.data
+        if data[position] == 0x0f:
+            position += 4
+        if data[position] != 0x0c:
+            root, _ = self._element(position)
+            return _Plan(root), _Substitutions(self)
+
+        offset = _U32(data, position + 6)[0]
+        position += 10
+        plan = self._plan(offset)
+        if offset == position:
+            # Definición de la plantilla en línea (primera vez en el bloque)
+            position += 24 + _U32(data, position + 20)[0]
+        return plan, _Substitutions(self, position + 4, _U32(data, position)[0])
+
+    def fragment_pairs(self, position: int) -> List[Tuple[str, str]]:
+        """Pares (nombre, valor) de un fragmento BinXML incrustado en un valor"""
+        data = self.data
+        if data[position] == 0x0f:
+            position += 4
+        if data[position] == 0x0c:
+            plan, values = self.fragment(position)
+            return plan_pairs(plan, values)
+        root, _ = self._element(position)
+        values = _Substitutions(self)
+        return [(values.resolve(name), values.resolve(value)) for name, value in root.leaves()]
+
+
+def plan_pairs(plan: _Plan, values: _Substitutions) -> List[Tuple[str, str]]:
+    """Pares (nombre, valor) de los datos del evento"""
+    pairs = []
+    for name, value in plan.data:
+        nested = values.pairs(value[0]) if len(value) == 1 and isinstance(value[0], int) else None
+        if nested is not None:
+            pairs.extend(nested)
+        else:
+            pairs.append((values.resolve(name), values.resolve(value)))
+    return pairs
+
+
+def _message(plan: _Plan, values: _Substitutions) -> str:
+    """
+    Mensaje del evento a partir de sus datos
+
+    Los textos descriptivos de cada evento están en las DLL de mensajes del
+    proveedor, que no se incluyen en el .evtx; el mensaje se compone con el
+    proveedor y los pares nombre/valor de EventData o UserData.
+    """
+    provider = values.resolve(plan.provider)
+    data = '; '.join(
+        f"{name}={value}" if name else value
+        for name, value in plan_pairs(plan, values) if value
+    )
+    message = f"[{provider}] {data}" if provider else data
+    return message.replace('\r\n', ' ').replace('\n', ' ')
+
+
+def _as_int(text: str) -> Optional[int]:
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def parse_chunk(
+    data: bytes,
+    min_record: int = 0,
+    start_filetime: int = 0,
+    suspicious_only: bool = True
+) -> List[Dict[str, object]]:
+    """
+    Lee los eventos de un bloque de 64 KB
+
+    Los bloques son independientes (cada uno tiene sus propias tablas de
+    nombres y plantillas), por eso se pueden procesar en paralelo.
+
+    Args:
+        data: Bytes del bloque
+        min_record: Número de registro mínimo (para limitar a los N más recientes)
+        start_filetime: Solo eventos escritos a partir de este FILETIME
+        suspicious_only: Aplicar los filtros de Get-SuspiciousEvents
+
+    Returns:
+        Registros del bloque, del más reciente al más antiguo
+    """
+    if data[:8] != CHUNK_SIGNATURE:
+        return []
+    chunk = _Chunk(data)
+    end = _U32(data, 48)[0]
+    end = end if CHUNK_HEADER_SIZE < end <= len(data) else len(data)
+    records = []
+    position = CHUNK_HEADER_SIZE
+    while position + 28 <= end:
+        signature, size, record_id, written = _RECORD_HEADER(data, position)
+        if signature != RECORD_SIGNATURE or size < 28 or position + size > len(data):
+            break
+        if record_id >= min_record and written >= start_filetime:
+            try:
+                record = _parse_event(chunk, position + 24, written, suspicious_only)
+            except (IndexError, KeyError, ValueError, struct.error) as e:
+                logger.debug(f"Registro {record_id} dañado: {e}")
+                record = None
+            if record is not None:
+                records.append(record)
+        position += size
+    records.reverse()
+    return records
+
+
+def _parse_event(
+    chunk: _Chunk,
+    position: int,
+    written: int,
+    suspicious_only: bool
+) -> Optional[Dict[str, object]]:
+    """Convierte un evento en el registro de Get-SuspiciousEvents (o None si no pasa el filtro)"""
+    plan, values = chunk.fragment(position)
+    event_id = _as_int(values.resolve(plan.event_id))
+    level = _as_int(values.resolve(plan.level) or '0')
+    suspicious = event_id in SUSPICIOUS_EVENT_IDS or level in SUSPICIOUS_LEVELS
+
+    if suspicious_only and not suspicious and not plan.literal_keyword:
+        # Descarte rápido: ninguna palabra clave en los bytes de los valores
+        # (bytes.lower() solo cambia letras ASCII, así que no se pierde ninguna)
+        raw = values.raw().lower()
+        if not values.has_binxml() and not any(keyword in raw for keyword in _RAW_KEYWORDS):
+            return None
+    message = _message(plan, values)
+    if suspicious_only and not suspicious and not _KEYWORDS_RE.search(message):
+        return None
+
+    time_created = values.resolve(plan.time)
+    if 'T' in time_created:
+        # SystemTime como texto ISO (2024-01-01T10:00:00.000000000Z)
+        time_created = time_created[:19].replace('T', ' ')
+    return {
+        'LogName': values.resolve(plan.channel),
+        'TimeCreated': time_created or filetime_to_text(written),
+        'Id': event_id,
+        'LevelDisplayName': LEVEL_NAMES.get(level, str(level)),
+        'Message': message,
+    }
+
+
+def scan_chunks(path: str) -> List[Tuple[int, int, int]]:
+    """
+    Localiza los bloques válidos de un archivo .evtx
+
+    Solo se leen las cabeceras (una página por bloque).
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        Lista de (desplazamiento, primer registro, último registro)
+
+    Raises:
+        ValueError: Si el archivo no es un registro de eventos
+    """
+    chunks = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < FILE_HEADER_SIZE:
+            raise ValueError(f"{path} no es un archivo .evtx")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:8] != FILE_SIGNATURE:
+                raise ValueError(f"{path} no es un archivo .evtx")
+            for offset in range(FILE_HEADER_SIZE, len(mapped) - CHUNK_SIZE + 1, CHUNK_SIZE):
+                if mapped[offset:offset + 8] == CHUNK_SIGNATURE:
+                    first, last = struct.unpack_from('<QQ', mapped, offset + 8)
+                    chunks.append((offset, first, last))
+    return chunks
+
+
+def _parse_chunks(
+    path: str,
+    offsets: List[int],
+    min_record: int,
+    start_filetime: int,
+    suspicious_only: bool
+) -> ColumnarRecords:
+    """
+    Lee varios bloques del archivo mapeado en memoria (se ejecuta en los
+    procesos del pool; el resultado compacto es barato de devolver)
+    """
+    records = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for offset in offsets:
+            records.extend(
+                parse_chunk(mapped[offset:offset + CHUNK_SIZE], min_record, start_filetime, suspicious_only)
+            )
+    return ColumnarRecords.from_records(records, task_name=TASK_NAME)
+
+
+def iter_evtx_blocks(
+    path: str,
+    max_events: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    suspicious_only: bool = True,
+    workers: Optional[int] = None,
+    chunks_per_task: int = CHUNKS_PER_TASK
+) -> Iterator[ColumnarRecords]:
+    """
+    Lee un .evtx por grupos de bloques en paralelo, del evento más reciente
+    al más antiguo (como Get-WinEvent)
+
+    Como mucho hay 2 tareas por proceso en vuelo, de modo que la memoria
+    usada no depende del tamaño del archivo.
+
+    Args:
+        path: Ruta del archivo
+        max_events: Leer solo los N eventos más recientes antes de filtrar
+            (como -MaxEvents de Get-SuspiciousEvents)
+        start_time: Solo eventos a partir de esta fecha (UTC)
+        suspicious_only: Aplicar los filtros de Get-SuspiciousEvents
+        workers: Procesos a usar (por defecto, núcleos disponibles; 1 para
+            leer en el proceso actual)
+        chunks_per_task: Bloques de 64 KB por tarea
+
+    Returns:
+        Iterador de contenedores, uno por grupo de bloques
+    """
+    chunks = scan_chunks(path)
+    # Los registros circulares reutilizan los bloques: se ordenan por número de registro
+    chunks.sort(key=lambda chunk: chunk[2], reverse=True)
+    min_record = 0
+    if max_events and chunks:
+        min_record = chunks[0][2] - max_events + 1
+        chunks = [chunk for chunk in chunks if chunk[2] >= min_record]
+    start_filetime = datetime_to_filetime(start_time) if start_time else 0
+
+    offsets = [chunk[0] for chunk in chunks]
+    groups = [offsets[i:i + chunks_per_task] for i in range(0, len(offsets), chunks_per_task)]
+    args = (min_record, start_filetime, suspicious_only)
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(groups) <= 1:
+        for group in groups:
+            yield _parse_chunks(path, group, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = []
+        for group in groups:
+            in_flight.append(pool.submit(_parse_chunks, path, group, *args))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
+
+
+def load_evtx(
+    path: str,
+    max_events: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    suspicious_only: bool = True,
+    workers: Optional[int] = None
+) -> ColumnarRecords:
+    """
+    Importa un .evtx como los registros de Get-SuspiciousEvents
+
+    Args:
+        path: Ruta del archivo (System.evtx, Security.evtx, Application.evtx...)
+        max_events: Leer solo los N eventos más recientes antes de filtrar
+        start_time: Solo eventos a partir de esta fecha (UTC)
+        suspicious_only: Aplicar los filtros de Get-SuspiciousEvents
+        workers: Procesos a usar en el parseo
+
+    Returns:
+        Contenedor con las columnas del recolector en vivo (LogName,
+        TimeCreated en UTC, Id, LevelDisplayName y Message compuesto con los
+        datos del evento)
+
+    Raises:
+        ValueError: Si el archivo no es un registro de eventos
+    """
+    records = ColumnarRecords(task_name=TASK_NAME)
+    for block in iter_evtx_blocks(path, max_events, start_time, suspicious_only, workers):
+        records.merge(block)
+    return records
@@ -0,0 +1,325 @@
+"""
+Módulo para enriquecer direcciones IP con ASN, organización y país (sin conexión)
+"""
+import bisect
+import csv
+import functools
+import itertools
+import ipaddress
+import logging
+import mmap
+import os
+import socket
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ColumnarRecords import ColumnarRecords
+
+logger = logging.getLogger(__name__)
+
+# Base de datos por defecto (AUTOFORENSE_GEO para cambiarla)
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'geo_asn.db')
+
+# Cabecera: firma, rangos IPv4, rangos IPv6, entradas de información, bytes de texto
+_MAGIC = b'AFGEO02\0'
+_HEADER = struct.Struct('<8sIIII')
+
+# Entradas del índice de primer nivel de IPv4 (una por /16)
+_V4_BUCKETS = 1 << 16
+
+
+def _sections(v4_count: int, v6_count: int, info_count: int) -> List[Tuple[str, str, int]]:
+    """Orden, tipo y número de elementos de cada sección del archivo"""
+    return [
+        ('v4_index', 'I', _V4_BUCKETS + 1),
+        ('v4_starts', 'I', v4_count),
+        ('v4_ends', 'I', v4_count),
+        ('v4_infos', 'I', v4_count),
+        ('v6_starts_hi', 'Q', v6_count),
+        ('v6_starts_lo', 'Q', v6_count),
+        ('v6_ends_hi', 'Q', v6_count),
+        ('v6_ends_lo', 'Q', v6_count),
+        ('v6_infos', 'I', v6_count),
+        ('info_offsets', 'I', info_count + 1),
+    ]
+
+
+def _parse_range(first: str, second: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """Devuelve (versión, inicio, fin) de un rango 'inicio fin' o CIDR"""
+    try:
+        if '/' in first:
+            network = ipaddress.ip_network(first, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        start, end = ipaddress.ip_address(first), ipaddress.ip_address(second)
+    except (TypeError, ValueError):
+        return None
+    if start.version != end.version:
+        return None
+    return start.version, int(start), int(end)
+
+
+def _source_rows(f) -> Iterator[List[str]]:
+    """
+    Campos de cada línea del volcado (TSV de ip2asn o CSV con comillas)
+
+    El separador se deduce de la primera línea con datos. El CSV se lee con
+    el módulo csv para respetar las comas dentro de campos entre comillas
+    ("Private, test"); el TSV se separa tal cual.
+    """
+    lines = (line for line in f if line.strip() and not line.startswith('#'))
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain((first,), lines)
+    if '\t' in first:
+        for line in lines:
+            yield [field.strip().strip('"') for field in line.rstrip('\r\n').split('\t')]
+        return
+    for row in csv.reader(lines):
+        yield [field.strip() for field in row]
+
+
+def build_database(source_path: str, db_path: str = DEFAULT_DB_PATH) -> int:
+    """
+    Construye la base de rangos a partir de un volcado de texto
+
+    Acepta el formato de ip2asn (TSV: inicio, fin, ASN, país, organización)
+    y CSV con las mismas columnas o con un rango CIDR en lugar de inicio y
+    fin. Los rangos con ASN 0 (no anunciados) se descartan.
+
+    Args:
+        source_path: Archivo de origen (.tsv o .csv)
+        db_path: Archivo binario a generar
+
+    Returns:
+        Número de rangos guardados
+    """
+    infos: Dict[Tuple[int, str, str], int] = {}
+    ranges = {4: [], 6: []}
+    with open(source_path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        for fields in _source_rows(f):
+            if not fields:
+                continue
+            if '/' in fields[0]:
+                fields.insert(1, None)
+            if len(fields) < 5:
+                continue
+            parsed = _parse_range(fields[0], fields[1])
+            asn = fields[2].upper().lstrip('AS')
+            if parsed is None or not asn.isdigit() or int(asn) == 0:
+                continue
+            version, start, end = parsed
+            key = (int(asn), fields[3].upper()[:2], fields[4])
+            info = infos.setdefault(key, len(infos))
+            ranges[version].append((start, end, info))
+
+    for version in ranges:
+        ranges[version].sort()
+
+    text = bytearray()
+    offsets = array('I', [0])
+    for asn, country, org in infos:
+        text += f"{asn}\t{country}\t{org}".encode('utf-8')
+        offsets.append(len(text))
+
+    mask64 = (1 << 64) - 1
+    v4, v6 = ranges[4], ranges[6]
+    v4_starts = array('I', (item[0] for item in v4))
+    # Primer rango que empieza en cada /16 o después: acota la búsqueda binaria
+    v4_index = array('I', (bisect.bisect_left(v4_starts, bucket << 16) for bucket in range(_V4_BUCKETS)))
+    v4_index.append(len(v4))
+    data = {
+        'v4_index': v4_index,
+        'v4_starts': v4_starts,
+        'v4_ends': array('I', (item[1] for item in v4)),
+        'v4_infos': array('I', (item[2] for item in v4)),
+        'v6_starts_hi': array('Q', (item[0] >> 64 for item in v6)),
+        'v6_starts_lo': array('Q', (item[0] & mask64 for item in v6)),
+        'v6_ends_hi': array('Q', (item[1] >> 64 for item in v6)),
+        'v6_ends_lo': array('Q', (item[1] & mask64 for item in v6)),
+        'v6_infos': array('I', (item[2] for item in v6)),
+        'info_offsets': offsets,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    tmp_path = f"{db_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(v4), len(v6), len(infos), len(text)))
+        for name, _, _ in _sections(len(v4), len(v6), len(infos)):
+            values = data[name]
+            # El archivo se guarda siempre en little-endian
+            if struct.pack('=I', 1) != struct.pack('<I', 1):
+                values.byteswap()
+            f.write(values.tobytes())
+        f.write(text)
+    os.replace(tmp_path, db_path)
+    logger.info(f"Base de ASN generada: {len(v4)} rangos IPv4, {len(v6)} rangos IPv6")
+    return len(v4) + len(v6)
+
+
+class _Uint128View:
+    """Secuencia de enteros de 128 bits formada por dos vistas de 64 bits"""
+
+    __slots__ = ('hi', 'lo')
+
+    def __init__(self, hi: memoryview, lo: memoryview):
+        self.hi = hi
+        self.lo = lo
+
+    def __len__(self) -> int:
+        return len(self.hi)
+
+    def __getitem__(self, position: int) -> int:
+        return (self.hi[position] << 64) | self.lo[position]
+
+
+class GeoDatabase:
+    """
+    Base de rangos IP -> (ASN, país, organización) mapeada en memoria
+
+    Los rangos no se solapan (como en ip2asn) y sus inicios están ordenados,
+    así que se consultan con búsqueda binaria directamente sobre el archivo
+    mapeado, sin cargarlo; varios procesos que abren la misma base
+    comparten las mismas páginas. En IPv4, un índice por /16 reduce la
+    búsqueda a los pocos rangos de ese bloque.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Abre la base de datos
+
+        Args:
+            db_path: Archivo generado por build_database (por defecto, AUTOFORENSE_GEO)
+
+        Raises:
+            OSError: Si el archivo no existe
+            ValueError: Si el archivo no es una base válida
+        """
+        self.db_path = db_path or os.getenv('AUTOFORENSE_GEO') or DEFAULT_DB_PATH
+        if struct.pack('=I', 1) != struct.pack('<I', 1):
+            raise ValueError("La base de ASN solo se puede mapear en sistemas little-endian")
+
+        with open(self.db_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, v4_count, v6_count, info_count, text_size = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{self.db_path} no es una base de ASN válida")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._views: Dict[str, memoryview] = {}
+        for name, kind, count in _sections(v4_count, v6_count, info_count):
+            size = count * struct.calcsize(kind)
+            self._views[name] = view[offset:offset + size].cast(kind)
+            offset += size
+        self._text = view[offset:offset + text_size]
+        self._v4_index = self._views['v4_index']
+        self._v4_starts = self._views['v4_starts']
+        self._v4_ends = self._views['v4_ends']
+        self._v4_infos = self._views['v4_infos']
+        self._v6_starts = _Uint128View(self._views['v6_starts_hi'], self._views['v6_starts_lo'])
+        self._v6_ends = _Uint128View(self._views['v6_ends_hi'], self._views['v6_ends_lo'])
+        self.ranges = v4_count + v6_count
+
+    @functools.lru_cache(maxsize=65536)
+    def _info(self, index: int) -> Tuple[int, str, str]:
+        offsets = self._views['info_offsets']
+        asn, country, org = bytes(self._text[offsets[index]:offsets[index + 1]]).decode('utf-8').split('\t', 2)
+        return int(asn), country, org
+
+    def lookup(self, address: str) -> Optional[Tuple[int, str, str]]:
+        """
+        Busca la dirección en la base
+
+        Args:
+            address: Dirección IPv4 o IPv6
+
+        Returns:
+            Tupla (ASN, país, organización) o None si no está anunciada
+        """
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big')
+        except OSError:
+            return self._lookup_v6(address)
+
+        bucket = value >> 16
+        position = bisect.bisect_right(
+            self._v4_starts, value, self._v4_index[bucket], self._v4_index[bucket + 1]
+        ) - 1
+        if position < 0 or value > self._v4_ends[position]:
+            return None
+        return self._info(self._v4_infos[position])
+
+    def _lookup_v6(self, address: str) -> Optional[Tuple[int, str, str]]:
+        try:
+            parsed = ipaddress.ip_address(address.strip('[]'))
+        except ValueError:
+            return None
+        if parsed.version == 6 and parsed.ipv4_mapped is not None:
+            return self.lookup(str(parsed.ipv4_mapped))
+        if parsed.version != 6:
+            return None
+        value = int(parsed)
+        position = bisect.bisect_right(self._v6_starts, value) - 1
+        if position < 0 or value > self._v6_ends[position]:
+            return None
+        return self._info(self._views['v6_infos'][position])
+
+    def close(self):
+        """Libera el mapeo del archivo"""
+        self._info.cache_clear()
+        for view in self._views.values():
+            view.release()
+        self._text.release()
+        self._mmap.close()
+
+
+def add_geo_info(
+    records: ColumnarRecords,
+    database: GeoDatabase,
+    column: str = 'RemoteAddress'
+) -> ColumnarRecords:
+    """
+    Agrega las columnas RemoteAS y RemoteCountry a los registros
+
+    El nombre de cada organización se guarda como tabla auxiliar de la
+    columna RemoteAS para que el prompt lo incluya una sola vez.
+
+    Args:
+        records: Registros con columna de direcciones
+        database: Base de ASN abierta
+        column: Columna con la dirección IP
+
+    Returns:
+        Nuevo contenedor con las columnas agregadas (vacías si la dirección
+        es privada o no está en la base)
+    """
+    if column not in records.columns:
+        return records
+
+    schema = dict(records.schema)
+    schema['RemoteAS'] = 'cat'
+    schema['RemoteCountry'] = 'cat'
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    organizations = {}
+    cache = {}
+
+    for record in records.iter_records():
+        address = record.get(column)
+        if address not in cache:
+            cache[address] = database.lookup(address) if address else None
+        info = cache[address]
+        if info is None:
+            record['RemoteAS'] = record['RemoteCountry'] = None
+        else:
+            asn, country, org = info
+            record['RemoteAS'] = f"AS{asn}"
+            record['RemoteCountry'] = country or None
+            organizations[record['RemoteAS']] = org
+        result.append(record)
+
+    result.lookup_tables['RemoteAS'] = organizations
+    return result
@@ -0,0 +1,404 @@
+"""
+Módulo para cotejar los registros recolectados con listas de indicadores (IOC)
+"""
+import fnmatch
+import ipaddress
+import logging
+import os
+import re
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ColumnarRecords import ColumnarRecords
+
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto de las listas de indicadores (AUTOFORENSE_IOCS para cambiarlo)
+DEFAULT_FEED_DIR = os.path.join(os.path.dirname(__file__), 'iocs')
+
+# Extensiones de archivo que se cargan como listas
+FEED_EXTENSIONS = ('.txt', '.csv', '.ioc')
+
+# Longitudes de hash reconocidas (MD5, SHA-1, SHA-256)
+HASH_LENGTHS = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+
+# Columnas de los registros que se cotejan y el tipo de indicador de cada una
+RECORD_FIELDS = {
+    'RemoteAddress': 'ip',
+    'Path': 'path',
+    'SHA256': 'hash',
+    'SHA1': 'hash',
+    'MD5': 'hash',
+}
+
+# Patrones de ruta por expresión regular compilada
+PATTERNS_PER_REGEX = 500
+
+_HEX_RE = re.compile(r'^[0-9a-fA-F]+$')
+
+
+def normalize_path(path: str) -> str:
+    """Normaliza una ruta de Windows para compararla (minúsculas y '\\')"""
+    return path.strip().strip('"').replace('/', '\\').lower()
+
+
+def _parse_ip(text: str) -> Optional[Tuple[int, int]]:
+    """Devuelve (versión, entero) de una dirección IP o None"""
+    text = text.strip().strip('[]')
+    # Camino rápido para IPv4 (la mayoría de indicadores y conexiones)
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big')
+    except OSError:
+        pass
+    try:
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version, int(address)
+
+
+def _parse_network(text: str) -> Optional[Tuple[int, int, int]]:
+    """Devuelve (versión, prefijo, red) de un rango CIDR o None"""
+    address, _, prefix = text.partition('/')
+    parsed = _parse_ip(address)
+    if parsed is None or not prefix.isdigit():
+        return None
+    version, value = parsed
+    bits = 32 if version == 4 else 128
+    prefix = int(prefix)
+    if prefix > bits:
+        return None
+    return version, prefix, value & _mask(prefix, bits)
+
+
+def _mask(prefix: int, bits: int) -> int:
+    return ((1 << prefix) - 1) << (bits - prefix) if prefix else 0
+
+
+def _literal_key(pattern: str) -> Optional[str]:
+    """
+    Componente de ruta sin comodines más largo de un patrón
+
+    Cualquier ruta que cumpla el patrón contiene ese componente completo,
+    así que sirve de clave para descartar patrones sin evaluarlos.
+    """
+    literals = [part for part in pattern.split('\\') if part and not any(char in part for char in '*?[')]
+    return max(literals, key=len) if literals else None
+
+
+class FeedIndex:
+    """
+    Índices de una lista de indicadores
+
+    - Direcciones IP y hashes: conjuntos (búsqueda exacta).
+    - Rangos CIDR: un diccionario por longitud de prefijo; una dirección se
+      busca enmascarándola con cada longitud presente (a lo sumo 33 o 129
+      consultas, normalmente unas pocas).
+    - Rutas: conjunto de rutas completas, conjunto de nombres de archivo y
+      patrones con comodines. Los patrones con algún componente literal
+      (p. ej. 'malo.exe' en '*\\temp\\malo.exe') se agrupan por ese
+      componente y solo se compilan y evalúan si la ruta lo contiene; el
+      resto se compila en unas pocas expresiones regulares combinadas.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ips: Dict[Tuple[int, int], str] = {}
+        self.networks: Dict[Tuple[int, int], Dict[int, str]] = {}
+        self.hashes: Dict[str, str] = {}
+        self.paths: Dict[str, str] = {}
+        self.file_names: Dict[str, str] = {}
+        self._patterns: List[Tuple[str, str]] = []
+        self._patterns_by_part: Dict[str, List[List[Any]]] = {}
+        self._regexes: List[Tuple[Any, List[Tuple[Any, str]]]] = []
+        self._networks_sorted: List[Tuple[Tuple[int, int], Dict[int, str]]] = []
+
+    def add(self, indicator: str, comment: str = ''):
+        """Agrega un indicador detectando su tipo"""
+        label = f"{indicator} ({comment})" if comment else indicator
+        text = indicator.strip()
+
+        if '/' in text and '\\' not in text:
+            network = _parse_network(text)
+            if network is not None:
+                version, prefix, value = network
+                self.networks.setdefault((version, prefix), {})[value] = label
+                return
+
+        parsed = _parse_ip(text)
+        if parsed is not None:
+            self.ips[parsed] = label
+            return
+
+        if len(text) in HASH_LENGTHS and _HEX_RE.match(text):
+            self.hashes[text.lower()] = label
+            return
+
+        path = normalize_path(text)
+        if any(char in path for char in '*?['):
+            self._patterns.append((path, label))
+        elif '\\' in path:
+            self.paths[path] = label
+        else:
+            self.file_names[path] = label
+
+    def compile(self):
+        """Prepara los índices para las consultas (se llama tras cargar la lista)"""
+        # Del prefijo más específico al más general
+        self._networks_sorted = sorted(self.networks.items(), key=lambda item: -item[0][1])
+
+        self._patterns_by_part = {}
+        general = []
+        for pattern, label in self._patterns:
+            key = _literal_key(pattern)
+            if key is None:
+                general.append((pattern, label))
+            else:
+                # [patrón, descripción, expresión compilada al primer uso]
+                self._patterns_by_part.setdefault(key, []).append([pattern, label, None])
+
+        self._regexes = []
+        for start in range(0, len(general), PATTERNS_PER_REGEX):
+            chunk = general[start:start + PATTERNS_PER_REGEX]
+            compiled = [(re.compile(fnmatch.translate(pattern)), label) for pattern, label in chunk]
+            combined = re.compile('|'.join(f"(?:{fnmatch.translate(pattern)})" for pattern, _ in chunk))
+            self._regexes.append((combined, compiled))
+
+    def __len__(self) -> int:
+        return (
+            len(self.ips) + sum(len(table) for table in self.networks.values())
+            + len(self.hashes) + len(self.paths) + len(self.file_names) + len(self._patterns)
+        )
+
+    def match_ip(self, parsed: Tuple[int, int]) -> Optional[str]:
+        label = self.ips.get(parsed)
+        if label is not None:
+            return label
+        version, value = parsed
+        bits = 32 if version == 4 else 128
+        for (net_version, prefix), table in self._networks_sorted:
+            if net_version != version:
+                continue
+            label = table.get(value & _mask(prefix, bits))
+            if label is not None:
+                return label
+        return None
+
+    def match_hash(self, digest: str) -> Optional[str]:
+        return self.hashes.get(digest.lower())
+
+    def match_path(self, path: str) -> Optional[str]:
+        normalized = normalize_path(path)
+        label = self.paths.get(normalized)
+        if label is not None:
+            return label
+        file_name = normalized.rsplit('\\', 1)[-1]
+        label = self.file_names.get(file_name)
+        if label is not None:
+            return label
+        for part in set(normalized.split('\\')):
+            for entry in self._patterns_by_part.get(part, ()):
+                if entry[2] is None:
+                    entry[2] = re.compile(fnmatch.translate(entry[0]))
+                if entry[2].match(normalized):
+                    return entry[1]
+        for combined, compiled in self._regexes:
+            if combined.match(normalized):
+                for regex, label in compiled:
+                    if regex.match(normalized):
+                        return label
+        return None
+
+
+def load_feed(path: str) -> FeedIndex:
+    """
+    Carga una lista de indicadores
+
+    Una línea por indicador (IP, rango CIDR, hash MD5/SHA-1/SHA-256, ruta
+    o patrón de ruta con comodines). Lo que sigue a un tabulador o a ' #'
+    se guarda como descripción; las líneas que empiezan por '#' se ignoran.
+    En archivos .csv se usa la primera columna.
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        Índices de la lista
+    """
+    feed = FeedIndex(os.path.basename(path))
+    is_csv = path.lower().endswith('.csv')
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            comment = ''
+            if is_csv:
+                fields = [field.strip().strip('"') for field in line.split(',')]
+                line, comment = fields[0], ' '.join(fields[1:2])
+            elif '\t' in line:
+                line, comment = line.split('\t', 1)
+            elif ' #' in line:
+                line, comment = line.split(' #', 1)
+            if line:
+                feed.add(line, comment.strip())
+    feed.compile()
+    return feed
+
+
+class IocMatcher:
+    """
+    Motor local de indicadores de compromiso
+
+    Cada lista del directorio se indexa por separado. refresh() solo vuelve
+    a cargar las listas nuevas o modificadas y sustituye el conjunto de
+    índices de una vez, así que las consultas en curso nunca ven un índice
+    a medio construir.
+    """
+
+    def __init__(self, feed_dir: Optional[str] = None):
+        """
+        Inicializa el motor y carga las listas
+
+        Args:
+            feed_dir: Directorio de listas (por defecto, AUTOFORENSE_IOCS o src/iocs)
+        """
+        self.feed_dir = feed_dir or os.getenv('AUTOFORENSE_IOCS') or DEFAULT_FEED_DIR
+        self._feeds: Dict[str, Tuple[Tuple[int, int], FeedIndex]] = {}
+        self._refresh_lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Recarga las listas que cambiaron desde la última carga
+
+        Returns:
+            True si cambió algún índice
+        """
+        with self._refresh_lock:
+            try:
+                names = sorted(
+                    name for name in os.listdir(self.feed_dir)
+                    if name.lower().endswith(FEED_EXTENSIONS)
+                )
+            except OSError:
+                names = []
+
+            current = self._feeds
+            updated = {}
+            changed = False
+            for name in names:
+                path = os.path.join(self.feed_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = current.get(path)
+                if previous is not None and previous[0] == signature:
+                    updated[path] = previous
+                    continue
+                try:
+                    feed = load_feed(path)
+                except OSError as e:
+                    logger.warning(f"No se pudo cargar la lista de IOC {path}: {str(e)}")
+                    if previous is not None:
+                        updated[path] = previous
+                    continue
+                updated[path] = (signature, feed)
+                changed = True
+                logger.info(f"Lista de IOC cargada: {name} ({len(feed)} indicadores)")
+
+            changed = changed or set(updated) != set(current)
+            # Sustitución atómica: las consultas usan la referencia anterior o la nueva
+            self._feeds = updated
+            return changed
+
+    @property
+    def feeds(self) -> List[FeedIndex]:
+        return [feed for _, feed in self._feeds.values()]
+
+    def __len__(self) -> int:
+        return sum(len(feed) for feed in self.feeds)
+
+    def match(self, kind: str, value: Any) -> List[Tuple[str, str]]:
+        """
+        Coteja un valor con todas las listas
+
+        Args:
+            kind: 'ip', 'hash' o 'path'
+            value: Valor a cotejar
+
+        Returns:
+            Lista de (lista, indicador) que coinciden
+        """
+        if value is None or value == '':
+            return []
+        value = str(value)
+        if kind == 'ip':
+            parsed = _parse_ip(value)
+            if parsed is None:
+                return []
+            matcher = lambda feed: feed.match_ip(parsed)
+        elif kind == 'hash':
+            matcher = lambda feed: feed.match_hash(value)
+        else:
+            matcher = lambda feed: feed.match_path(value)
+
+        matches = []
+        for feed in self.feeds:
+            label = matcher(feed)
+            if label is not None:
+                matches.append((feed.name, label))
+        return matches
+
+    def match_record(self, record: Dict[str, Any]) -> List[str]:
+        """
+        Coteja los campos conocidos de un registro (dirección remota, ruta y hashes)
+
+        Returns:
+            Descripciones de las coincidencias ('Campo=valor: indicador [lista]')
+        """
+        found = []
+        for field, kind in RECORD_FIELDS.items():
+            for feed_name, label in self.match(kind, record.get(field)):
+                found.append(f"{field}={record[field]}: {label} [{feed_name}]")
+        return found
+
+
+def add_ioc_matches(
+    records: ColumnarRecords,
+    matcher: IocMatcher,
+    column: str = 'IOC'
+) -> Tuple[ColumnarRecords, int]:
+    """
+    Agrega una columna con las coincidencias de indicadores de cada registro
+
+    Args:
+        records: Registros de cualquier tarea
+        matcher: Motor de indicadores
+        column: Nombre de la columna agregada
+
+    Returns:
+        Tupla (contenedor con la columna, registros con coincidencias). Si no
+        hay listas cargadas o ninguna columna se puede cotejar, se devuelven
+        los registros originales.
+    """
+    if not len(matcher) or not any(field in records.columns for field in RECORD_FIELDS):
+        return records, 0
+
+    schema = dict(records.schema)
+    schema[column] = 'cat'
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    hits = 0
+    for record in records.iter_records():
+        found = matcher.match_record(record)
+        if found:
+            hits += 1
+        record[column] = '; '.join(found) if found else None
+        result.append(record)
+    return result, hits
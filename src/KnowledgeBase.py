@@ -0,0 +1,383 @@
+"""
+Módulo para guardar y consultar los hallazgos de todos los análisis (base de conocimiento)
+"""
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Base de datos por defecto
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'conocimiento.db')
+
+# Tarea con la que se guarda un análisis consolidado
+CONSOLIDATED_TASK = 'Consolidado'
+
+# Columnas por las que se pueden filtrar y contar los resultados
+FACETS = ('risk_level', 'confidence', 'task', 'host')
+
+# Peso de cada columna del índice de texto en la puntuación BM25
+_BM25_WEIGHTS = (10.0, 4.0, 1.0)
+
+# Tokenizador del índice de texto: sin stemmer (el de Porter solo sirve
+# para inglés y los hallazgos mezclan inglés y español) y sin tildes
+_FTS_TOKENIZER = 'unicode61 remove_diacritics 2'
+
+# Terminaciones (español e inglés) que se recortan de cada palabra buscada
+# para encontrar sus variantes: "failures" -> fail*, "falla" -> fall*
+_SUFFIXES = tuple(sorted((
+    'aciones', 'iciones', 'amiento', 'imiento', 'mente', 'ciones', 'cion',
+    'ando', 'iendo', 'ados', 'idos', 'adas', 'idas', 'ado', 'ido', 'ada', 'ida',
+    'ures', 'ure', 'ings', 'ing', 'ies', 'ed', 'es', 'er', 'os', 'as',
+    's', 'a', 'o', 'e',
+), key=len, reverse=True))
+
+# Longitud mínima de la raíz que queda tras recortar la terminación
+_MIN_STEM = 4
+
+# Valores en español que devuelve a veces el modelo
+_LEVELS = {
+    'alto': 'high', 'alta': 'high', 'medio': 'medium', 'media': 'medium',
+    'bajo': 'low', 'baja': 'low', 'crítico': 'critical', 'critico': 'critical',
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    host TEXT NOT NULL,
+    task TEXT NOT NULL,
+    summary TEXT,
+    report_path TEXT,
+    total_items INTEGER,
+    suspicious_items INTEGER,
+    clean_items INTEGER,
+    statistics TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    finding_id TEXT,
+    title TEXT,
+    description TEXT,
+    evidence TEXT,
+    risk_level TEXT,
+    confidence TEXT,
+    task TEXT,
+    host TEXT,
+    created TEXT
+);
+CREATE INDEX IF NOT EXISTS items_report ON items(report_id);
+CREATE INDEX IF NOT EXISTS items_created ON items(created);
+CREATE INDEX IF NOT EXISTS items_risk ON items(risk_level, created);
+CREATE INDEX IF NOT EXISTS items_host ON items(host, created);
+CREATE INDEX IF NOT EXISTS items_task ON items(task, created);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    title, description, evidence,
+    content='items', content_rowid='id',
+    tokenize='{_FTS_TOKENIZER}'
+);
+CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts(rowid, title, description, evidence)
+    VALUES (new.id, new.title, new.description, new.evidence);
+END;
+CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts(items_fts, rowid, title, description, evidence)
+    VALUES ('delete', old.id, old.title, old.description, old.evidence);
+END;
+"""
+
+
+def _level(value: Any) -> Optional[str]:
+    """Normaliza un nivel de riesgo o confianza ('Alto' -> 'high')"""
+    if not value:
+        return None
+    text = str(value).strip().lower()
+    return _LEVELS.get(text, text)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _stem(term: str) -> str:
+    """Raíz de una palabra (sin tildes ni terminación flexiva)"""
+    term = ''.join(
+        char for char in unicodedata.normalize('NFKD', term.lower())
+        if not unicodedata.combining(char)
+    )
+    for suffix in _SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= _MIN_STEM:
+            return term[:-len(suffix)]
+    return term
+
+
+def fts_query(text: str) -> str:
+    """
+    Convierte texto libre en una consulta FTS5
+
+    Cada palabra se reduce a su raíz y se busca como prefijo, y basta con
+    que aparezca una: BM25 ordena primero los elementos que contienen más
+    palabras. Así "Wi-Fi Direct miniport failures" encuentra "Wi-Fi Direct
+    miniport failed" y "minipuerto falla" encuentra "fallo del
+    minipuerto", sin errores por guiones ni por la sintaxis de FTS5. Las
+    palabras de menos de tres letras se buscan completas.
+    """
+    terms = []
+    for word in re.findall(r'\w+', text):
+        stem = _stem(word)
+        term = f'"{stem}"' + ('*' if len(stem) >= 3 else '')
+        if term not in terms:
+            terms.append(term)
+    return ' OR '.join(terms)
+
+
+class KnowledgeBase:
+    """
+    Base de conocimiento de hallazgos históricos (SQLite + FTS5)
+
+    Cada análisis se guarda como un reporte (fecha, equipo, tarea, resumen,
+    estadísticas y ruta del PDF) con sus hallazgos y recomendaciones como
+    elementos. Un índice invertido FTS5 cubre título, descripción y
+    evidencia, y los elementos llevan copiadas las columnas de faceta
+    (riesgo, confianza, tarea, equipo) con índices, de modo que filtrar,
+    ordenar por relevancia (BM25) y contar por faceta no recorre la tabla.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        """
+        Abre (o crea) la base de datos
+
+        Args:
+            db_path: Archivo SQLite
+
+        Raises:
+            sqlite3.Error: Si la base no se puede abrir o SQLite no incluye FTS5
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Compartida entre los hilos del modo vigilancia (con bloqueo)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+            self._migrate_fts()
+            self._conn.executescript(_SCHEMA)
+            if self._rebuild_fts:
+                self._conn.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+
+    def _migrate_fts(self):
+        """Elimina el índice de texto creado con otro tokenizador (se reconstruye)"""
+        row = self._conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'"
+        ).fetchone()
+        self._rebuild_fts = row is not None and f"tokenize='{_FTS_TOKENIZER}'" not in row[0]
+        if self._rebuild_fts:
+            logger.info("Reconstruyendo el índice de texto de la base de conocimiento")
+            self._conn.execute('DROP TABLE items_fts')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+
+    def add_analysis(
+        self,
+        result: Dict[str, Any],
+        task_name: str,
+        host: Optional[str] = None,
+        report_path: Optional[str] = None,
+        created: Optional[datetime] = None
+    ) -> Optional[int]:
+        """
+        Guarda los hallazgos, recomendaciones y estadísticas de un análisis
+
+        En un análisis consolidado (con 'task_analyses') también se guarda
+        el análisis individual de cada tarea.
+
+        Args:
+            result: Resultado de AIAnalyzer (analyze_forensic_data o consolidado)
+            task_name: Tarea analizada
+            host: Equipo analizado (por defecto, el equipo actual)
+            report_path: Ruta del reporte PDF generado
+            created: Fecha del análisis (por defecto, ahora)
+
+        Returns:
+            Identificador del reporte, o None si el análisis no tuvo éxito
+        """
+        if not result.get('success'):
+            return None
+        host = host or socket.gethostname()
+        created_text = (created or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+
+        for name, task_analysis in (result.get('task_analyses') or {}).items():
+            self.add_analysis(task_analysis, name, host, report_path, created)
+
+        analysis = result.get('analysis') or {}
+        statistics = analysis.get('statistics') if isinstance(analysis.get('statistics'), dict) else {}
+        summary = analysis.get('summary') or result.get('summary_short') or ''
+
+        items: List[Tuple] = [
+            ('resumen', None, result.get('summary_short') or '', summary, None, None, None)
+        ]
+        for finding in analysis.get('findings') or []:
+            if not isinstance(finding, dict):
+                continue
+            items.append((
+                'hallazgo', finding.get('id'), finding.get('title') or '',
+                finding.get('description') or '', str(finding.get('evidence') or ''),
+                _level(finding.get('risk_level')), _level(finding.get('confidence')),
+            ))
+        for recommendation in analysis.get('recommendations') or []:
+            items.append(('recomendacion', None, str(recommendation), '', None, None, None))
+
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO reports (created, host, task, summary, report_path, total_items, '
+                'suspicious_items, clean_items, statistics) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    created_text, host, task_name, summary, report_path,
+                    _as_int(statistics.get('total_items_analyzed')),
+                    _as_int(statistics.get('suspicious_items')),
+                    _as_int(statistics.get('clean_items')),
+                    json.dumps(statistics, ensure_ascii=False),
+                )
+            )
+            report_id = cursor.lastrowid
+            self._conn.executemany(
+                'INSERT INTO items (report_id, kind, finding_id, title, description, evidence, '
+                'risk_level, confidence, task, host, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(report_id,) + item + (task_name, host, created_text) for item in items]
+            )
+        logger.info(f"Base de conocimiento: reporte {report_id} ({task_name}, {len(items)} elementos)")
+        return report_id
+
+    @staticmethod
+    def _filters(
+        query: str,
+        raw: bool,
+        filters: Dict[str, Any]
+    ) -> Tuple[str, str, List[Any]]:
+        """Devuelve (FROM, WHERE, parámetros) para una consulta y sus filtros"""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if query.strip():
+            # CROSS JOIN fija el orden: primero el índice de texto y después
+            # los elementos; al revés, SQLite evalúa MATCH fila a fila
+            source = 'items_fts CROSS JOIN items ON items.id = items_fts.rowid'
+            clauses.append('items_fts MATCH ?')
+            params.append(query if raw else fts_query(query))
+        else:
+            source = 'items'
+
+        for name in FACETS + ('kind',):
+            value = filters.get(name)
+            if value is None:
+                continue
+            values: Sequence[Any] = [value] if isinstance(value, str) else list(value)
+            if name in ('risk_level', 'confidence'):
+                values = [_level(item) for item in values]
+            clauses.append(f"items.{name} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if filters.get('since'):
+            clauses.append('items.created >= ?')
+            params.append(str(filters['since']))
+        if filters.get('until'):
+            clauses.append('items.created < ?')
+            params.append(str(filters['until']))
+        return source, ' AND '.join(clauses) or '1', params
+
+    def search(
+        self,
+        query: str = '',
+        limit: int = 20,
+        offset: int = 0,
+        raw: bool = False,
+        **filters: Union[str, Sequence[str], None]
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca hallazgos, recomendaciones y resúmenes
+
+        Args:
+            query: Texto libre (vacío para listar por fecha)
+            limit: Máximo de resultados
+            offset: Resultados a saltar (paginación)
+            raw: Pasar la consulta tal cual a FTS5 (OR, NOT, NEAR, comillas...)
+            **filters: risk_level, confidence, task, host, kind (valor o
+                lista de valores), since y until ('AAAA-MM-DD[ HH:MM:SS]')
+
+        Returns:
+            Resultados ordenados por relevancia (BM25) o, sin consulta, del
+            más reciente al más antiguo
+        """
+        source, where, params = self._filters(query, raw, filters)
+        if query.strip():
+            columns = (
+                "snippet(items_fts, 1, '[', ']', '…', 16) AS snippet, "
+                f"bm25(items_fts, {', '.join(map(str, _BM25_WEIGHTS))}) AS score"
+            )
+            order = 'score, items.created DESC'
+        else:
+            columns = "substr(items.description, 1, 160) AS snippet, 0 AS score"
+            order = 'items.created DESC, items.id DESC'
+
+        sql = (
+            f"SELECT items.id, items.kind, items.finding_id, items.title, items.risk_level, "
+            f"items.confidence, items.task, items.host, items.created, reports.report_path, {columns} "
+            f"FROM {source} JOIN reports ON reports.id = items.report_id "
+            f"WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def facets(
+        self,
+        query: str = '',
+        raw: bool = False,
+        **filters: Union[str, Sequence[str], None]
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        Cuenta los resultados de una búsqueda por riesgo, confianza, tarea y equipo
+
+        Args:
+            query: Texto libre
+            raw: Pasar la consulta tal cual a FTS5
+            **filters: Los mismos filtros que search()
+
+        Returns:
+            Dict faceta -> valor -> número de resultados
+        """
+        source, where, params = self._filters(query, raw, filters)
+        columns = ', '.join(f'items.{name}' for name in FACETS)
+        # Una sola pasada agrupando por todas las facetas a la vez
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns}, COUNT(*) FROM {source} WHERE {where} GROUP BY {columns}",
+                params
+            ).fetchall()
+
+        counts: Dict[str, Counter] = {name: Counter() for name in FACETS}
+        for row in rows:
+            for position, name in enumerate(FACETS):
+                if row[position] is not None:
+                    counts[name][row[position]] += row[-1]
+        return {name: dict(counter.most_common()) for name, counter in counts.items()}
+
+    def close(self):
+        """Cierra la base de datos"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,510 @@
+"""
+Módulo con los backends de modelos de IA y el enrutado por niveles (triaje + escalado)
+"""
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import caching
+
+logger = logging.getLogger(__name__)
+
+# Modelos por defecto de cada nivel
+DEFAULT_TRIAGE_MODEL = 'gemini-2.5-flash'
+DEFAULT_ESCALATION_MODEL = 'gemini-2.5-pro'
+
+# Niveles de riesgo de un hallazgo que provocan el escalado
+DEFAULT_ESCALATE_LEVELS = ('high',)
+
+# Vigencia de la caché de contexto del proveedor
+DEFAULT_CACHE_TTL = timedelta(hours=1)
+
+# Antelación con la que se renueva la caché de contexto antes de caducar
+CACHE_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class ModelBackend(ABC):
+    """
+    Interfaz común de los backends: recibe un prompt y devuelve texto
+
+    El prefijo estático (prompt del sistema e instrucciones de formato) se
+    configura una vez por sesión con configure_system(); el prompt de cada
+    petición contiene solo los datos de la tarea.
+    """
+
+    name = 'backend'
+    system_instruction: Optional[str] = None
+
+    def configure_system(self, system_instruction: str):
+        """
+        Fija el prefijo estático que acompaña a todas las peticiones
+
+        Args:
+            system_instruction: Prompt del sistema e instrucciones fijas
+        """
+        self.system_instruction = system_instruction
+
+    @abstractmethod
+    def generate(self, prompt: str) -> str:
+        """
+        Genera la respuesta del modelo
+
+        Args:
+            prompt: Prompt completo
+
+        Returns:
+            Texto de la respuesta
+        """
+
+    def stats_report(self) -> str:
+        """Texto con las estadísticas de uso (vacío si no hay)"""
+        return ''
+
+    def close(self):
+        """Libera los recursos del proveedor (por ejemplo, cachés de contexto)"""
+
+
+class GeminiBackend(ModelBackend):
+    """
+    Modelo de Google AI (Gemini); requiere haber llamado a genai.configure()
+
+    El prefijo estático se envía como system_instruction y, si el modelo lo
+    permite, se guarda en una caché de contexto del proveedor para que cada
+    petición solo facture y procese los datos de la tarea. La caché se crea
+    en la primera petición; si el proveedor la rechaza (por ejemplo, porque
+    el prefijo es demasiado corto) se usa system_instruction sin caché.
+    Antes de que caduque se amplía su vigencia, y si el proveedor ya la ha
+    eliminado se vuelve a crear, de modo que las sesiones largas (modo
+    vigilancia) no fallan al pasar el TTL.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_ESCALATION_MODEL,
+        context_cache: bool = True,
+        cache_ttl: timedelta = DEFAULT_CACHE_TTL
+    ):
+        """
+        Inicializa el backend
+
+        Args:
+            model_name: Nombre del modelo de Gemini
+            context_cache: Usar la caché de contexto del proveedor
+            cache_ttl: Vigencia de la caché de contexto
+        """
+        self.name = model_name
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.cached_content = None
+        # Instante (reloj monotónico) en que caduca la caché de contexto
+        self._cache_expires: Optional[float] = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.stats = _TierStats()
+
+    def configure_system(self, system_instruction: str):
+        with self._model_lock:
+            self.system_instruction = system_instruction
+            # La caché guarda el prefijo anterior: se descarta
+            self._drop_cache()
+
+    def _drop_cache(self):
+        """Elimina la caché de contexto y el modelo asociado (con el bloqueo tomado)"""
+        if self.cached_content is not None:
+            try:
+                self.cached_content.delete()
+            except Exception as e:
+                logger.debug(f"No se pudo eliminar la caché de contexto: {str(e)}")
+        self.cached_content = None
+        self._cache_expires = None
+        self._model = None
+
+    def _refresh_cache(self):
+        """Amplía la vigencia de la caché si está a punto de caducar (con el bloqueo tomado)"""
+        if self.cached_content is None or self._cache_expires is None:
+            return
+        if time.monotonic() < self._cache_expires - CACHE_REFRESH_MARGIN.total_seconds():
+            return
+        try:
+            self.cached_content.update(ttl=self.cache_ttl)
+            self._cache_expires = time.monotonic() + self.cache_ttl.total_seconds()
+            logger.info(f"Vigencia de la caché de contexto de {self.name} ampliada")
+        except Exception as e:
+            logger.info(f"No se pudo ampliar la caché de contexto de {self.name}, se vuelve a crear: {str(e)}")
+            self._drop_cache()
+
+    def _get_model(self):
+        """Crea el modelo (y la caché de contexto) la primera vez que se usa o al caducar"""
+        with self._model_lock:
+            self._refresh_cache()
+            if self._model is not None:
+                return self._model
+
+            if self.system_instruction and self.context_cache and self.cached_content is None:
+                try:
+                    self.cached_content = caching.CachedContent.create(
+                        model=f"models/{self.name}",
+                        display_name='autoforense-prompt-sistema',
+                        system_instruction=self.system_instruction,
+                        ttl=self.cache_ttl
+                    )
+                    self._cache_expires = time.monotonic() + self.cache_ttl.total_seconds()
+                    logger.info(f"Caché de contexto creada para {self.name}: {self.cached_content.name}")
+                except Exception as e:
+                    logger.info(f"Caché de contexto no disponible para {self.name}, se usa system_instruction: {str(e)}")
+                    self.context_cache = False
+
+            if self.cached_content is not None:
+                self._model = genai.GenerativeModel.from_cached_content(cached_content=self.cached_content)
+            else:
+                self._model = genai.GenerativeModel(self.name, system_instruction=self.system_instruction)
+            return self._model
+
+    def _invalidate_cache(self, model) -> bool:
+        """
+        Descarta la caché de contexto si el proveedor ya no la encuentra
+
+        Returns:
+            True si el modelo usaba la caché y se debe reintentar
+        """
+        with self._model_lock:
+            if self.cached_content is None or self._model is not model:
+                # Otro hilo ya la ha renovado
+                return self._model is not model
+            logger.info(f"La caché de contexto de {self.name} ya no existe; se vuelve a crear")
+            self.cached_content = None
+            self._cache_expires = None
+            self._model = None
+            return True
+
+    def generate(self, prompt: str) -> str:
+        started = time.perf_counter()
+        first_token = None
+        failed = True
+        response = None
+        try:
+            # En streaming para medir la latencia hasta el primer fragmento
+            model = self._get_model()
+            try:
+                response = model.generate_content(prompt, stream=True)
+            except google_exceptions.NotFound:
+                # La caché caducó en el proveedor antes de lo previsto
+                if not self._invalidate_cache(model):
+                    raise
+                response = self._get_model().generate_content(prompt, stream=True)
+            parts = []
+            block_reason = finish_reason = None
+            for chunk in response:
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                # chunk.text lanza ValueError en los fragmentos sin texto
+                # (bloqueados o que solo traen el motivo de fin)
+                feedback = getattr(chunk, 'prompt_feedback', None)
+                if feedback is not None and getattr(feedback, 'block_reason', 0):
+                    block_reason = _enum_name(feedback.block_reason)
+                for candidate in list(getattr(chunk, 'candidates', None) or ())[:1]:
+                    if getattr(candidate, 'finish_reason', 0):
+                        finish_reason = _enum_name(candidate.finish_reason)
+                    content = getattr(candidate, 'content', None)
+                    for part in getattr(content, 'parts', None) or ():
+                        if getattr(part, 'text', ''):
+                            parts.append(part.text)
+            if not parts:
+                raise ValueError(
+                    f"Respuesta sin texto de {self.name} "
+                    f"(bloqueo: {block_reason or 'ninguno'}, fin: {finish_reason or 'desconocido'})"
+                )
+            if block_reason or finish_reason not in (None, 'STOP'):
+                logger.warning(
+                    f"Respuesta de {self.name} posiblemente incompleta "
+                    f"(bloqueo: {block_reason or 'ninguno'}, fin: {finish_reason})"
+                )
+            failed = False
+            return ''.join(parts)
+        finally:
+            usage = getattr(response, 'usage_metadata', None) if not failed else None
+            self.stats.add(
+                time.perf_counter() - started,
+                failed,
+                input_tokens=getattr(usage, 'prompt_token_count', None),
+                cached_tokens=getattr(usage, 'cached_content_token_count', None),
+                first_token=first_token
+            )
+
+    def stats_report(self) -> str:
+        if not self.stats.calls:
+            return ''
+        return f"  {self.name}: {self.stats.describe()}"
+
+    def close(self):
+        with self._model_lock:
+            self._drop_cache()
+
+
+class HttpBackend(ModelBackend):
+    """
+    Modelo servido por HTTP (por ejemplo, un modelo local o un servidor de
+    pruebas que sustituye a Gemini)
+
+    Envía POST con JSON {"model", "prompt", "system", "stream": false} y
+    acepta respuestas con el texto en "response" (formato de /api/generate
+    de Ollama) o en "text". El prefijo estático viaja en "system", de modo
+    que un servidor local con caché de prefijos no lo reprocesa y cada
+    petición solo lleva los datos de la tarea.
+    """
+
+    def __init__(self, url: str, model_name: str = 'local', timeout: float = 120):
+        self.url = url
+        self.name = f"{model_name}@{url}"
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def generate(self, prompt: str) -> str:
+        body = {'model': self.model_name, 'prompt': prompt, 'stream': False}
+        if self.system_instruction:
+            body['system'] = self.system_instruction
+        payload = json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=payload, headers={'Content-Type': 'application/json'}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = json.loads(response.read().decode('utf-8'))
+        text = body.get('response', body.get('text'))
+        if text is None:
+            raise ValueError(f"Respuesta sin texto del backend HTTP {self.url}")
+        return text
+
+
+def _enum_name(value) -> str:
+    """Nombre de un valor enumerado del SDK (o su texto si no lo tiene)"""
+    return getattr(value, 'name', None) or str(value)
+
+
+class _TierStats:
+    """Llamadas, latencias y tokens de entrada de un nivel o backend (seguro entre hilos)"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=max_samples)
+        self.first_tokens = deque(maxlen=max_samples)
+        self.input_tokens = deque(maxlen=max_samples)
+        self.cached_tokens = deque(maxlen=max_samples)
+
+    def add(
+        self,
+        seconds: float,
+        failed: bool = False,
+        input_tokens: Optional[int] = None,
+        cached_tokens: Optional[int] = None,
+        first_token: Optional[float] = None
+    ):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(failed)
+            self.latencies.append(seconds)
+            if first_token is not None:
+                self.first_tokens.append(first_token)
+            if input_tokens is not None:
+                self.input_tokens.append(input_tokens)
+                self.cached_tokens.append(cached_tokens or 0)
+
+    def describe(self) -> str:
+        with self._lock:
+            return self._describe()
+
+    def _describe(self) -> str:
+        if not self.latencies:
+            return f"{self.calls} llamadas"
+        text = (
+            f"{self.calls} llamadas, {self.errors} errores, latencia mediana "
+            f"{statistics.median(self.latencies):.2f} s, máxima {max(self.latencies):.2f} s"
+        )
+        if self.first_tokens:
+            text += f", primer fragmento {statistics.median(self.first_tokens):.2f} s"
+        if self.input_tokens:
+            text += (
+                f", tokens de entrada (mediana) {statistics.median(self.input_tokens):.0f}"
+                f" de los que {statistics.median(self.cached_tokens):.0f} en caché"
+            )
+        return text
+
+
+def risk_levels(analysis_text: str) -> Optional[List[str]]:
+    """
+    Niveles de riesgo de los hallazgos de una respuesta
+
+    Args:
+        analysis_text: Texto de la respuesta (resumen + JSON)
+
+    Returns:
+        Lista de niveles en minúsculas, o None si no hay JSON válido
+    """
+    json_start = analysis_text.find('{')
+    json_end = analysis_text.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        return None
+    try:
+        analysis = json.loads(analysis_text[json_start:json_end])
+    except json.JSONDecodeError:
+        return None
+    findings = analysis.get('findings', []) if isinstance(analysis, dict) else []
+    return [
+        str(finding.get('risk_level', '')).lower()
+        for finding in findings if isinstance(finding, dict)
+    ]
+
+
+class TieredRouter(ModelBackend):
+    """
+    Enrutado por niveles: un modelo rápido hace el triaje y solo se llama al
+    modelo caro cuando el triaje encuentra hallazgos de riesgo suficiente
+
+    En un equipo limpio basta con la respuesta del modelo rápido; si el
+    triaje detecta hallazgos de los niveles configurados (o su respuesta no
+    se puede interpretar) se repite el análisis con el modelo de escalado.
+    """
+
+    def __init__(
+        self,
+        triage: ModelBackend,
+        escalation: ModelBackend,
+        escalate_levels: Iterable[str] = DEFAULT_ESCALATE_LEVELS,
+        min_findings: int = 1
+    ):
+        """
+        Inicializa el enrutador
+
+        Args:
+            triage: Backend rápido y barato
+            escalation: Backend de mayor calidad
+            escalate_levels: Niveles de riesgo que cuentan para escalar
+            min_findings: Hallazgos de esos niveles necesarios para escalar
+        """
+        self.triage = triage
+        self.escalation = escalation
+        self.escalate_levels = {level.lower() for level in escalate_levels}
+        self.min_findings = min_findings
+        self.name = f"{triage.name} -> {escalation.name}"
+        self.system_instruction = None
+
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _TierStats] = {'triaje': _TierStats(), 'escalado': _TierStats()}
+        self._totals = _TierStats()
+        self.escalations = 0
+
+    def configure_system(self, system_instruction: str):
+        self.system_instruction = system_instruction
+        self.triage.configure_system(system_instruction)
+        self.escalation.configure_system(system_instruction)
+
+    def _timed(self, tier: str, backend: ModelBackend, prompt: str) -> str:
+        started = time.perf_counter()
+        failed = True
+        try:
+            text = backend.generate(prompt)
+            failed = False
+            return text
+        finally:
+            with self._lock:
+                self._stats[tier].add(time.perf_counter() - started, failed)
+
+    def should_escalate(self, triage_text: str) -> bool:
+        """Decide si la respuesta del triaje requiere el modelo de escalado"""
+        levels = risk_levels(triage_text)
+        if levels is None:
+            return True
+        return sum(1 for level in levels if level in self.escalate_levels) >= self.min_findings
+
+    def generate(self, prompt: str) -> str:
+        started = time.perf_counter()
+        try:
+            try:
+                text = self._timed('triaje', self.triage, prompt)
+            except Exception as e:
+                logger.warning(f"Error en el triaje ({self.triage.name}): {str(e)}")
+                text = ''
+            if self.should_escalate(text):
+                logger.info(f"Triaje ({self.triage.name}) con hallazgos relevantes, escalando a {self.escalation.name}")
+                with self._lock:
+                    self.escalations += 1
+                text = self._timed('escalado', self.escalation, prompt)
+            else:
+                logger.info(f"Triaje ({self.triage.name}) sin hallazgos relevantes, no se escala")
+            return text
+        finally:
+            with self._lock:
+                self._totals.add(time.perf_counter() - started)
+
+    def stats_report(self) -> str:
+        with self._lock:
+            if not self._totals.calls:
+                return ''
+            lines = [
+                f"  Triaje ({self.triage.name}): {self._stats['triaje'].describe()}",
+                f"  Escalado ({self.escalation.name}): {self._stats['escalado'].describe()}",
+                f"  Análisis: {self._totals.describe()}, {self.escalations} escalados",
+            ]
+        lines.extend(
+            report for report in (self.triage.stats_report(), self.escalation.stats_report()) if report
+        )
+        return '\n'.join(lines)
+
+    def close(self):
+        self.triage.close()
+        self.escalation.close()
+
+
+def build_backend_from_env() -> ModelBackend:
+    """
+    Construye el backend según las variables de entorno
+
+    - AUTOFORENSE_MODELO: modelo principal (por defecto gemini-2.5-pro)
+    - AUTOFORENSE_MODELO_TRIAJE: modelo de triaje (por defecto
+      gemini-2.5-flash; vacío para no usar triaje)
+    - AUTOFORENSE_TRIAJE_URL: si se indica, el triaje se hace con un
+      backend HTTP en esa URL
+    - AUTOFORENSE_ESCALAR: niveles de riesgo que provocan el escalado,
+      separados por comas (por defecto high)
+    - AUTOFORENSE_ESCALAR_MIN: hallazgos necesarios para escalar (por defecto 1)
+    - AUTOFORENSE_CACHE_CONTEXTO: 0 para no usar la caché de contexto de Gemini
+
+    Returns:
+        Backend listo para usar
+    """
+    context_cache = os.getenv('AUTOFORENSE_CACHE_CONTEXTO', '1').strip() != '0'
+    escalation = GeminiBackend(
+        os.getenv('AUTOFORENSE_MODELO', DEFAULT_ESCALATION_MODEL),
+        context_cache=context_cache
+    )
+
+    triage_model = os.getenv('AUTOFORENSE_MODELO_TRIAJE', DEFAULT_TRIAGE_MODEL).strip()
+    triage_url = os.getenv('AUTOFORENSE_TRIAJE_URL', '').strip()
+    if triage_url:
+        triage = HttpBackend(triage_url, model_name=triage_model or 'local')
+    elif triage_model and triage_model != escalation.name:
+        triage = GeminiBackend(triage_model, context_cache=context_cache)
+    else:
+        return escalation
+
+    levels = [
+        level.strip() for level in os.getenv('AUTOFORENSE_ESCALAR', ','.join(DEFAULT_ESCALATE_LEVELS)).split(',')
+        if level.strip()
+    ]
+    return TieredRouter(
+        triage,
+        escalation,
+        escalate_levels=levels,
+        min_findings=int(os.getenv('AUTOFORENSE_ESCALAR_MIN', '1'))
+    )
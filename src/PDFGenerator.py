@@ -3,6 +3,7 @@ Módulo para generar reportes forenses en PDF
 """
 import os
 from datetime import datetime
+from xml.sax.saxutils import escape
 from typing import Dict, Any, List, Optional
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
@@ -316,6 +317,46 @@ class PDFGenerator:
         
         return elements
     
+    def _create_timeline_section(self, rows: List, max_rows: int = 200) -> List:
+        """Crea la sección con la línea de tiempo unificada (las filas más recientes)"""
+        elements = []
+        
+        if not rows:
+            return elements
+        
+        heading = Paragraph("Línea de Tiempo", self.styles['CustomHeading'])
+        elements.append(heading)
+        
+        if len(rows) > max_rows:
+            elements.append(Paragraph(
+                f"Se muestran las {max_rows} entradas más recientes de {len(rows)}.",
+                self.styles['CustomBody']
+            ))
+            rows = rows[-max_rows:]
+        
+        timeline_data = [['Fecha', 'Origen', 'Detalle']]
+        for timestamp, source, text, count in rows:
+            detail = f"{text} (x{count})" if count > 1 else text
+            timeline_data.append([
+                timestamp, source,
+                Paragraph(escape(detail), self.styles['CustomBody'])
+            ])
+        
+        timeline_table = Table(timeline_data, colWidths=[1.4*inch, 0.9*inch, 4.2*inch], repeatRows=1)
+        timeline_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ]))
+        
+        elements.append(timeline_table)
+        elements.append(Spacer(1, 20))
+        
+        return elements
+    
     def _create_footer(self) -> List:
         """Crea el pie de página con información legal"""
         elements = []
@@ -400,6 +441,8 @@ class PDFGenerator:
                     story.extend(self._create_recommendations_section(
                         consolidated_analysis['analysis']['recommendations']
                     ))
+            
+            story.extend(self._create_timeline_section(consolidated_analysis.get('timeline')))
         
         # Análisis por tarea (solo si hay análisis individuales)
         if tasks_analyses:
@@ -422,6 +465,13 @@ class PDFGenerator:
                             f"<b>Hallazgos encontrados:</b> {len(findings)}",
                             self.styles['CustomBody']
                         ))
+                        story.extend(self._create_findings_section(findings))
+                
+                if not analysis.get('success', True):
+                    story.append(Paragraph(
+                        f"<b>Error en el análisis:</b> {escape(str(analysis.get('error') or ''))}",
+                        self.styles['CustomBody']
+                    ))
                 
                 story.append(Spacer(1, 20))
         
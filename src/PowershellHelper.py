@@ -2,21 +2,60 @@
 Módulo helper para ejecutar funciones de PowerShell desde Python
 """
 import subprocess
+import csv
 import json
 import os
-from typing import Optional, Dict, Any, List
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator, List
+
+from Deadlines import AdaptiveLimits, Deadline, ProcessResult, run_with_deadline
+from EventFilter import EventFilter
+from SpooledOutput import SpooledOutput
+from SignatureCache import SignatureCache, file_fingerprint
+
+# Estados de firma que Get-UnsignedProcesses reporta
+UNSIGNED_STATUSES = ('NotSigned', 'Unknown')
+
+# Orden de las propiedades de cada proceso en la salida de Get-UnsignedProcesses
+UNSIGNED_FIELDS = ('ProcessName', 'PID', 'Path', 'SignatureStatus', 'Signer', 'StartTime')
+
+# Bytes finales en los que se busca el último registro completo de una salida parcial
+PARTIAL_TAIL_BYTES = 1 << 20
 
 
 class PowerShellHelper:
     """Clase helper para ejecutar funciones PowerShell desde Python"""
     
-    def __init__(self, module_path: Optional[str] = None):
+    def __init__(
+        self,
+        module_path: Optional[str] = None,
+        signature_cache: Optional[SignatureCache] = None,
+        timeout: Optional[float] = None,
+        adaptive_limits: Optional[AdaptiveLimits] = None
+    ):
         """
         Inicializa el helper de PowerShell
         
         Args:
             module_path: Ruta al módulo FuncionesForenses.psm1
+            signature_cache: Caché de verificaciones de firma (por defecto,
+                la persistida en reportes/cache_firmas.json)
+            timeout: Segundos máximos de cada llamada a PowerShell (None
+                para no limitar); al vencer se termina el árbol de procesos
+                y se devuelve la salida parcial marcada como 'truncated'
+            adaptive_limits: Si se indica, max_events se reduce en las
+                siguientes ejecuciones cuando Get-SuspiciousEvents supera
+                su presupuesto de tiempo
         """
+        self.signature_cache = signature_cache
+        self.timeout = timeout
+        self.adaptive_limits = adaptive_limits
+        self._cancel = threading.Event()
+        # Límite del pipeline en curso (por hilo)
+        self._local = threading.local()
         if module_path is None:
             # Buscar el módulo en el directorio src
             self.module_path = os.path.join(
@@ -34,15 +73,49 @@ class PowerShellHelper:
                 f"No se encontró el módulo PowerShell en: {self.module_path}"
             )
     
-    def _execute_powershell(self, command: str) -> Dict[str, Any]:
+    def cancel(self):
+        """Cancela las llamadas en curso (y las siguientes) terminando sus procesos"""
+        self._cancel.set()
+    
+    @contextmanager
+    def deadline(self, seconds: Optional[float]) -> Iterator[Deadline]:
+        """
+        Límite de tiempo común a todas las llamadas del bloque (pipeline)
+        
+        Cada llamada termina en el primero de los dos límites: el suyo
+        (timeout) o el del pipeline.
+        
+        Args:
+            seconds: Segundos para todo el bloque (None o 0 sin límite)
+        """
+        previous = getattr(self._local, 'deadline', None)
+        current = Deadline(seconds) if previous is None else previous.sooner(seconds)
+        self._local.deadline = current
+        try:
+            yield current
+        finally:
+            self._local.deadline = previous
+    
+    def _call_deadline(self) -> Deadline:
+        """Límite de la próxima llamada: el del pipeline o el propio, el que llegue antes"""
+        pipeline = getattr(self._local, 'deadline', None)
+        if pipeline is None:
+            return Deadline(self.timeout)
+        return pipeline.sooner(self.timeout)
+    
+    def _execute_powershell(self, command: str, spool: bool = False) -> Dict[str, Any]:
         """
         Ejecuta un comando de PowerShell y retorna el resultado
         
         Args:
             command: Comando PowerShell a ejecutar
+            spool: Si True, la salida se vuelca a un archivo temporal y
+                'output' es un SpooledOutput mapeado en memoria en lugar de str
             
         Returns:
-            Dict con 'success', 'output' y 'error'
+            Dict con 'success', 'output' y 'error'; si se agotó el tiempo,
+            'truncated' es True y 'output' contiene los registros completos
+            recibidos hasta entonces
         """
         try:
             # Normalizar la ruta del módulo para PowerShell (escapar comillas dobles)
@@ -55,21 +128,20 @@ class PowerShellHelper:
             {command}
             """
             
+            if spool:
+                return self._execute_spooled(full_command)
+            
             # Ejecutar PowerShell con ExecutionPolicy Bypass para permitir scripts no firmados
-            result = subprocess.run(
+            result = run_with_deadline(
                 ["powershell", "-ExecutionPolicy", "Bypass", "-Command", full_command],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='ignore'
+                deadline=self._call_deadline(),
+                cancel_event=self._cancel
             )
             
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr,
-                'returncode': result.returncode
-            }
+            output = result.stdout or b''
+            if result.timed_out:
+                output = output[:self._complete_length(output)]
+            return self._result(result, output.decode('utf-8', errors='ignore'))
         except Exception as e:
             return {
                 'success': False,
@@ -78,11 +150,93 @@ class PowerShellHelper:
                 'returncode': -1
             }
     
+    def _execute_spooled(self, full_command: str) -> Dict[str, Any]:
+        """
+        Ejecuta PowerShell volcando stdout directamente a un archivo temporal
+        
+        La salida no pasa por la memoria de Python: el proceso escribe en el
+        archivo y el resultado se expone como una vista mapeada en memoria.
+        
+        Args:
+            full_command: Comando completo (incluida la importación del módulo)
+            
+        Returns:
+            Dict con 'success', 'output' (SpooledOutput) y 'error'
+        """
+        spool_file = tempfile.TemporaryFile()
+        try:
+            result = run_with_deadline(
+                ["powershell", "-ExecutionPolicy", "Bypass", "-Command", full_command],
+                deadline=self._call_deadline(),
+                stdout=spool_file,
+                cancel_event=self._cancel
+            )
+            if result.timed_out:
+                # Descartar el registro que se estaba escribiendo al cortar
+                spool_file.seek(0, 2)
+                size = spool_file.tell()
+                offset = max(0, size - PARTIAL_TAIL_BYTES)
+                spool_file.seek(offset)
+                spool_file.truncate(offset + self._complete_length(spool_file.read()))
+        except BaseException:
+            spool_file.close()
+            raise
+        
+        return self._result(result, SpooledOutput(spool_file))
+    
+    @staticmethod
+    def _complete_length(data: bytes) -> int:
+        """Longitud hasta el final del último registro completo (línea en blanco)"""
+        end = max(data.rfind(b'\n\n'), data.rfind(b'\n\r\n'))
+        if end >= 0:
+            return data.index(b'\n', end + 1) + 1
+        return data.rfind(b'\n') + 1
+    
+    @staticmethod
+    def _result(result: ProcessResult, output: Any) -> Dict[str, Any]:
+        """Convierte un ProcessResult en el dict de resultado habitual"""
+        error = result.stderr.decode('utf-8', errors='ignore')
+        if result.cancelled:
+            return {
+                'success': False,
+                'output': output,
+                'error': 'Ejecución cancelada',
+                'returncode': result.returncode,
+                'cancelled': True,
+                'elapsed': result.elapsed
+            }
+        if result.timed_out:
+            # Lo recibido antes del corte se devuelve como resultado parcial
+            return {
+                'success': len(output) > 0,
+                'output': output,
+                'error': f"Tiempo límite agotado tras {result.elapsed:.0f} s; resultado parcial. {error}".strip(),
+                'returncode': result.returncode,
+                'truncated': True,
+                'elapsed': result.elapsed
+            }
+        return {
+            'success': result.returncode == 0,
+            'output': output,
+            'error': error,
+            'returncode': result.returncode,
+            'truncated': False,
+            'elapsed': result.elapsed
+        }
+    
+    @staticmethod
+    def _quote(value: str) -> str:
+        """Cadena literal de PowerShell (comillas simples duplicadas)"""
+        return "'" + value.replace("'", "''") + "'"
+    
     def get_suspicious_events(
         self,
         max_events: int = 2000,
         output_path: Optional[str] = None,
-        dont_save_report: bool = False
+        dont_save_report: bool = False,
+        spool: bool = False,
+        start_time: Optional[datetime] = None,
+        event_filter: Optional[EventFilter] = None
     ) -> Dict[str, Any]:
         """
         Ejecuta Get-SuspiciousEvents para extraer eventos sospechosos
@@ -91,10 +245,20 @@ class PowerShellHelper:
             max_events: Número máximo de eventos a analizar
             output_path: Ruta donde guardar el CSV (opcional)
             dont_save_report: Si True, no guarda el reporte
+            spool: Si True, la salida se devuelve como SpooledOutput
+            start_time: Si se indica, solo se leen eventos posteriores (hora local)
+            event_filter: Criterios (IDs, canales, niveles, proveedores y
+                fechas) que se evalúan en el origen con -FilterXPath
             
         Returns:
             Dict con el resultado de la ejecución
         """
+        requested = max_events
+        if self.adaptive_limits is not None:
+            max_events = self.adaptive_limits.limit('Get-SuspiciousEvents', requested)
+            if max_events < requested:
+                print(f"  (Límite adaptativo: se leen {max_events} eventos por log en lugar de {requested})")
+        
         params = []
         params.append(f"-MaxEvents {max_events}")
         
@@ -104,18 +268,37 @@ class PowerShellHelper:
         if dont_save_report:
             params.append("-DontSaveReport")
         
+        if event_filter is not None:
+            # La fecha inicial se incorpora al XPath junto al resto de criterios
+            event_filter = event_filter.since(start_time)
+            params.append(f"-LogName {','.join(self._quote(channel) for channel in event_filter.channels)}")
+            params.append(f"-FilterXPath {self._quote(event_filter.to_xpath())}")
+            if not event_filter.suspicious_only:
+                params.append("-IncludeAll")
+        elif start_time is not None:
+            params.append(f"-StartTime '{start_time.strftime('%Y-%m-%dT%H:%M:%S')}'")
+        
         command = f"Get-SuspiciousEvents {' '.join(params)}"
-        return self._execute_powershell(command)
+        deadline = self._call_deadline()
+        result = self._execute_powershell(command, spool=spool)
+        if self.adaptive_limits is not None and 'elapsed' in result and not result.get('cancelled'):
+            self.adaptive_limits.record(
+                'Get-SuspiciousEvents', requested, max_events, result['elapsed'],
+                deadline.seconds, result.get('truncated', False)
+            )
+        return result
     
     def get_internet_processes(
         self,
-        dont_save_report: bool = False
+        dont_save_report: bool = False,
+        spool: bool = False
     ) -> Dict[str, Any]:
         """
         Ejecuta Get-InternetProcesses para correlacionar procesos con conexiones de red
         
         Args:
             dont_save_report: Si True, no guarda el reporte
+            spool: Si True, la salida se devuelve como SpooledOutput
             
         Returns:
             Dict con el resultado de la ejecución
@@ -125,17 +308,149 @@ class PowerShellHelper:
             params.append("-DontSaveReport")
         
         command = f"Get-InternetProcesses {' '.join(params)}"
-        return self._execute_powershell(command)
+        return self._execute_powershell(command, spool=spool)
     
-    def get_unsigned_processes(self) -> Dict[str, Any]:
+    def get_unsigned_processes(self, spool: bool = False, use_cache: bool = True) -> Dict[str, Any]:
         """
         Ejecuta Get-UnsignedProcesses para detectar procesos sin firma digital
         
+        Con caché, PowerShell solo lista los procesos y verifica la firma de
+        los binarios nuevos o modificados (según tamaño, fecha y hash); el
+        resto se toma de la caché. La salida y el CSV tienen el mismo formato
+        que los de Get-UnsignedProcesses.
+        
+        Args:
+            spool: Si True, la salida se devuelve como SpooledOutput
+            use_cache: Si False, se verifican todas las firmas en PowerShell
+        
         Returns:
             Dict con el resultado de la ejecución
         """
-        command = "Get-UnsignedProcesses"
-        return self._execute_powershell(command)
+        if not use_cache:
+            command = "Get-UnsignedProcesses"
+            return self._execute_powershell(command, spool=spool)
+        
+        if self.signature_cache is None:
+            self.signature_cache = SignatureCache()
+        cache = self.signature_cache
+        
+        listing = self._execute_json("Get-ProcessBinaries")
+        if not listing['success']:
+            return listing
+        processes = listing['output']
+        
+        # Huella de cada binario distinto (varios procesos comparten ejecutable)
+        fingerprints = {}
+        statuses = {}
+        for process in processes:
+            path = process['Path']
+            if path in fingerprints:
+                continue
+            fingerprints[path] = file_fingerprint(path, with_hash=cache.verify_hash)
+            cached = cache.lookup(path, fingerprints[path])
+            if cached is not None:
+                statuses[path] = cached
+        
+        pending = [path for path in fingerprints if path not in statuses]
+        if pending:
+            list_file = tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', suffix='.txt', delete=False
+            )
+            try:
+                with list_file:
+                    list_file.write('\n'.join(pending))
+                list_path = list_file.name.replace("'", "''")
+                verified = self._execute_json(f"Get-SignatureStatus -PathListFile '{list_path}'")
+            finally:
+                os.remove(list_file.name)
+            if not verified['success']:
+                return verified
+            
+            for item in verified['output']:
+                path = item['Path']
+                statuses[path] = {'SignatureStatus': item['SignatureStatus'], 'Signer': item['Signer']}
+                cache.store(path, fingerprints.get(path), item['SignatureStatus'], item['Signer'])
+            cache.save()
+        
+        results = []
+        for process in processes:
+            status = statuses.get(process['Path'], {'SignatureStatus': 'Unknown', 'Signer': None})
+            if status['SignatureStatus'] in UNSIGNED_STATUSES:
+                results.append({**process, **status})
+        
+        output = self._format_unsigned_output(results)
+        if spool:
+            spool_file = tempfile.TemporaryFile()
+            spool_file.write(output.encode('utf-8'))
+            output = SpooledOutput(spool_file)
+        
+        return {
+            'success': True,
+            'output': output,
+            'error': '',
+            'returncode': 0,
+            'verified': len(pending),
+            'cached': len(fingerprints) - len(pending)
+        }
+    
+    def _execute_json(self, command: str) -> Dict[str, Any]:
+        """
+        Ejecuta un comando y devuelve su salida convertida desde JSON
+        
+        Returns:
+            Dict con 'success', 'output' (lista de objetos) y 'error'
+        """
+        result = self._execute_powershell(f"@({command}) | ConvertTo-Json -Compress -Depth 2")
+        if not result['success']:
+            return result
+        if result.get('truncated'):
+            # Un JSON cortado no se puede aprovechar parcialmente
+            return {'success': False, 'output': '', 'error': result['error'], 'truncated': True}
+        
+        text = result['output'].strip()
+        try:
+            data = json.loads(text) if text else []
+        except json.JSONDecodeError as e:
+            return {'success': False, 'output': '', 'error': f"Salida JSON no válida: {str(e)}"}
+        
+        # ConvertTo-Json devuelve un objeto suelto cuando solo hay un elemento
+        if isinstance(data, dict):
+            data = [data]
+        result['output'] = data
+        return result
+    
+    @staticmethod
+    def _format_unsigned_output(results: List[Dict[str, Any]]) -> str:
+        """
+        Genera la misma salida que Get-UnsignedProcesses (mensajes y lista de
+        objetos) y exporta el CSV en la carpeta actual
+        """
+        lines = [
+            f"Proceso no firmado detectado: {item['ProcessName']} (PID: {item['PID']}) - Ruta: {item['Path']}"
+            for item in results
+        ]
+        
+        if results:
+            csv_path = os.path.join(
+                os.getcwd(), f"procesos_sin_firma_{datetime.now().strftime('%d_%m_%Y')}.csv"
+            )
+            with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator='\r\n')
+                writer.writerow(UNSIGNED_FIELDS)
+                for item in sorted(results, key=lambda item: item['ProcessName'].lower()):
+                    writer.writerow(['' if item[field] is None else item[field] for field in UNSIGNED_FIELDS])
+            lines.append(f"Exportación completada. Archivo: {csv_path}")
+        else:
+            lines.append("No se detectaron procesos sin firma digital.")
+        
+        lines.append("")
+        width = max(len(field) for field in UNSIGNED_FIELDS)
+        for item in results:
+            for field in UNSIGNED_FIELDS:
+                value = '' if item[field] is None else item[field]
+                lines.append(f"{field.ljust(width)} : {value}")
+            lines.append("")
+        return '\n'.join(lines) + '\n'
     
     def get_suspicious_internet_processes(
         self,
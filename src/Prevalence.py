@@ -0,0 +1,486 @@
+"""
+Módulo para medir la prevalencia de procesos, firmantes, destinos y eventos en la flota
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import uuid
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ColumnarRecords import ColumnarRecords
+from TemplateMiner import render_message
+
+logger = logging.getLogger(__name__)
+
+# Almacén por defecto
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'prevalencia.bin')
+
+# Prevalencia a partir de la cual un registro se omite (AUTOFORENSE_PREVALENCIA; 0 lo desactiva)
+DEFAULT_THRESHOLD = 0.6
+
+# Equipos (sin contar el actual) necesarios para que la prevalencia tenga sentido
+MIN_HOSTS = 5
+
+# Columna con la rareza de cada registro (1 = nunca visto en otro equipo)
+RARITY_COLUMN = 'Rareza'
+
+_MAGIC = b'AFPREV2\n'
+_MAGIC_V1 = b'AFPREV1\n'
+_MAX_COUNT = 0xFFFFFFFF
+
+_NUMBER_RE = re.compile(r'0x[0-9a-fA-F]+|\d+')
+_PROFILE_RE = re.compile(r'^([a-z]:\\users\\)[^\\]+', re.IGNORECASE)
+
+
+def threshold_from_env() -> float:
+    """Umbral configurado en AUTOFORENSE_PREVALENCIA (por defecto 0.6)"""
+    try:
+        return float(os.getenv('AUTOFORENSE_PREVALENCIA', DEFAULT_THRESHOLD))
+    except ValueError:
+        logger.warning("AUTOFORENSE_PREVALENCIA no es un número; se usa el valor por defecto")
+        return DEFAULT_THRESHOLD
+
+
+def _hash_pair(key: str) -> Tuple[int, int]:
+    """Dos hashes de 64 bits independientes para el doble hashing"""
+    digest = hashlib.blake2b(key.encode('utf-8', 'replace'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class CountMinSketch:
+    """
+    Contador aproximado de tamaño fijo
+
+    Cada clave incrementa un contador en cada una de las 'depth' filas; la
+    estimación es el mínimo de esos contadores, que nunca es menor que el
+    valor real. Las aportaciones de otros almacenes se suman y se restan
+    como contadores dispersos (nonzero() y add_sparse()).
+    """
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.counters = array('I', bytes(4 * width * depth))
+
+    def _positions(self, key: str) -> List[int]:
+        h1, h2 = _hash_pair(key)
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1):
+        counters = self.counters
+        for position in self._positions(key):
+            counters[position] = min(_MAX_COUNT, counters[position] + count)
+
+    def estimate(self, key: str) -> int:
+        counters = self.counters
+        return min(counters[position] for position in self._positions(key))
+
+    def nonzero(self) -> Tuple[array, array]:
+        """Posiciones y valores de los contadores distintos de cero"""
+        counters = self.counters
+        positions = array('I', (position for position, value in enumerate(counters) if value))
+        return positions, array('I', (counters[position] for position in positions))
+
+    def add_sparse(self, positions: array, values: array, sign: int = 1):
+        """Suma (o resta, con sign=-1) contadores dispersos obtenidos con nonzero()"""
+        counters = self.counters
+        for position, value in zip(positions, values):
+            counters[position] = max(0, min(_MAX_COUNT, counters[position] + sign * value))
+
+
+class BloomFilter:
+    """Conjunto aproximado de tamaño fijo (sin falsos negativos)"""
+
+    def __init__(self, bits: int = 1 << 20, hashes: int = 7):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(bits // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        h1, h2 = _hash_pair(key)
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str) -> bool:
+        """Agrega la clave; devuelve True si no estaba"""
+        data = self.data
+        new = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not data[byte] & (1 << bit):
+                data[byte] |= 1 << bit
+                new = True
+        return new
+
+    def __contains__(self, key: str) -> bool:
+        data = self.data
+        return all(data[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimate_count(self) -> int:
+        """Número de claves distintas estimado a partir de los bits activos"""
+        ones = bin(int.from_bytes(self.data, 'little')).count('1')
+        if ones >= self.bits:
+            return _MAX_COUNT
+        return round(-self.bits / self.hashes * math.log(1 - ones / self.bits))
+
+    def merge(self, other: 'BloomFilter'):
+        if (other.bits, other.hashes) != (self.bits, self.hashes):
+            raise ValueError("Los filtros de Bloom tienen dimensiones distintas")
+        self.data = bytearray(
+            (int.from_bytes(self.data, 'little') | int.from_bytes(other.data, 'little'))
+            .to_bytes(len(self.data), 'little')
+        )
+
+
+def _path_key(path: str) -> str:
+    """Ruta normalizada: minúsculas y sin el nombre del perfil de usuario"""
+    return _PROFILE_RE.sub(r'\1*', path.strip().lower())
+
+
+def record_features(task_name: str, record: Dict, templates: Optional[Dict] = None) -> List[str]:
+    """
+    Características de un registro cuya prevalencia se mide en la flota
+
+    Args:
+        task_name: Tarea de origen
+        record: Registro
+        templates: Tabla TemplateId -> texto de la plantilla (si los
+            mensajes se comprimieron con TemplateMiner)
+
+    La clave de un evento se calcula siempre sobre el mensaje original (se
+    reconstruye si está comprimido), de modo que no depende del orden del
+    procesado ni de las plantillas aprendidas en cada equipo.
+
+    Returns:
+        Claves 'tipo:valor' (vacía si la tarea no tiene características)
+    """
+    def value(name):
+        item = record.get(name)
+        return '' if item is None else str(item).strip()
+
+    features = []
+    if task_name == 'Get-UnsignedProcesses':
+        if value('Path'):
+            features.append(f"ruta:{_path_key(value('Path'))}")
+        features.append(f"firmante:{value('Signer').lower() or '-'}")
+    elif task_name == 'Get-InternetProcesses':
+        if value('ProcessName'):
+            features.append(f"proceso:{value('ProcessName').lower()}")
+        if value('RemoteAS'):
+            features.append(f"asn:{value('RemoteAS')}")
+        elif value('RemoteAddress'):
+            features.append(f"destino:{value('RemoteAddress')}")
+        if value('RemotePort'):
+            features.append(f"puerto:{value('RemotePort')}")
+    elif task_name == 'Get-SuspiciousEvents':
+        if 'TemplateId' in record:
+            template = (templates or {}).get(record['TemplateId'])
+            message = render_message(template, value('Params')) if template is not None else ''
+        else:
+            message = value('Message')
+        text = _NUMBER_RE.sub('#', ' '.join(message.split()))
+        features.append(f"plantilla:{value('LogName')}|{value('Id')}|{text}")
+    return features
+
+
+class PrevalenceStore:
+    """
+    Prevalencia de cada característica en la flota con memoria acotada
+
+    Un count-min sketch cuenta cuántos equipos distintos han visto cada
+    característica (ruta de proceso, firmante, ASN o puerto remoto,
+    plantilla de evento); un filtro de Bloom de pares (equipo,
+    característica) evita contar dos veces el mismo equipo y otro estima el
+    número de equipos. El tamaño del sketch no depende del número de
+    equipos ni de características. La prevalencia de un registro para un
+    equipo excluye su propia aportación.
+
+    Los almacenes de distintos equipos se fusionan con merge(). Cada
+    almacén tiene un identificador y una versión que aumenta al guardarlo,
+    y las aportaciones de cada origen se guardan por separado (como
+    contadores dispersos). Fusionar de nuevo el mismo almacén no cambia
+    nada, y fusionar una versión más reciente sustituye a la anterior en
+    lugar de sumarse.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_STORE_PATH,
+        width: int = 1 << 16,
+        depth: int = 4,
+        pair_bits: int = 1 << 25,
+        host_bits: int = 1 << 20,
+        min_hosts: int = MIN_HOSTS,
+        threshold: float = DEFAULT_THRESHOLD
+    ):
+        """
+        Abre el almacén (o lo crea vacío)
+
+        Args:
+            path: Archivo del almacén
+            width: Contadores por fila del count-min sketch
+            depth: Filas del count-min sketch
+            pair_bits: Bits del filtro de pares (equipo, característica)
+            host_bits: Bits del filtro de equipos
+            min_hosts: Equipos necesarios para calcular prevalencias
+            threshold: Prevalencia a partir de la cual se omite un registro
+                (0 para solo calcular la rareza)
+
+        Raises:
+            ValueError: Si el archivo existe pero no es un almacén válido
+        """
+        self.path = path
+        self.min_hosts = min_hosts
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.store_id = uuid.uuid4().hex
+        self.version = 0
+        # Aportación de este almacén y total (propia + otros almacenes)
+        self.local = CountMinSketch(width, depth)
+        self.sketch = CountMinSketch(width, depth)
+        # Aportación de cada almacén fusionado: id -> (versión, posiciones, valores)
+        self.sources: Dict[str, Tuple[int, array, array]] = {}
+        self.pairs = BloomFilter(pair_bits)
+        self.hosts = BloomFilter(host_bits)
+        if os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(path, 'rb') as f:
+            magic = f.readline()
+            if magic not in (_MAGIC, _MAGIC_V1):
+                raise ValueError(f"{path} no es un almacén de prevalencia")
+            header = json.loads(f.readline())
+            size = header['width'] * header['depth']
+
+            def read_counters(count: int) -> array:
+                counters = array('I')
+                data = f.read(4 * count)
+                if len(data) != 4 * count:
+                    raise ValueError(f"{path} está truncado")
+                counters.frombytes(data)
+                return counters
+
+            self.local = CountMinSketch(header['width'], header['depth'])
+            self.local.counters = read_counters(size)
+            self.sketch = CountMinSketch(header['width'], header['depth'])
+            if magic == _MAGIC_V1:
+                # Formato anterior sin orígenes: todo cuenta como propio
+                self.sketch.counters = array('I', self.local.counters)
+            else:
+                self.sketch.counters = read_counters(size)
+            self.pairs = BloomFilter(header['pair_bits'], header['pair_hashes'])
+            self.pairs.data = bytearray(f.read(header['pair_bits'] // 8))
+            self.hosts = BloomFilter(header['host_bits'], header['host_hashes'])
+            self.hosts.data = bytearray(f.read(header['host_bits'] // 8))
+            if (len(self.pairs.data) != header['pair_bits'] // 8
+                    or len(self.hosts.data) != header['host_bits'] // 8):
+                raise ValueError(f"{path} está truncado")
+            self.store_id = header.get('id', self.store_id)
+            self.version = header.get('version', 0)
+            self.sources = {}
+            for source in header.get('sources', []):
+                positions = read_counters(source['entries'])
+                values = read_counters(source['entries'])
+                self.sources[source['id']] = (source['version'], positions, values)
+
+    @property
+    def host_count(self) -> int:
+        """Equipos distintos que han aportado datos (estimado)"""
+        return self.hosts.estimate_count()
+
+    def observe(self, records: ColumnarRecords, host: str) -> int:
+        """
+        Cuenta las características de los registros de un equipo
+
+        Args:
+            records: Registros de una tarea
+            host: Equipo del que proceden
+
+        Returns:
+            Características nuevas para este equipo
+        """
+        templates = records.lookup_tables.get('TemplateId', {})
+        new = 0
+        with self._lock:
+            self.hosts.add(host)
+            for record in records.iter_records():
+                for feature in record_features(records.task_name, record, templates):
+                    if self.pairs.add(f"{host}\x1f{feature}"):
+                        self.local.add(feature)
+                        self.sketch.add(feature)
+                        new += 1
+        return new
+
+    def prevalence(self, feature: str, host: Optional[str] = None) -> Optional[float]:
+        """
+        Fracción de los demás equipos que han visto la característica
+
+        Args:
+            feature: Clave 'tipo:valor'
+            host: Equipo cuya aportación se excluye
+
+        Returns:
+            Prevalencia entre 0 y 1, o None si hay menos de min_hosts equipos
+        """
+        hosts = self.host_count
+        count = self.sketch.estimate(feature)
+        if host is not None and host in self.hosts:
+            hosts -= 1
+            if f"{host}\x1f{feature}" in self.pairs:
+                count -= 1
+        if hosts < self.min_hosts:
+            return None
+        return min(1.0, max(0, count) / hosts)
+
+    def merge(self, other: 'PrevalenceStore') -> int:
+        """
+        Incorpora las aportaciones de otro almacén (de otros equipos)
+
+        Se incorporan la aportación propia del otro almacén y las de los
+        almacenes que él ya había fusionado. Cada origen se cuenta una sola
+        vez: las versiones ya incorporadas (o anteriores) se ignoran, una
+        versión más reciente sustituye a la anterior y la aportación de
+        este mismo almacén nunca se vuelve a sumar.
+
+        Args:
+            other: Almacén de otro equipo
+
+        Returns:
+            Orígenes incorporados o actualizados (0 si ya estaba fusionado)
+        """
+        if (other.sketch.width, other.sketch.depth) != (self.sketch.width, self.sketch.depth):
+            raise ValueError("Los almacenes tienen dimensiones distintas")
+        positions, values = other.local.nonzero()
+        contributions = [(other.store_id, other.version, positions, values)]
+        contributions.extend(
+            (source_id, version, positions, values)
+            for source_id, (version, positions, values) in other.sources.items()
+        )
+        applied = 0
+        with self._lock:
+            for source_id, version, positions, values in contributions:
+                if source_id == self.store_id:
+                    continue
+                current = self.sources.get(source_id)
+                if current is not None and current[0] >= version:
+                    continue
+                if current is not None:
+                    self.sketch.add_sparse(current[1], current[2], -1)
+                self.sketch.add_sparse(positions, values)
+                self.sources[source_id] = (version, positions, values)
+                applied += 1
+            # La unión de filtros de Bloom es idempotente
+            self.pairs.merge(other.pairs)
+            self.hosts.merge(other.hosts)
+        return applied
+
+    def save(self):
+        """Guarda el almacén de forma atómica"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with self._lock:
+            self.version += 1
+            header = {
+                'width': self.sketch.width, 'depth': self.sketch.depth,
+                'pair_bits': self.pairs.bits, 'pair_hashes': self.pairs.hashes,
+                'host_bits': self.hosts.bits, 'host_hashes': self.hosts.hashes,
+                'id': self.store_id, 'version': self.version,
+                'sources': [
+                    {'id': source_id, 'version': version, 'entries': len(positions)}
+                    for source_id, (version, positions, _) in self.sources.items()
+                ],
+            }
+            with open(tmp_path, 'wb') as f:
+                f.write(_MAGIC)
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                f.write(self.local.counters.tobytes())
+                f.write(self.sketch.counters.tobytes())
+                f.write(self.pairs.data)
+                f.write(self.hosts.data)
+                for _, positions, values in self.sources.values():
+                    f.write(positions.tobytes())
+                    f.write(values.tobytes())
+            os.replace(tmp_path, self.path)
+
+
+def suppress_common(
+    records: ColumnarRecords,
+    store: PrevalenceStore,
+    host: Optional[str],
+    threshold: Optional[float] = None,
+    keep_column: str = 'IOC'
+) -> Tuple[ColumnarRecords, int]:
+    """
+    Agrega la rareza de cada registro y omite los habituales en la flota
+
+    La rareza de un registro es 1 menos la prevalencia de su característica
+    menos común: basta un proceso, firmante, destino o evento poco visto
+    para que el registro se considere inusual. Los registros con
+    coincidencias de IOC se conservan siempre.
+
+    Args:
+        records: Registros de una tarea
+        store: Almacén de prevalencia
+        host: Equipo analizado (su propia aportación no cuenta)
+        threshold: Prevalencia a partir de la cual se omite un registro
+            (por defecto, la del almacén; 0 para no omitir ninguno)
+        keep_column: Columna que, si tiene valor, impide omitir el registro
+
+    Returns:
+        Tupla (contenedor con la columna de rareza, registros omitidos). Si
+        la tarea no tiene características o aún no hay equipos suficientes,
+        se devuelven los registros originales.
+    """
+    threshold = store.threshold if threshold is None else threshold
+    templates = records.lookup_tables.get('TemplateId', {})
+    own = host is not None and host in store.hosts
+    if store.host_count - own < store.min_hosts:
+        return records, 0
+
+    schema = dict(records.schema)
+    schema[RARITY_COLUMN] = 'cat'
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    cache: Dict[str, Optional[float]] = {}
+    suppressed = 0
+    for record in records.iter_records():
+        features = record_features(records.task_name, record, templates)
+        if not features:
+            return records, 0
+        prevalences = []
+        for feature in features:
+            if feature not in cache:
+                cache[feature] = store.prevalence(feature, host)
+            prevalences.append(cache[feature] or 0.0)
+        lowest = min(prevalences)
+        if threshold > 0 and lowest >= threshold and not record.get(keep_column):
+            suppressed += 1
+            continue
+        record[RARITY_COLUMN] = f"{1 - lowest:.2f}"
+        result.append(record)
+    return result, suppressed
+
+
+def merge_stores(paths: Iterable[str], store: PrevalenceStore) -> int:
+    """
+    Fusiona en 'store' los almacenes de otros equipos y lo guarda
+
+    Args:
+        paths: Archivos de almacén de otros equipos
+        store: Almacén local
+
+    Returns:
+        Equipos del almacén resultante (estimado)
+    """
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No existe el almacén {path}")
+        if not store.merge(PrevalenceStore(path)):
+            logger.warning(f"{path} ya estaba fusionado; se ignora")
+    store.save()
+    return store.host_count
@@ -0,0 +1,297 @@
+"""
+Módulo para perfilar el consumo de CPU y memoria de cada etapa del análisis
+"""
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Etapas que se perfilan de cada componente
+STAGES = {
+    'PowerShellHelper': ('get_suspicious_events', 'get_internet_processes', 'get_unsigned_processes'),
+    'AIAnalyzer': ('analyze_forensic_data', 'analyze_multiple_tasks', 'analyze_tasks_concurrently', 'consolidate_analyses'),
+    'PDFGenerator': ('generate_forensic_report', 'generate_multiple_tasks_report'),
+}
+
+# Elementos de cada listado (funciones y líneas que más asignan)
+TOP_ENTRIES = 15
+
+# Directorio de los perfiles sin reporte PDF asociado
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'reportes')
+
+
+@dataclass
+class StageProfile:
+    """Mediciones de una ejecución de una etapa"""
+    name: str
+    seconds: float
+    memory_delta: int
+    memory_peak: int
+    stats: Optional[pstats.Stats] = None
+    allocations: List[tracemalloc.StatisticDiff] = field(default_factory=list)
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def _function_label(key: Tuple[str, int, str]) -> str:
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class Profiler:
+    """
+    Perfilador por etapas con cProfile y tracemalloc
+
+    instrument() envuelve los métodos de cada etapa en las instancias de
+    PowerShellHelper, AIAnalyzer y PDFGenerator. Desactivado, la envoltura
+    solo comprueba un atributo por llamada (las etapas duran segundos), y
+    tracemalloc no se inicia hasta activarlo. Activado, cada etapa guarda
+    sus estadísticas pstats y las líneas que más memoria asignaron; al
+    generar un PDF los perfiles acumulados se escriben en un directorio
+    junto a él (<reporte>_perfil) con un resumen de las funciones más
+    costosas y los mayores asignadores.
+
+    cProfile solo mide el hilo que ejecuta la etapa. Una etapa anidada en
+    otra del mismo hilo (por ejemplo la consolidación dentro del análisis
+    en paralelo) se mide solo en tiempo y memoria: su CPU ya aparece en la
+    etapa exterior. Lo mismo ocurre si el intérprete no permite otro
+    perfilador activo a la vez (Python 3.12+ con etapas en paralelo).
+    """
+
+    def __init__(self, enabled: bool = False, output_dir: str = DEFAULT_OUTPUT_DIR, frames: int = 1):
+        """
+        Args:
+            enabled: Si el perfilado empieza activo
+            output_dir: Directorio de los perfiles que no tienen PDF asociado
+            frames: Marcos de pila que guarda tracemalloc por asignación
+        """
+        self.output_dir = output_dir
+        self.frames = frames
+        self.enabled = False
+        self.profiles: List[StageProfile] = []
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._local = threading.local()
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        """Activa el perfilado"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.enabled = True
+
+    def disable(self):
+        """Desactiva el perfilado y guarda las etapas pendientes"""
+        self.enabled = False
+        self.flush()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def toggle(self) -> bool:
+        """Alterna el perfilado y devuelve el nuevo estado"""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Perfila el bloque como una etapa
+
+        Args:
+            name: Nombre de la etapa
+        """
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            outermost = self._depth == 0
+            self._depth += 1
+        if outermost:
+            tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        profile: Optional[cProfile.Profile] = None
+        if not getattr(self._local, 'profiling', False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self._local.profiling = True
+            except ValueError:
+                profile = None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+                self._local.profiling = False
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            with self._lock:
+                self._depth -= 1
+            self._record(StageProfile(
+                name=name,
+                seconds=seconds,
+                memory_delta=current - memory_before,
+                memory_peak=peak,
+                stats=pstats.Stats(profile) if profile is not None and profile.getstats() else None,
+                allocations=self._allocations(before, after),
+            ))
+
+    def _allocations(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot):
+        """Líneas con más memoria asignada durante la etapa (sin tracemalloc)"""
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        return after.filter_traces(filters).compare_to(
+            before.filter_traces(filters), 'lineno'
+        )[:TOP_ENTRIES]
+
+    def _record(self, profile: StageProfile):
+        with self._lock:
+            self.profiles.append(profile)
+        logger.info(
+            f"[perfil] {profile.name}: {profile.seconds:.2f} s, "
+            f"memoria {_format_bytes(profile.memory_delta)} (pico {_format_bytes(profile.memory_peak)})"
+        )
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        """Envuelve una función para perfilarla como etapa cuando está activo"""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return function(*args, **kwargs)
+            with self.stage(name):
+                result = function(*args, **kwargs)
+            # Los perfiles se guardan junto al PDF que se acaba de generar
+            if isinstance(result, str) and result.lower().endswith('.pdf'):
+                self.flush(os.path.splitext(result)[0] + '_perfil')
+            return result
+        return wrapper
+
+    def instrument(self, *components: Any) -> 'Profiler':
+        """
+        Envuelve las etapas de las instancias indicadas (ver STAGES)
+
+        Args:
+            *components: Instancias de PowerShellHelper, AIAnalyzer y
+                PDFGenerator (se ignoran las que sean None)
+
+        Returns:
+            El propio perfilador
+        """
+        for component in components:
+            if component is None:
+                continue
+            class_name = type(component).__name__
+            for method in STAGES.get(class_name, ()):
+                setattr(component, method, self.wrap(f"{class_name}.{method}", getattr(component, method)))
+        return self
+
+    def flush(self, directory: Optional[str] = None) -> Optional[str]:
+        """
+        Escribe los perfiles acumulados y los descarta
+
+        Args:
+            directory: Directorio de salida (por defecto, uno nuevo con
+                fecha en output_dir)
+
+        Returns:
+            Directorio escrito, o None si no había perfiles
+        """
+        with self._lock:
+            profiles, self.profiles = self.profiles, []
+        if not profiles:
+            return None
+
+        if directory is None:
+            directory = os.path.join(
+                self.output_dir, f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            )
+        os.makedirs(directory, exist_ok=True)
+
+        for position, profile in enumerate(profiles, start=1):
+            base = os.path.join(directory, f"{position:02d}_{re.sub(r'[^A-Za-z0-9_]+', '_', profile.name)}")
+            if profile.stats is not None:
+                profile.stats.dump_stats(base + '.pstats')
+            with open(base + '_memoria.txt', 'w', encoding='utf-8') as f:
+                f.write(self._allocation_report(profile))
+
+        with open(os.path.join(directory, 'resumen.txt'), 'w', encoding='utf-8') as f:
+            f.write(self._summary(profiles))
+        print(f"✓ Perfil de CPU y memoria guardado en: {directory}")
+        return directory
+
+    @staticmethod
+    def _allocation_report(profile: StageProfile) -> str:
+        lines = [
+            f"Etapa: {profile.name}",
+            f"Duración: {profile.seconds:.3f} s",
+            f"Memoria retenida: {_format_bytes(profile.memory_delta)}",
+            f"Pico de memoria: {_format_bytes(profile.memory_peak)}",
+            "",
+            "Líneas con más memoria asignada:",
+        ]
+        for diff in profile.allocations:
+            lines.append(f"  {_format_bytes(diff.size_diff):>10}  {diff.count_diff:>+8} bloques  {diff.traceback}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _summary(profiles: Iterable[StageProfile]) -> str:
+        """Resumen de etapas, funciones más costosas y mayores asignadores"""
+        profiles = list(profiles)
+        lines = ["Etapas:"]
+        for profile in profiles:
+            lines.append(
+                f"  {profile.name:<50} {profile.seconds:>9.3f} s  "
+                f"{_format_bytes(profile.memory_delta):>10}  pico {_format_bytes(profile.memory_peak)}"
+            )
+
+        combined = pstats.Stats(stream=io.StringIO())
+        for profile in profiles:
+            if profile.stats is not None:
+                combined.add(profile.stats)
+        if combined.stats:
+            lines += ["", "Funciones más costosas (tiempo propio):"]
+            ranked = sorted(combined.stats.items(), key=lambda item: item[1][2], reverse=True)
+            for key, (_, calls, tottime, cumtime, _) in ranked[:TOP_ENTRIES]:
+                lines.append(
+                    f"  {tottime:>9.3f} s  {cumtime:>9.3f} s acum.  {calls:>9} llamadas  {_function_label(key)}"
+                )
+
+        allocators = {}
+        for profile in profiles:
+            for diff in profile.allocations:
+                location = str(diff.traceback)
+                allocators[location] = allocators.get(location, 0) + diff.size_diff
+        if allocators:
+            lines += ["", "Mayores asignadores de memoria:"]
+            for location, size in sorted(allocators.items(), key=lambda item: item[1], reverse=True)[:TOP_ENTRIES]:
+                lines.append(f"  {_format_bytes(size):>10}  {location}")
+
+        lines += ["", "Los archivos .pstats se abren con: python -m pstats <archivo>"]
+        return '\n'.join(lines) + '\n'
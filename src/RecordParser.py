@@ -0,0 +1,204 @@
+"""
+Módulo para convertir la salida de texto de PowerShell en registros (dicts)
+"""
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Secuencias de caracteres distintos de espacio (palabras o guiones)
+_RUN_RE = re.compile(r'\S+')
+
+
+def _split_list_line(line: str) -> Optional[Tuple[str, str]]:
+    """
+    Separa una línea 'Clave : Valor' del formato Format-List
+
+    Returns:
+        Tupla (clave, valor) o None si la línea no tiene ese formato
+    """
+    if not line or line[0].isspace():
+        return None
+
+    sep = line.find(' : ')
+    if sep < 0:
+        if line.rstrip().endswith(' :'):
+            # Propiedad con valor vacío ("Signer           :")
+            key = line.rstrip()[:-2].strip()
+            return (key, '') if key and ' ' not in key else None
+        return None
+
+    key = line[:sep].strip()
+    if not key or ' ' in key:
+        return None
+    return key, line[sep + 3:].strip()
+
+
+def iter_list_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Itera registros en formato Format-List (bloques 'Clave : Valor'
+    separados por líneas en blanco)
+
+    Las líneas de continuación (valores largos partidos por PowerShell)
+    se unen al valor anterior. Las líneas sueltas que no pertenecen a un
+    bloque (por ejemplo, mensajes de Write-Host) se ignoran.
+
+    Args:
+        lines: Líneas de texto sin salto de línea final
+
+    Yields:
+        Dict con las propiedades de cada objeto
+    """
+    record: Dict[str, str] = {}
+    last_key = None
+
+    for line in lines:
+        if not line.strip():
+            if record:
+                yield record
+            record = {}
+            last_key = None
+            continue
+
+        pair = _split_list_line(line)
+        if pair is not None:
+            last_key = pair[0]
+            record[last_key] = pair[1]
+        elif last_key is not None and line[0].isspace():
+            # Continuación del valor anterior
+            record[last_key] = f"{record[last_key]} {line.strip()}".strip()
+        else:
+            # Texto que no forma parte de un objeto
+            if record:
+                yield record
+            record = {}
+            last_key = None
+
+    if record:
+        yield record
+
+
+def _table_columns(header: str, dashes: str) -> List[Tuple[str, int, int]]:
+    """Calcula nombre, inicio y fin de cada columna a partir de la línea de guiones"""
+    columns = []
+    for match in _RUN_RE.finditer(dashes):
+        start, end = match.span()
+        columns.append((header[start:end].strip(), start, end))
+    return columns
+
+
+def _split_table_row(line: str, columns: List[Tuple[str, int, int]]) -> Dict[str, str]:
+    """
+    Asigna cada palabra de la fila a la columna con la que más se solapa
+
+    PowerShell alinea a la derecha las columnas numéricas y a la izquierda
+    las de texto, por lo que no basta con cortar la línea en las posiciones
+    de los guiones.
+    """
+    values: Dict[str, List[str]] = {name: [] for name, _, _ in columns}
+    for match in _RUN_RE.finditer(line):
+        start, end = match.span()
+        best_name = None
+        best_score = None
+        for name, col_start, col_end in columns:
+            overlap = min(end, col_end) - max(start, col_start)
+            # Sin solapamiento se usa la distancia (negativa) como criterio
+            score = overlap if overlap > 0 else -min(abs(start - col_end), abs(col_start - end))
+            if best_score is None or score > best_score:
+                best_name, best_score = name, score
+        values[best_name].append(match.group())
+    return {name: ' '.join(words) for name, words in values.items()}
+
+
+def iter_table_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Itera registros en formato Format-Table (encabezado, línea de guiones
+    y una fila por objeto)
+
+    Args:
+        lines: Líneas de texto sin salto de línea final
+
+    Yields:
+        Dict con las columnas de cada fila
+    """
+    previous = None
+    columns = None
+
+    for line in lines:
+        stripped = line.strip()
+        if columns is None:
+            if stripped and set(stripped) <= {'-', ' '} and previous:
+                columns = _table_columns(previous, line)
+            else:
+                previous = line
+            continue
+
+        if not stripped:
+            # Fin de la tabla; puede venir otra más adelante
+            columns = None
+            previous = None
+            continue
+
+        yield _split_table_row(line, columns)
+
+
+def detect_format(lines: List[str]) -> str:
+    """
+    Detecta si un bloque de líneas es una tabla o una lista
+
+    Returns:
+        'table' o 'list'
+    """
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if set(stripped) <= {'-', ' '} and idx > 0:
+            return 'table'
+        if _split_list_line(line) is not None:
+            return 'list'
+    return 'list'
+
+
+def iter_records(lines: Iterable[str], sample_size: int = 20) -> Iterator[Dict[str, str]]:
+    """
+    Itera registros detectando automáticamente el formato de salida
+
+    Solo se leen por adelantado las primeras `sample_size` líneas no vacías
+    para decidir el formato; el resto se procesa en streaming.
+
+    Args:
+        lines: Líneas de texto sin salto de línea final
+        sample_size: Líneas no vacías usadas para detectar el formato
+
+    Yields:
+        Dict con las propiedades de cada objeto
+    """
+    iterator = iter(lines)
+    head: List[str] = []
+    non_empty = 0
+    for line in iterator:
+        head.append(line)
+        if line.strip():
+            non_empty += 1
+            if non_empty >= sample_size:
+                break
+
+    def chained() -> Iterator[str]:
+        yield from head
+        yield from iterator
+
+    if detect_format(head) == 'table':
+        return iter_table_records(chained())
+    return iter_list_records(chained())
+
+
+def parse_records(text: str) -> List[Dict[str, str]]:
+    """
+    Convierte texto completo de PowerShell en una lista de registros
+
+    Args:
+        text: Salida de PowerShell
+
+    Returns:
+        Lista de dicts con las propiedades de cada objeto
+    """
+    return list(iter_records(text.splitlines()))
@@ -0,0 +1,158 @@
+"""
+Módulo con la caché persistente de verificaciones de firma digital
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# Ruta por defecto de la caché
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'reportes', 'cache_firmas.json')
+
+# Estados que no se guardan: dependen de un error puntual al leer el archivo
+TRANSIENT_STATUSES = {'Unknown', 'UnknownError'}
+
+
+def file_fingerprint(path: str, with_hash: bool = True) -> Optional[Tuple[int, int, str]]:
+    """
+    Tamaño, fecha de modificación y SHA-256 de un archivo
+
+    Args:
+        path: Ruta del archivo
+        with_hash: Si False, no se calcula el hash (se devuelve '')
+
+    Returns:
+        Tupla (tamaño, mtime en ns, hash) o None si no se puede leer
+    """
+    try:
+        stat = os.stat(path)
+        digest = ''
+        if with_hash:
+            hasher = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+class SignatureCache:
+    """
+    Caché de resultados de Get-AuthenticodeSignature por ruta
+
+    Cada entrada guarda el tamaño, la fecha de modificación y el hash del
+    binario verificado; si cualquiera cambia, el binario se vuelve a
+    verificar. Así una segunda pasada sobre un equipo sin cambios solo lee
+    los archivos y no llama a Authenticode.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, verify_hash: bool = True):
+        """
+        Inicializa la caché y carga las entradas guardadas
+
+        Args:
+            path: Archivo JSON de la caché (None para no persistir)
+            verify_hash: Comprobar también el hash del archivo (si False,
+                basta con que coincidan tamaño y fecha de modificación)
+        """
+        self.path = path
+        self.verify_hash = verify_hash
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        # Las rutas de Windows no distinguen mayúsculas
+        return os.path.normcase(path)
+
+    def lookup(self, path: str, fingerprint: Optional[Tuple[int, int, str]]) -> Optional[Dict[str, Any]]:
+        """
+        Busca el resultado de verificación de un archivo
+
+        Args:
+            path: Ruta del binario
+            fingerprint: Resultado de file_fingerprint(path)
+
+        Returns:
+            Dict con 'SignatureStatus' y 'Signer', o None si no está o cambió
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if (
+                entry is None or fingerprint is None
+                or entry['size'] != fingerprint[0]
+                or entry['mtime_ns'] != fingerprint[1]
+                or (self.verify_hash and entry['sha256'] != fingerprint[2])
+            ):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {'SignatureStatus': entry['status'], 'Signer': entry['signer']}
+
+    def digest(self, path: str, size: int, mtime_ns: int) -> Optional[str]:
+        """
+        SHA-256 ya calculado de un archivo, si no ha cambiado desde entonces
+
+        Args:
+            path: Ruta del binario
+            size: Tamaño actual del archivo
+            mtime_ns: Fecha de modificación actual (ns)
+
+        Returns:
+            Hash hexadecimal, o None si no está, cambió o se guardó sin hash
+        """
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if entry is None or entry['size'] != size or entry['mtime_ns'] != mtime_ns:
+                return None
+            return entry['sha256'] or None
+
+    def store(
+        self,
+        path: str,
+        fingerprint: Optional[Tuple[int, int, str]],
+        status: str,
+        signer: Optional[str]
+    ):
+        """Guarda el resultado de verificación de un archivo"""
+        if fingerprint is None or status in TRANSIENT_STATUSES:
+            return
+        with self._lock:
+            self._entries[self._key(path)] = {
+                'size': fingerprint[0],
+                'mtime_ns': fingerprint[1],
+                'sha256': fingerprint[2],
+                'status': status,
+                'signer': signer,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """Carga la caché desde JSON (si está dañada se empieza vacía)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            self._entries = {}
+
+    def save(self):
+        """Guarda la caché en JSON descartando los archivos que ya no existen"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = {key: entry for key, entry in self._entries.items() if os.path.exists(key)}
+            self._entries = entries
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
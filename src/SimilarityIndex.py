@@ -0,0 +1,382 @@
+"""
+Módulo para reutilizar análisis de instantáneas casi idénticas (SimHash)
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from ColumnarRecords import ColumnarRecords
+
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto del índice
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(__file__), 'reportes', 'similitud')
+
+# Similitud (Jaccard ponderado) mínima para reutilizar un análisis
+# (AUTOFORENSE_SIMILITUD; desactivado por defecto)
+DEFAULT_THRESHOLD = 0.0
+
+# Bandas de 8 bits de la huella de 64 bits: dos huellas a distancia de
+# Hamming <= 7 comparten al menos una banda
+BANDS = 8
+BAND_BITS = 64 // BANDS
+
+# Distancia de Hamming máxima de los candidatos que se comparan registro a registro
+MAX_DISTANCE = 12
+
+# Candidatos más cercanos que se comparan registro a registro
+MAX_CANDIDATES = 5
+
+# Columnas que cambian entre dos recolecciones del mismo equipo sin que
+# cambie nada relevante (puertos efímeros, PID, fechas)
+VOLATILE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'Get-SuspiciousEvents': ('TimeCreated',),
+    'Get-InternetProcesses': ('PID', 'LocalPort', 'CreationTime'),
+    'Get-UnsignedProcesses': ('PID', 'StartTime'),
+}
+
+# Columnas de texto libre en las que se enmascaran los números
+TEXT_COLUMNS = ('Message', 'Params')
+
+# Solo se enmascaran los números sueltos (identificadores de sesión, PID,
+# puertos): los que forman parte de una IP, una cuenta, un SID o una ruta
+# identifican entidades y deben distinguir una instantánea de otra
+_NUMBER_RE = re.compile(r'(?<![\w.:\\/@$-])(?:0x[0-9a-fA-F]+|\d+)(?![\w.:\\/@$-])')
+
+
+def threshold_from_env() -> float:
+    """Umbral configurado en AUTOFORENSE_SIMILITUD (por defecto 0, desactivado)"""
+    try:
+        return float(os.getenv('AUTOFORENSE_SIMILITUD', DEFAULT_THRESHOLD))
+    except ValueError:
+        logger.warning("AUTOFORENSE_SIMILITUD no es un número; se usa el valor por defecto")
+        return DEFAULT_THRESHOLD
+
+
+def record_hashes(records: ColumnarRecords) -> List[int]:
+    """
+    Hash de 64 bits de cada registro normalizado
+
+    Se omiten las columnas volátiles de la tarea y los números sueltos de
+    los mensajes, de modo que un mismo evento o conexión produce el mismo
+    hash en dos recolecciones. Las IP, cuentas y demás valores de entidad
+    se conservan.
+
+    Args:
+        records: Registros de una tarea
+
+    Returns:
+        Lista de hashes en el orden de los registros
+    """
+    ignored = set(VOLATILE_COLUMNS.get(records.task_name, ()))
+    columns = [name for name in records.columns if name not in ignored]
+    templates = records.lookup_tables.get('TemplateId', {})
+    hashes = []
+    for record in records.iter_records():
+        parts = []
+        for name in columns:
+            value = record.get(name)
+            if name == 'TemplateId':
+                # Los identificadores dependen de la tabla de plantillas; el texto no
+                value = templates.get(value, value)
+            elif name in TEXT_COLUMNS and value:
+                value = _NUMBER_RE.sub('#', str(value))
+            parts.append(f"{name}={value}")
+        digest = hashlib.blake2b('\x1f'.join(parts).encode('utf-8', 'replace'), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, 'little'))
+    return hashes
+
+
+def simhash(hashes: Iterable[int]) -> int:
+    """
+    Huella SimHash de 64 bits de un conjunto de hashes
+
+    Cada bit de la huella es el voto mayoritario de ese bit en los hashes;
+    conjuntos que comparten la mayoría de elementos dan huellas a poca
+    distancia de Hamming. Los votos se cuentan por bytes con Counter (en C)
+    en lugar de recorrer los 64 bits de cada hash.
+    """
+    hashes = list(hashes)
+    if not hashes:
+        return 0
+    data = struct.pack(f'<{len(hashes)}Q', *hashes)
+    votes = [0] * 64
+    for byte_index in range(8):
+        for value, count in Counter(data[byte_index::8]).items():
+            for bit in range(8):
+                if value >> bit & 1:
+                    votes[byte_index * 8 + bit] += count
+    half = len(hashes) / 2
+    return sum(1 << bit for bit, count in enumerate(votes) if count > half)
+
+
+def _weighted_jaccard(a: Dict[int, int], b: Dict[int, int]) -> float:
+    """Índice de Jaccard de dos multiconjuntos (suma de mínimos / suma de máximos)"""
+    keys = a.keys() | b.keys()
+    maximum = sum(max(a.get(key, 0), b.get(key, 0)) for key in keys)
+    if not maximum:
+        return 0.0
+    return sum(min(a.get(key, 0), b.get(key, 0)) for key in keys) / maximum
+
+
+def hamming(a: int, b: int) -> int:
+    """Número de bits distintos entre dos huellas"""
+    return bin(a ^ b).count('1')
+
+
+@dataclass
+class Snapshot:
+    """Huella de los registros de una tarea"""
+    task_name: str
+    hashes: List[int]
+    unique: FrozenSet[int]
+    fingerprint: int
+    # Veces que aparece cada registro (400 inicios de sesión fallidos no
+    # equivalen a uno)
+    counts: Dict[int, int] = field(default_factory=dict)
+
+
+@dataclass
+class SimilarMatch:
+    """Análisis anterior de una instantánea similar"""
+    entry_id: str
+    similarity: float
+    result: Dict[str, Any]
+    new_positions: List[int] = field(default_factory=list)
+    removed: int = 0
+    # Registros presentes en ambas instantáneas con distinto número de apariciones
+    changed_counts: int = 0
+
+    @property
+    def identical(self) -> bool:
+        return not self.new_positions and not self.removed and not self.changed_counts
+
+
+class SimilarityIndex:
+    """
+    Índice de análisis anteriores por huella SimHash
+
+    Cada entrada guarda la huella de la instantánea, los hashes de sus
+    registros con sus apariciones y el resultado del análisis. La búsqueda
+    obtiene candidatos por bandas de la huella (búsqueda LSH, sin recorrer
+    todo el índice), los ordena por distancia de Hamming y confirma la
+    similitud con el índice de Jaccard ponderado por apariciones de los
+    más cercanos.
+    """
+
+    def __init__(
+        self,
+        index_dir: str = DEFAULT_INDEX_DIR,
+        threshold: Optional[float] = None,
+        max_age_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 20000
+    ):
+        """
+        Inicializa el índice y carga las entradas vigentes
+
+        Args:
+            index_dir: Directorio del índice
+            threshold: Similitud mínima para reutilizar (por defecto, AUTOFORENSE_SIMILITUD)
+            max_age_seconds: Antigüedad máxima de un análisis reutilizable
+            max_entries: Entradas que se conservan (se eliminan las más antiguas)
+        """
+        self.index_dir = index_dir
+        self.threshold = threshold if threshold is not None else threshold_from_env()
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self.index_path = os.path.join(index_dir, 'indice.jsonl')
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._bands: Dict[Tuple[str, int, int], Set[str]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(index_dir, exist_ok=True)
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _band_keys(task_name: str, fingerprint: int) -> List[Tuple[str, int, int]]:
+        mask = (1 << BAND_BITS) - 1
+        return [(task_name, band, fingerprint >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+    def _index_entry(self, entry: Dict[str, Any]):
+        self._entries[entry['id']] = entry
+        for key in self._band_keys(entry['task'], entry['fingerprint']):
+            self._bands.setdefault(key, set()).add(entry['id'])
+
+    def _entry_path(self, entry_id: str) -> str:
+        return os.path.join(self.index_dir, f"{entry_id}.json")
+
+    def load(self):
+        """Carga el índice y descarta las entradas caducadas"""
+        self._entries.clear()
+        self._bands.clear()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entry['fingerprint'] = int(entry['fingerprint'], 16)
+                    except (ValueError, KeyError):
+                        continue
+                    self._index_entry(entry)
+        self.prune()
+
+    def prune(self):
+        """Elimina las entradas caducadas o que exceden max_entries"""
+        cutoff = time.time() - self.max_age_seconds
+        entries = sorted(self._entries.values(), key=lambda entry: entry['created'])
+        expired = [entry for entry in entries if entry['created'] < cutoff]
+        kept = [entry for entry in entries if entry['created'] >= cutoff]
+        if len(kept) > self.max_entries:
+            expired.extend(kept[:len(kept) - self.max_entries])
+            kept = kept[len(kept) - self.max_entries:]
+        if not expired:
+            return
+
+        for entry in expired:
+            try:
+                os.remove(self._entry_path(entry['id']))
+            except OSError:
+                pass
+        self._entries.clear()
+        self._bands.clear()
+        for entry in kept:
+            self._index_entry(entry)
+
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in kept:
+                f.write(json.dumps(dict(entry, fingerprint=f"{entry['fingerprint']:016x}")) + '\n')
+        os.replace(tmp_path, self.index_path)
+        logger.info(f"Índice de similitud: {len(expired)} entradas caducadas eliminadas")
+
+    def snapshot(self, task_name: str, records: ColumnarRecords) -> Snapshot:
+        """Calcula la huella de los registros de una tarea"""
+        hashes = record_hashes(records)
+        counts = Counter(hashes)
+        unique = frozenset(counts)
+        return Snapshot(task_name, hashes, unique, simhash(unique), dict(counts))
+
+    def _load_records(self, entry_id: str) -> Optional[Tuple[Dict[int, int], Dict[str, Any]]]:
+        try:
+            with open(self._entry_path(entry_id), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        packed = base64.b64decode(data['records'])
+        values = struct.unpack(f'<{len(packed) // 8}Q', packed)
+        if 'counts' not in data:
+            # Entrada sin apariciones: no puede confirmar que los datos coinciden
+            return None
+        packed_counts = base64.b64decode(data['counts'])
+        counts = struct.unpack(f'<{len(packed_counts) // 4}I', packed_counts)
+        if len(counts) != len(values):
+            return None
+        return dict(zip(values, counts)), data['result']
+
+    def find(self, snapshot: Snapshot) -> Optional[SimilarMatch]:
+        """
+        Busca el análisis anterior más parecido
+
+        Args:
+            snapshot: Huella de la instantánea actual
+
+        Returns:
+            Análisis reutilizable con las posiciones de los registros que no
+            estaban en la instantánea anterior, o None si ninguno supera el umbral
+        """
+        if self.threshold <= 0 or not snapshot.unique:
+            return None
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(snapshot.task_name, snapshot.fingerprint):
+                candidates |= self._bands.get(key, set())
+            ranked = sorted(
+                (hamming(snapshot.fingerprint, self._entries[entry_id]['fingerprint']), entry_id)
+                for entry_id in candidates
+                if self._entries[entry_id]['created'] >= cutoff
+            )
+        ranked = [entry_id for distance, entry_id in ranked if distance <= MAX_DISTANCE][:MAX_CANDIDATES]
+
+        best = None
+        for entry_id in ranked:
+            loaded = self._load_records(entry_id)
+            if loaded is None:
+                continue
+            stored, result = loaded
+            similarity = _weighted_jaccard(snapshot.counts, stored)
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                best = (similarity, entry_id, stored, result)
+        if best is None:
+            return None
+
+        similarity, entry_id, stored, result = best
+        logger.info(f"Instantánea de {snapshot.task_name} similar a {entry_id} ({similarity:.2f})")
+        # Los registros cuyo número de apariciones cambió se envían como nuevos
+        changed = {
+            value for value, count in snapshot.counts.items()
+            if value in stored and stored[value] != count
+        }
+        return SimilarMatch(
+            entry_id=entry_id,
+            similarity=similarity,
+            result=result,
+            new_positions=[
+                position for position, value in enumerate(snapshot.hashes)
+                if value not in stored or value in changed
+            ],
+            removed=sum(1 for value in stored if value not in snapshot.counts),
+            changed_counts=len(changed),
+        )
+
+    def add(self, snapshot: Snapshot, result: Dict[str, Any]) -> str:
+        """
+        Guarda el análisis de una instantánea
+
+        Args:
+            snapshot: Huella de la instantánea analizada
+            result: Resultado de AIAnalyzer.analyze_forensic_data
+
+        Returns:
+            Identificador de la entrada
+        """
+        entry_id = uuid.uuid4().hex
+        entry = {
+            'id': entry_id,
+            'task': snapshot.task_name,
+            'fingerprint': snapshot.fingerprint,
+            'created': time.time(),
+            'records': len(snapshot.unique),
+        }
+        values = sorted(snapshot.unique)
+        counts = [min(snapshot.counts.get(value, 1), 0xFFFFFFFF) for value in values]
+        data = {
+            'task': snapshot.task_name,
+            'records': base64.b64encode(struct.pack(f'<{len(values)}Q', *values)).decode('ascii'),
+            'counts': base64.b64encode(struct.pack(f'<{len(counts)}I', *counts)).decode('ascii'),
+            'result': {
+                key: result.get(key) for key in ('summary_short', 'analysis', 'full_text')
+            },
+        }
+        path = self._entry_path(entry_id)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+        with self._lock:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(entry, fingerprint=f"{snapshot.fingerprint:016x}")) + '\n')
+            self._index_entry(entry)
+        return entry_id
@@ -0,0 +1,241 @@
+"""
+Módulo para agrupar peticiones idénticas en curso (single-flight)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directorio por defecto de los bloqueos compartidos entre procesos
+DEFAULT_LOCK_DIR = os.path.join(os.path.dirname(__file__), 'reportes', 'en_curso')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliza un prompt para comparar peticiones (espacios y saltos de línea)"""
+    return ' '.join(prompt.split())
+
+
+def prompt_key(prompt: str) -> str:
+    """Clave de agrupación de un prompt"""
+    return hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+
+
+class _Call:
+    """Llamada en curso dentro del proceso"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Agrupa las peticiones idénticas que están en curso al mismo tiempo
+
+    Dentro del proceso, los hilos que piden la misma clave esperan a la
+    primera llamada y reciben su resultado. Entre procesos del mismo equipo
+    la coordinación se hace con un archivo de bloqueo por clave: el proceso
+    que lo crea hace la llamada y deja el resultado en disco, y los demás
+    esperan a que aparezca. Si el proceso líder falla, otro toma el relevo.
+    """
+
+    def __init__(
+        self,
+        lock_dir: Optional[str] = DEFAULT_LOCK_DIR,
+        poll_interval: float = 0.25,
+        stale_after: float = 600,
+        result_ttl: float = 120
+    ):
+        """
+        Inicializa el agrupador
+
+        Args:
+            lock_dir: Directorio de bloqueos y resultados compartidos entre
+                procesos. None para agrupar solo dentro del proceso.
+            poll_interval: Segundos entre comprobaciones al esperar a otro proceso
+            stale_after: Antigüedad a partir de la cual un bloqueo se considera
+                abandonado
+            result_ttl: Segundos que se conserva un resultado compartido para
+                los procesos que aún lo esperan
+        """
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.result_ttl = result_ttl
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, _Call] = {}
+        self.upstream_calls = 0
+        self.saved_calls = 0
+
+    def do(self, key: str, fn: Callable[[], str]) -> str:
+        """
+        Ejecuta fn una sola vez por clave entre todas las peticiones simultáneas
+
+        Args:
+            key: Clave de la petición (por ejemplo, prompt_key(prompt))
+            fn: Función que hace la llamada real y devuelve texto
+
+        Returns:
+            Resultado de la llamada (propia o compartida)
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.saved_calls += 1
+
+        if not leader:
+            logger.info(f"Petición idéntica en curso, esperando su resultado ({key[:12]})")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.done.set()
+
+    # -- Coordinación entre procesos --------------------------------------
+
+    def _paths(self, key: str):
+        return (
+            os.path.join(self.lock_dir, f"{key}.lock"),
+            os.path.join(self.lock_dir, f"{key}.json"),
+        )
+
+    def _read_result(self, result_path: str) -> Optional[str]:
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return None
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['text']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _remove_if_stale(self, lock_path: str) -> bool:
+        """
+        Elimina el bloqueo si su líder lleva demasiado tiempo (proceso caído)
+
+        Returns:
+            True si el bloqueo ya no existe (eliminado o liberado)
+        """
+        try:
+            if time.time() - os.path.getmtime(lock_path) <= self.stale_after:
+                return False
+            logger.warning(f"Bloqueo compartido abandonado, se elimina: {lock_path}")
+            os.remove(lock_path)
+        except OSError:
+            pass
+        return True
+
+    def _call_upstream(self, fn: Callable[[], str]) -> str:
+        with self._lock:
+            self.upstream_calls += 1
+        return fn()
+
+    def _do_shared(self, key: str, fn: Callable[[], str]) -> str:
+        if not self.lock_dir:
+            return self._call_upstream(fn)
+
+        lock_path, result_path = self._paths(key)
+        self._prune()
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Otro proceso tiene la misma petición en curso
+                if self._remove_if_stale(lock_path):
+                    continue
+
+                with self._lock:
+                    self.saved_calls += 1
+                logger.info(f"Petición idéntica en curso en otro proceso, esperando ({key[:12]})")
+                # La antigüedad se comprueba en cada vuelta: si el líder muere
+                # sin liberar el bloqueo, la espera no es indefinida
+                while not self._remove_if_stale(lock_path):
+                    time.sleep(self.poll_interval)
+                result = self._read_result(result_path)
+                if result is not None:
+                    return result
+                # El líder falló sin dejar resultado: reintentar como líder
+                with self._lock:
+                    self.saved_calls -= 1
+                continue
+            except OSError as e:
+                logger.warning(f"No se pudo crear el bloqueo compartido: {str(e)}")
+                return self._call_upstream(fn)
+
+            try:
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                os.close(fd)
+                result = self._call_upstream(fn)
+                tmp_path = f"{result_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'text': result}, f, ensure_ascii=False)
+                os.replace(tmp_path, result_path)
+                return result
+            finally:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+
+    def _prune(self):
+        """Elimina resultados compartidos caducados"""
+        now = time.time()
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.result_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats_report(self) -> str:
+        """Texto con las llamadas reales y las ahorradas"""
+        with self._lock:
+            if not self.saved_calls:
+                return ''
+            return (
+                f"  Peticiones agrupadas: {self.saved_calls} llamadas ahorradas, "
+                f"{self.upstream_calls} llamadas reales"
+            )
+
+
+_default_single_flight: Optional[SingleFlight] = None
+_default_lock = threading.Lock()
+
+
+def default_single_flight() -> SingleFlight:
+    """Agrupador compartido por todas las instancias del proceso"""
+    global _default_single_flight
+    with _default_lock:
+        if _default_single_flight is None:
+            _default_single_flight = SingleFlight()
+        return _default_single_flight
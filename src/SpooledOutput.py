@@ -0,0 +1,153 @@
+"""
+Módulo para manejar la salida de PowerShell volcada a disco y mapeada en memoria
+"""
+import mmap
+import tempfile
+from typing import IO, Dict, Iterator, Optional, Tuple
+
+from RecordParser import iter_records
+
+
+class SpooledOutput:
+    """
+    Vista de solo lectura sobre la salida de un comando guardada en un
+    archivo temporal y mapeada en memoria
+
+    El texto completo nunca se decodifica salvo que se pida explícitamente
+    con str(). Los cortes (output[:10000]) y la iteración por líneas o
+    registros solo decodifican los rangos de bytes necesarios, por lo que
+    el objeto puede usarse en lugar de un str en AIAnalyzer.
+
+    Nota: len() y los índices de corte se expresan en bytes, no en caracteres.
+    """
+
+    def __init__(
+        self,
+        fileobj: Optional[IO[bytes]] = None,
+        encoding: str = 'utf-8',
+        errors: str = 'ignore'
+    ):
+        """
+        Inicializa la vista sobre el archivo
+
+        Args:
+            fileobj: Archivo binario con la salida. Si no se proporciona,
+                se crea un archivo temporal vacío.
+            encoding: Codificación usada al decodificar
+            errors: Manejo de errores de decodificación
+        """
+        self._file = fileobj if fileobj is not None else tempfile.TemporaryFile()
+        self.encoding = encoding
+        self.errors = errors
+        self._map: Optional[mmap.mmap] = None
+        self._size = 0
+        self._remap()
+
+    def _remap(self):
+        """Mapea el contenido actual del archivo en memoria"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        self._file.flush()
+        self._file.seek(0, 2)
+        self._size = self._file.tell()
+
+        # mmap no admite archivos vacíos
+        if self._size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __getitem__(self, key) -> str:
+        """Decodifica solo el rango de bytes solicitado"""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._size)
+            if step != 1:
+                raise ValueError("SpooledOutput solo admite cortes contiguos")
+            return self.decode(start, stop)
+        if isinstance(key, int):
+            if key < 0:
+                key += self._size
+            return self.decode(key, key + 1)
+        raise TypeError(f"Índice no válido: {type(key).__name__}")
+
+    def __str__(self) -> str:
+        return self.decode()
+
+    def __enter__(self) -> 'SpooledOutput':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """
+        Devuelve una vista sin copia de un rango de bytes
+
+        Las vistas deben liberarse (release()) antes de llamar a close().
+        """
+        if self._map is None:
+            return memoryview(b'')
+        end = self._size if end is None else min(end, self._size)
+        return memoryview(self._map)[start:end]
+
+    def decode(self, start: int = 0, end: Optional[int] = None) -> str:
+        """
+        Decodifica un rango de bytes
+
+        Args:
+            start: Byte inicial
+            end: Byte final (exclusivo). None para llegar al final.
+
+        Returns:
+            Texto decodificado del rango
+        """
+        if self._map is None:
+            return ''
+        end = self._size if end is None else min(end, self._size)
+        if start >= end:
+            return ''
+        return self._map[start:end].decode(self.encoding, self.errors)
+
+    def iter_line_spans(self) -> Iterator[Tuple[int, int]]:
+        """
+        Itera los rangos (inicio, fin) de cada línea sin decodificarlas
+
+        El fin excluye el salto de línea y el retorno de carro final.
+        """
+        if self._map is None:
+            return
+
+        mm = self._map
+        pos = 0
+        size = self._size
+        while pos < size:
+            newline = mm.find(b'\n', pos)
+            end = size if newline < 0 else newline
+            line_end = end
+            if line_end > pos and mm[line_end - 1] == 0x0D:
+                line_end -= 1
+            yield pos, line_end
+            pos = end + 1
+
+    def iter_lines(self) -> Iterator[str]:
+        """Itera las líneas decodificándolas una a una"""
+        for start, end in self.iter_line_spans():
+            yield self.decode(start, end)
+
+    def iter_records(self) -> Iterator[Dict[str, str]]:
+        """Itera los objetos de PowerShell sin materializar todo el texto"""
+        return iter_records(self.iter_lines())
+
+    def close(self):
+        """Libera el mapeo y elimina el archivo temporal"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+        self._size = 0
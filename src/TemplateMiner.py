@@ -0,0 +1,347 @@
+"""
+Módulo para extraer plantillas de los mensajes de eventos (estilo Drain)
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from ColumnarRecords import ColumnarRecords
+
+WILDCARD = '<*>'
+
+# Patrones de valores variables; se reemplazan por <*> dentro de cada palabra
+_MASK_RE = re.compile(
+    r'(?:https?://\S+)'                                              # URLs
+    r'|(?:\{?[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}\}?)'  # GUIDs
+    r'|(?:\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?)'                         # IPv4[:puerto]
+    r'|(?:0[xX][0-9a-fA-F]+)'                                        # Hexadecimal
+    r'|(?:\d{1,4}[/-]\d{1,2}[/-]\d{1,4})'                            # Fechas
+    r'|(?:\d{1,2}:\d{2}(?::\d{2})?)'                                 # Horas
+    r'|(?:\d+)'                                                      # Números
+)
+
+# Ruta por defecto de la tabla de plantillas persistida
+DEFAULT_STATE_PATH = os.path.join(
+    os.path.dirname(__file__), 'reportes', 'plantillas_eventos.json'
+)
+
+
+class _Cluster:
+    """Grupo de mensajes que comparten una plantilla"""
+
+    __slots__ = ('template_id', 'tokens', 'count')
+
+    def __init__(self, template_id: int, tokens: List[str], count: int = 0):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.count = count
+
+    @property
+    def text(self) -> str:
+        return ' '.join(self.tokens)
+
+
+class TemplateMiner:
+    """
+    Minero de plantillas en línea al estilo Drain
+
+    Cada mensaje se procesa una sola vez: se enmascaran los valores variables
+    (GUIDs, hexadecimales, IPs, números, fechas), se busca el grupo en un
+    árbol de prefijos de profundidad fija y, si la similitud supera el umbral,
+    las posiciones que difieren pasan a ser parámetros <*>.
+    """
+
+    def __init__(
+        self,
+        state_path: Optional[str] = DEFAULT_STATE_PATH,
+        similarity_threshold: float = 0.5,
+        depth: int = 4,
+        max_children: int = 100,
+        max_cache_entries: int = 100000
+    ):
+        """
+        Inicializa el minero y carga la tabla de plantillas persistida
+
+        Args:
+            state_path: Archivo JSON donde se guardan las plantillas entre
+                ejecuciones. None para no persistir.
+            similarity_threshold: Fracción mínima de palabras iguales para
+                asignar un mensaje a una plantilla existente
+            depth: Profundidad del árbol de prefijos (incluye el nivel de longitud)
+            max_children: Máximo de hijos por nodo antes de agrupar en <*>
+            max_cache_entries: Tamaño máximo de la caché de mensajes
+                enmascarados (mantiene acotada la memoria en ejecuciones largas)
+        """
+        self.state_path = state_path
+        self.similarity_threshold = similarity_threshold
+        self.prefix_depth = max(depth - 2, 1)
+        self.max_children = max_children
+        self.max_cache_entries = max_cache_entries
+
+        self._tree: Dict = {}
+        self._clusters: Dict[int, _Cluster] = {}
+        # Caché de mensajes ya enmascarados -> plantilla (acelera repeticiones exactas)
+        self._masked_cache: Dict[str, int] = {}
+
+        if state_path and os.path.exists(state_path):
+            self.load(state_path)
+
+    @staticmethod
+    def _tokenize(message: str) -> Tuple[List[str], List[str]]:
+        """Devuelve (palabras originales, palabras enmascaradas)"""
+        # Los patrones no contienen espacios, así que enmascarar el mensaje
+        # completo de una vez conserva la alineación de las palabras
+        return message.split(), _MASK_RE.sub(WILDCARD, message).split()
+
+    def _leaf(self, masked: List[str], create: bool) -> Optional[List[_Cluster]]:
+        """Busca (o crea) la hoja del árbol correspondiente al mensaje"""
+        node = self._tree.get(len(masked))
+        if node is None:
+            if not create:
+                return None
+            node = self._tree[len(masked)] = {}
+
+        for token in masked[:self.prefix_depth]:
+            key = WILDCARD if WILDCARD in token else token
+            child = node.get(key)
+            if child is None:
+                child = node.get(WILDCARD)
+            if child is None:
+                if not create:
+                    return None
+                if len(node) >= self.max_children:
+                    key = WILDCARD
+                child = node.setdefault(key, {})
+            node = child
+
+        leaf = node.get(None)
+        if leaf is None and create:
+            leaf = node[None] = []
+        return leaf
+
+    @staticmethod
+    def _similarity(template: List[str], masked: List[str]) -> Tuple[float, int]:
+        """Similitud (fracción de palabras iguales) y número de comodines"""
+        same = 0
+        wildcards = 0
+        for left, right in zip(template, masked):
+            if left == WILDCARD:
+                wildcards += 1
+            elif left == right:
+                same += 1
+        return same / len(template), wildcards
+
+    def mine(self, message: str) -> int:
+        """
+        Asigna un mensaje a una plantilla (generalizándola si hace falta)
+
+        Args:
+            message: Texto del mensaje
+
+        Returns:
+            Id de la plantilla
+        """
+        _, masked = self._tokenize(message or '')
+        if not masked:
+            masked = ['']
+
+        key = ' '.join(masked)
+        template_id = self._masked_cache.get(key)
+        if template_id is not None:
+            cluster = self._clusters[template_id]
+        else:
+            cluster = self._match_or_create(masked)
+            if len(self._masked_cache) >= self.max_cache_entries:
+                self._masked_cache.clear()
+            self._masked_cache[key] = cluster.template_id
+
+        cluster.count += 1
+        return cluster.template_id
+
+    def parameters(self, template_id: int, message: str) -> List[str]:
+        """
+        Extrae los parámetros de un mensaje según la plantilla actual
+
+        Las plantillas se generalizan a medida que llegan mensajes, así que
+        los parámetros deben resolverse cuando ya se han minado todos.
+
+        Args:
+            template_id: Id de la plantilla del mensaje
+            message: Texto del mensaje
+
+        Returns:
+            Lista de parámetros
+        """
+        cluster = self._clusters.get(template_id)
+        if cluster is None:
+            return []
+        return self._parameters(cluster.tokens, (message or '').split() or [''])
+
+    def add_message(self, message: str) -> Tuple[int, List[str]]:
+        """
+        Procesa un mensaje y devuelve su plantilla y parámetros
+
+        Los parámetros se calculan con la plantilla en el momento de añadir
+        el mensaje; para lotes use compress_messages(), que los resuelve con
+        las plantillas definitivas.
+
+        Args:
+            message: Texto del mensaje
+
+        Returns:
+            Tupla (id de plantilla, lista de parámetros)
+        """
+        template_id = self.mine(message)
+        return template_id, self.parameters(template_id, message)
+
+    def _match_or_create(self, masked: List[str]) -> _Cluster:
+        leaf = self._leaf(masked, create=True)
+
+        best = None
+        best_score = (-1.0, -1)
+        for cluster in leaf:
+            score = self._similarity(cluster.tokens, masked)
+            if score > best_score:
+                best, best_score = cluster, score
+
+        if best is not None and best_score[0] >= self.similarity_threshold:
+            # Generalizar las posiciones que difieren
+            best.tokens = [
+                left if left == right else WILDCARD
+                for left, right in zip(best.tokens, masked)
+            ]
+            return best
+
+        cluster = _Cluster(len(self._clusters) + 1, list(masked))
+        self._clusters[cluster.template_id] = cluster
+        leaf.append(cluster)
+        return cluster
+
+    @staticmethod
+    def _parameters(template: List[str], tokens: List[str]) -> List[str]:
+        """Extrae las palabras originales que ocupan posiciones variables"""
+        return [
+            token for slot, token in zip(template, tokens)
+            if WILDCARD in slot and slot != token
+        ]
+
+    def template(self, template_id: int) -> str:
+        """Texto de una plantilla"""
+        cluster = self._clusters.get(template_id)
+        return cluster.text if cluster else ''
+
+    @property
+    def templates(self) -> Dict[int, str]:
+        """Todas las plantillas conocidas (id -> texto)"""
+        return {template_id: cluster.text for template_id, cluster in self._clusters.items()}
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def load(self, path: str):
+        """Carga la tabla de plantillas desde JSON"""
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        for entry in state.get('templates', []):
+            tokens = entry['template'].split(' ')
+            cluster = _Cluster(entry['id'], tokens, entry.get('count', 0))
+            self._clusters[cluster.template_id] = cluster
+            self._leaf(tokens, create=True).append(cluster)
+
+    def save(self, path: Optional[str] = None):
+        """Guarda la tabla de plantillas en JSON"""
+        path = path or self.state_path
+        if not path:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        state = {
+            'templates': [
+                {'id': cluster.template_id, 'template': cluster.text, 'count': cluster.count}
+                for cluster in self._clusters.values()
+            ]
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+
+def render_message(template: str, params: Optional[str]) -> str:
+    """
+    Reconstruye un mensaje a partir de su plantilla y parámetros
+
+    Inversa de compress_messages(): cada posición variable de la plantilla
+    se sustituye por el siguiente parámetro. Los espacios del mensaje
+    original se normalizan a uno solo.
+
+    Args:
+        template: Texto de la plantilla
+        params: Columna Params del registro (parámetros separados por ' ; ')
+
+    Returns:
+        Texto del mensaje
+    """
+    values = iter(params.split(' ; ') if params else ())
+    return ' '.join(
+        next(values, slot) if WILDCARD in slot else slot
+        for slot in template.split(' ')
+    )
+
+
+def compress_messages(
+    records: ColumnarRecords,
+    miner: TemplateMiner,
+    column: str = 'Message'
+) -> ColumnarRecords:
+    """
+    Sustituye los mensajes por id de plantilla y parámetros
+
+    Las plantillas usadas se guardan como tabla auxiliar de la columna
+    TemplateId para que el prompt incluya cada una una sola vez. Primero se
+    minan todos los mensajes y después se extraen los parámetros con las
+    plantillas definitivas, para que las filas anteriores a una
+    generalización no pierdan sus valores.
+
+    Args:
+        records: Registros con columna de mensajes
+        miner: Minero de plantillas
+        column: Columna con el texto del mensaje
+
+    Returns:
+        Nuevo contenedor con columnas TemplateId y Params en lugar del mensaje
+    """
+    if column not in records.columns:
+        return records
+
+    schema = {
+        name: kind for name, kind in records.schema.items() if name != column
+    }
+    schema['TemplateId'] = 'int'
+    schema['Params'] = 'cat'
+
+    result = ColumnarRecords(schema=schema, task_name=records.task_name)
+    result.lookup_tables.update(records.lookup_tables)
+    messages = records.column(column)
+    template_ids = [miner.mine(message) for message in messages]
+    used = set(template_ids)
+
+    # Los mensajes repetidos comparten parámetros
+    params_cache: Dict[Tuple[int, str], str] = {}
+    for record, message, template_id in zip(records.iter_records(), messages, template_ids):
+        del record[column]
+        message = message or ''
+        params = params_cache.get((template_id, message))
+        if params is None:
+            params = ' ; '.join(miner.parameters(template_id, message))
+            params_cache[(template_id, message)] = params
+        record['TemplateId'] = template_id
+        record['Params'] = params
+        result.append(record)
+
+    result.lookup_tables['TemplateId'] = {
+        template_id: miner.template(template_id) for template_id in sorted(used)
+    }
+    return result
@@ -0,0 +1,257 @@
+"""
+Módulo para construir una línea de tiempo unificada a partir de las tareas recolectadas
+"""
+import bisect
+import functools
+import heapq
+import re
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ColumnarRecords import ColumnarRecords
+from CsvIngest import detect_day_first, parse_timestamp
+
+# Columna con la fecha y hora de cada registro según la tarea
+TIME_COLUMNS: Dict[str, str] = {
+    'Get-SuspiciousEvents': 'TimeCreated',
+    'Get-InternetProcesses': 'CreationTime',
+    'Get-UnsignedProcesses': 'StartTime',
+}
+
+# Etiqueta de cada tarea en la línea de tiempo
+SOURCE_LABELS: Dict[str, str] = {
+    'Get-SuspiciousEvents': 'Evento',
+    'Get-InternetProcesses': 'Conexión',
+    'Get-UnsignedProcesses': 'Proceso',
+}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_ISO_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+# Entrada de un flujo: (fecha ISO, índice de la tarea, posición del registro)
+TimelineEntry = Tuple[str, int, int]
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_timestamp(text: str, day_first: bool = True) -> Optional[str]:
+    """
+    Convierte una fecha localizada a 'AAAA-MM-DD HH:MM:SS' (con caché)
+
+    Las fechas de una misma recolección se repiten mucho (varios eventos por
+    segundo, conexiones abiertas a la vez), así que cada texto se interpreta
+    una sola vez.
+
+    Args:
+        text: Fecha tal como la escribe PowerShell
+        day_first: Si la fecha es ambigua, interpretar el primer campo como día
+
+    Returns:
+        Fecha normalizada o None si no se reconoce
+    """
+    value = parse_timestamp(text, day_first)
+    return value if _ISO_RE.match(value) else None
+
+
+def _describe(task_name: str, record: Dict, lookup_tables: Dict[str, Dict]) -> str:
+    """Texto corto de un registro para la línea de tiempo"""
+    if task_name == 'Get-SuspiciousEvents':
+        message = record.get('Message') or ''
+        if 'TemplateId' in record:
+            # Mensaje reducido por TemplateMiner: plantilla + parámetros
+            template = lookup_tables.get('TemplateId', {}).get(record['TemplateId'], '')
+            message = f"{template} [{record.get('Params') or ''}]"
+        return (
+            f"{record.get('LogName', '')} Id={record.get('Id', '')} "
+            f"{record.get('LevelDisplayName', '')} {message[:160]}"
+        ).strip()
+    if task_name == 'Get-InternetProcesses':
+        return (
+            f"{record.get('ProcessName', '')} (PID {record.get('PID', '')}) -> "
+            f"{record.get('RemoteAddress', '')}:{record.get('RemotePort', '')}"
+        )
+    if task_name == 'Get-UnsignedProcesses':
+        return (
+            f"{record.get('ProcessName', '')} (PID {record.get('PID', '')}) "
+            f"{record.get('SignatureStatus', '')} {record.get('Path', '')}"
+        ).strip()
+    return ' '.join(str(value) for value in record.values() if value not in (None, ''))
+
+
+def iter_task_stream(
+    task_index: int,
+    records: ColumnarRecords,
+    time_column: str,
+    fallback: Optional[str] = None
+) -> Iterator[TimelineEntry]:
+    """
+    Flujo ordenado por fecha de los registros de una tarea
+
+    Los recolectores ya devuelven los registros ordenados por tramos (por
+    ejemplo, cada log de eventos del más reciente al más antiguo); la
+    ordenación de Python aprovecha esos tramos, así que el coste es casi
+    lineal.
+
+    Args:
+        task_index: Índice de la tarea en la línea de tiempo
+        records: Registros de la tarea
+        time_column: Columna con la fecha
+        fallback: Fecha ISO para los registros sin fecha (p. ej. la de la
+            recolección); None para omitirlos
+
+    Returns:
+        Iterador de entradas (fecha, tarea, posición)
+    """
+    if time_column in records.columns:
+        values = records.column(time_column)
+        sample = [value for value in values[:200] if value]
+        day_first = detect_day_first(sample)
+        keys = [normalize_timestamp(value, day_first) if value else None for value in values]
+    else:
+        keys = [None] * len(records)
+
+    if fallback is not None:
+        keys = [key or fallback for key in keys]
+    positions = [position for position, key in enumerate(keys) if key is not None]
+    positions.sort(key=keys.__getitem__)
+    for position in positions:
+        yield keys[position], task_index, position
+
+
+class Timeline:
+    """
+    Línea de tiempo de los registros de varias tareas
+
+    Los flujos de cada tarea se combinan con una mezcla de k vías
+    (heapq.merge) sin copiar los registros: la línea de tiempo solo guarda
+    la fecha, la tarea y la posición de cada registro en su contenedor.
+    """
+
+    def __init__(self, tasks: Dict[str, ColumnarRecords]):
+        self.tasks = tasks
+        self._task_names = list(tasks)
+        self.keys: List[str] = []
+        self._task_indexes = array('B')
+        self._positions = array('I')
+
+    @classmethod
+    def build(
+        cls,
+        tasks_data: Dict[str, object],
+        collected_at: Optional[datetime] = None
+    ) -> 'Timeline':
+        """
+        Construye la línea de tiempo de las tareas con registros columnares
+
+        Args:
+            tasks_data: Dict tarea -> datos (solo se usan los ColumnarRecords)
+            collected_at: Momento de la recolección; se usa como fecha de
+                las conexiones y procesos que no traen la suya
+
+        Returns:
+            Línea de tiempo ordenada
+        """
+        tasks = {
+            task_name: data for task_name, data in tasks_data.items()
+            if isinstance(data, ColumnarRecords) and len(data)
+        }
+        timeline = cls(tasks)
+        fallback = collected_at.strftime(TIMESTAMP_FORMAT) if collected_at else None
+        streams = [
+            iter_task_stream(
+                index, records, TIME_COLUMNS.get(task_name, 'TimeCreated'),
+                fallback if task_name != 'Get-SuspiciousEvents' else None
+            )
+            for index, (task_name, records) in enumerate(tasks.items())
+        ]
+        timeline.extend(heapq.merge(*streams))
+        return timeline
+
+    def extend(self, entries: Iterable[TimelineEntry]):
+        """Agrega entradas ya ordenadas al final"""
+        for key, task_index, position in entries:
+            self.keys.append(key)
+            self._task_indexes.append(task_index)
+            self._positions.append(position)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def entry(self, index: int) -> Tuple[str, str, Dict]:
+        """Devuelve (fecha, tarea, registro) de una entrada"""
+        task_name = self._task_names[self._task_indexes[index]]
+        return self.keys[index], task_name, self.tasks[task_name].record(self._positions[index])
+
+    def __iter__(self) -> Iterator[Tuple[str, str, Dict]]:
+        for index in range(len(self.keys)):
+            yield self.entry(index)
+
+    def window(
+        self,
+        center: str,
+        before: float = 300,
+        after: float = 300
+    ) -> range:
+        """
+        Entradas alrededor de un momento dado
+
+        Args:
+            center: Fecha ISO ('AAAA-MM-DD HH:MM:SS') o localizada
+            before: Segundos antes del momento
+            after: Segundos después del momento
+
+        Returns:
+            Rango de índices de las entradas dentro de la ventana
+        """
+        moment = datetime.strptime(normalize_timestamp(center) or center, TIMESTAMP_FORMAT)
+        start = (moment - timedelta(seconds=before)).strftime(TIMESTAMP_FORMAT)
+        end = (moment + timedelta(seconds=after)).strftime(TIMESTAMP_FORMAT)
+        return range(bisect.bisect_left(self.keys, start), bisect.bisect_right(self.keys, end))
+
+    def rows(self, indexes: Optional[Iterable[int]] = None) -> List[Tuple[str, str, str, int]]:
+        """
+        Filas compactas (fecha, origen, descripción, repeticiones)
+
+        Las entradas consecutivas con la misma fecha, origen y descripción
+        se agrupan en una sola fila.
+        """
+        rows: List[Tuple[str, str, str, int]] = []
+        for index in (range(len(self)) if indexes is None else indexes):
+            key, task_name, record = self.entry(index)
+            text = _describe(task_name, record, self.tasks[task_name].lookup_tables)
+            row = (key, SOURCE_LABELS.get(task_name, task_name), text)
+            if rows and rows[-1][:3] == row:
+                rows[-1] = row + (rows[-1][3] + 1,)
+            else:
+                rows.append(row + (1,))
+        return rows
+
+    def to_prompt_text(self, limit: int = 3000, indexes: Optional[Iterable[int]] = None) -> str:
+        """
+        Serializa la línea de tiempo en texto compacto
+
+        Si no cabe en el límite se conservan las filas más recientes.
+
+        Args:
+            limit: Máximo de caracteres
+            indexes: Entradas a incluir (por defecto todas)
+
+        Returns:
+            Una línea por fila: 'fecha | origen | descripción [xN]'
+        """
+        lines = [
+            f"{key} | {source} | {text}" + (f" [x{count}]" if count > 1 else '')
+            for key, source, text, count in self.rows(indexes)
+        ]
+        kept = []
+        used = 64
+        for line in reversed(lines):
+            if used + len(line) + 1 > limit:
+                break
+            kept.append(line)
+            used += len(line) + 1
+        kept.reverse()
+        if len(kept) < len(lines):
+            kept.insert(0, f"... ({len(lines) - len(kept)} filas anteriores omitidas)")
+        return '\n'.join(kept)
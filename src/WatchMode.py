@@ -0,0 +1,358 @@
+"""
+Módulo para el modo de vigilancia continua (recolección programada)
+"""
+import heapq
+import itertools
+import logging
+import random
+import signal
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from ArtifactExtractor import add_artifacts
+from BinaryHasher import BinaryHasher, add_hashes
+from BudgetPlanner import score_record
+from EventFilter import EventFilter
+from GeoEnrichment import GeoDatabase, add_geo_info
+from IocMatcher import IocMatcher, add_ioc_matches
+from KnowledgeBase import KnowledgeBase
+from Prevalence import PrevalenceStore, suppress_common
+from ColumnarRecords import ColumnarRecords
+from SpooledOutput import SpooledOutput
+from TemplateMiner import TemplateMiner, compress_messages
+
+logger = logging.getLogger(__name__)
+
+# Intervalo por defecto (segundos) de cada recolector
+DEFAULT_INTERVALS: Dict[str, float] = {
+    'Get-SuspiciousEvents': 300,
+    'Get-InternetProcesses': 60,
+    'Get-UnsignedProcesses': 900,
+}
+
+# Solapamiento de la ventana incremental de eventos, para no perder eventos
+# escritos mientras se ejecutaba la recolección anterior
+EVENT_WINDOW_OVERLAP = timedelta(seconds=5)
+
+
+class _SeenSet:
+    """Conjunto acotado (LRU) de huellas de registros ya vistos"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[int, None]' = OrderedDict()
+
+    def add(self, fingerprint: int) -> bool:
+        """Registra una huella; devuelve True si no se había visto"""
+        if fingerprint in self._entries:
+            self._entries.move_to_end(fingerprint)
+            return False
+        self._entries[fingerprint] = None
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class WatchJob:
+    """Estado de un recolector programado"""
+    task_name: str
+    interval: float
+    seen: _SeenSet
+    future: Optional[Future] = None
+    # Inicio de la última recolección completada (ventana incremental)
+    watermark: Optional[datetime] = None
+    runs: int = 0
+    skipped: int = 0
+    analyses: int = 0
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+class WatchScheduler:
+    """
+    Ejecuta los recolectores de forma periódica, cada uno con su cadencia
+
+    - Recolección incremental: los eventos se piden desde el ciclo anterior
+      (filtro en el origen) y en todas las tareas se descartan los registros
+      ya vistos, por lo que cada ciclo solo procesa lo que cambió.
+    - Solo se llama a la IA cuando aparece material nuevo con una puntuación
+      de sospecha igual o superior al umbral.
+    - Los intervalos llevan jitter para no sincronizar equipos, una tarea no
+      se lanza si su ejecución anterior sigue en curso y Ctrl+C / SIGTERM
+      detienen el bucle esperando a que terminen las tareas activas.
+    - La memoria está acotada: las huellas vistas tienen un tamaño máximo y
+      los registros de cada ciclo se descartan al terminarlo.
+    """
+
+    def __init__(
+        self,
+        ps_helper,
+        ai_analyzer=None,
+        pdf_generator=None,
+        intervals: Optional[Dict[str, float]] = None,
+        jitter: float = 0.1,
+        score_threshold: float = 0.5,
+        max_events: int = 2000,
+        template_miner: Optional[TemplateMiner] = None,
+        max_seen: int = 50000,
+        hasher: Optional[BinaryHasher] = None,
+        ioc_matcher: Optional[IocMatcher] = None,
+        geo: Optional[GeoDatabase] = None,
+        knowledge_base: Optional[KnowledgeBase] = None,
+        event_filter: Optional[EventFilter] = None,
+        prevalence_store: Optional[PrevalenceStore] = None
+    ):
+        """
+        Inicializa el planificador
+
+        Args:
+            ps_helper: Instancia de PowerShellHelper
+            ai_analyzer: Instancia de AIAnalyzer (opcional)
+            pdf_generator: Instancia de PDFGenerator (opcional)
+            intervals: Dict tarea -> segundos entre ejecuciones
+            jitter: Variación aleatoria relativa de cada intervalo (0.1 = ±10%)
+            score_threshold: Puntuación mínima para lanzar el análisis con IA
+            max_events: Máximo de eventos por log en cada ciclo
+            template_miner: Minero de plantillas para los mensajes de eventos
+            max_seen: Huellas recordadas por tarea
+            hasher: Calculador de hashes de los binarios señalados
+            ioc_matcher: Motor de indicadores de compromiso; los registros
+                que coinciden se analizan siempre
+            geo: Base de ASN para enriquecer las direcciones remotas
+            knowledge_base: Base de conocimiento donde guardar los hallazgos
+            event_filter: Criterios de Get-SuspiciousEvents evaluados en el origen
+            prevalence_store: Prevalencia en la flota; los registros
+                habituales no se analizan con IA
+        """
+        self.ps_helper = ps_helper
+        self.ai_analyzer = ai_analyzer
+        self.pdf_generator = pdf_generator
+        self.jitter = jitter
+        self.score_threshold = score_threshold
+        self.max_events = max_events
+        self.template_miner = template_miner
+        self.hasher = hasher
+        self.ioc_matcher = ioc_matcher
+        self.geo = geo
+        self.knowledge_base = knowledge_base
+        self.event_filter = event_filter
+        self.prevalence_store = prevalence_store
+        self.host = socket.gethostname()
+
+        intervals = DEFAULT_INTERVALS if intervals is None else intervals
+        self.jobs = {
+            task_name: WatchJob(task_name, float(interval), _SeenSet(max_seen))
+            for task_name, interval in intervals.items()
+            if interval and interval > 0
+        }
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Solicita la detención ordenada del bucle y cancela los recolectores en curso"""
+        self._stop.set()
+        self.ps_helper.cancel()
+
+    def _next_delay(self, job: WatchJob) -> float:
+        return job.interval * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def _collect(self, job: WatchJob) -> Dict[str, Any]:
+        """Ejecuta el recolector de la tarea"""
+        if job.task_name == 'Get-SuspiciousEvents':
+            start_time = job.watermark - EVENT_WINDOW_OVERLAP if job.watermark else None
+            return self.ps_helper.get_suspicious_events(
+                max_events=self.max_events,
+                dont_save_report=True,
+                spool=True,
+                start_time=start_time,
+                event_filter=self.event_filter
+            )
+        if job.task_name == 'Get-InternetProcesses':
+            return self.ps_helper.get_internet_processes(dont_save_report=True, spool=True)
+        if job.task_name == 'Get-UnsignedProcesses':
+            return self.ps_helper.get_unsigned_processes(spool=True)
+        raise ValueError(f"Tarea no soportada en modo vigilancia: {job.task_name}")
+
+    def _new_records(self, job: WatchJob, output) -> ColumnarRecords:
+        """Filtra los registros que no se habían visto en ciclos anteriores"""
+        records = ColumnarRecords.from_output(output, task_name=job.task_name)
+        new_positions = [
+            position for position, record in enumerate(records.iter_records())
+            if job.seen.add(hash(tuple(record.items())))
+        ]
+        return records.take(new_positions)
+
+    def run_job(self, job: WatchJob):
+        """Ejecuta un ciclo completo de una tarea"""
+        started = datetime.now()
+        job.runs += 1
+        result = self._collect(job)
+        output = result['output']
+        try:
+            if not result['success']:
+                logger.warning(f"[vigilancia] {job.task_name} falló: {result['error']}")
+                return
+
+            new_records = self._new_records(job, output)
+            if result.get('truncated'):
+                # Faltan los eventos más antiguos: la ventana no avanza y el
+                # siguiente ciclo los vuelve a pedir (los repetidos se descartan)
+                logger.warning(f"[vigilancia] {job.task_name}: {result['error']}")
+            else:
+                job.watermark = started
+            job.stats = {'nuevos': len(new_records), 'recordados': len(job.seen)}
+            if not len(new_records):
+                logger.info(f"[vigilancia] {job.task_name}: sin cambios")
+                return
+
+            # Los hashes se calculan antes del cotejo para que los IOC de
+            # tipo hash puedan coincidir (mismo orden que el análisis puntual)
+            if self.hasher is not None and 'Path' in new_records.columns:
+                new_records = add_hashes(new_records, self.hasher)
+            if self.ioc_matcher is not None:
+                self.ioc_matcher.refresh()
+                new_records, hits = add_ioc_matches(new_records, self.ioc_matcher)
+                if hits:
+                    logger.warning(f"[vigilancia] {job.task_name}: {hits} coincidencias con IOC")
+
+            if self.prevalence_store is not None:
+                observed = new_records
+                new_records, suppressed = suppress_common(new_records, self.prevalence_store, self.host)
+                self.prevalence_store.observe(observed, self.host)
+                self.prevalence_store.save()
+                if suppressed:
+                    logger.info(f"[vigilancia] {job.task_name}: {suppressed} registros habituales en la flota")
+                if not len(new_records):
+                    return
+
+            scores = [score_record(job.task_name, record) for record in new_records.iter_records()]
+            top_score = max(scores)
+            logger.info(
+                f"[vigilancia] {job.task_name}: {len(new_records)} registros nuevos "
+                f"(puntuación máxima {top_score:.2f})"
+            )
+            if top_score < self.score_threshold:
+                return
+
+            print(f"\n[Vigilancia] {job.task_name}: {len(new_records)} registros nuevos sospechosos")
+            self._analyze(job, new_records)
+        finally:
+            if isinstance(output, SpooledOutput):
+                output.close()
+
+    def _analyze(self, job: WatchJob, new_records: ColumnarRecords):
+        """Analiza con IA los registros nuevos y genera el reporte"""
+        if self.ai_analyzer is None:
+            return
+
+        if 'Message' in new_records.columns:
+            new_records, _ = add_artifacts(new_records)
+        if self.template_miner is not None and 'Message' in new_records.columns:
+            new_records = compress_messages(new_records, self.template_miner)
+        if self.geo is not None:
+            new_records = add_geo_info(new_records, self.geo)
+
+        analysis = self.ai_analyzer.analyze_forensic_data(
+            task_name=job.task_name,
+            data=new_records,
+            additional_context=(
+                "Modo vigilancia: los datos contienen solo los registros nuevos "
+                "desde el ciclo anterior."
+            )
+        )
+        job.analyses += 1
+        pdf_path = None
+        if analysis['success'] and self.pdf_generator is not None:
+            pdf_path = self.pdf_generator.generate_forensic_report(
+                analysis_data=analysis,
+                task_name=f"{job.task_name} (vigilancia)"
+            )
+            print(f"✓ Reporte PDF generado: {pdf_path}")
+        if self.knowledge_base is not None:
+            self.knowledge_base.add_analysis(analysis, job.task_name, report_path=pdf_path)
+
+    def _install_signal_handlers(self) -> Dict[int, Any]:
+        """Convierte SIGINT/SIGTERM (y SIGBREAK en Windows) en una parada ordenada"""
+        previous = {}
+        if threading.current_thread() is not threading.main_thread():
+            return previous
+
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+            signum = getattr(signal, name, None)
+            if signum is None:
+                continue
+            try:
+                previous[signum] = signal.signal(signum, lambda *_: self.stop())
+            except (OSError, ValueError):
+                pass
+        return previous
+
+    def run(self):
+        """Bucle principal; bloquea hasta que se llama a stop() o llega una señal"""
+        if not self.jobs:
+            print("✗ No hay recolectores programados")
+            return
+
+        previous_handlers = self._install_signal_handlers()
+        executor = ThreadPoolExecutor(max_workers=len(self.jobs), thread_name_prefix='vigilancia')
+        counter = itertools.count()
+        now = time.monotonic()
+
+        # Primera ejecución escalonada dentro del margen de jitter
+        heap = [
+            (now + random.uniform(0, job.interval * self.jitter), next(counter), job)
+            for job in self.jobs.values()
+        ]
+        heapq.heapify(heap)
+
+        print("\n[Modo vigilancia activo - Ctrl+C para detener]")
+        for job in self.jobs.values():
+            print(f"  {job.task_name}: cada {job.interval:.0f} s")
+
+        try:
+            while not self._stop.is_set():
+                due, _, job = heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    # Esperas cortas para que Ctrl+C responda también en Windows
+                    self._stop.wait(min(wait, 1.0))
+                    continue
+
+                heapq.heappop(heap)
+                if job.future is not None and not job.future.done():
+                    job.skipped += 1
+                    logger.warning(
+                        f"[vigilancia] {job.task_name}: ciclo omitido, la ejecución anterior sigue en curso"
+                    )
+                else:
+                    job.future = executor.submit(self._run_job_safe, job)
+                heapq.heappush(heap, (time.monotonic() + self._next_delay(job), next(counter), job))
+        finally:
+            print("\n[Deteniendo modo vigilancia, esperando tareas en curso...]")
+            executor.shutdown(wait=True)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            if self.template_miner is not None:
+                self.template_miner.save()
+            if self.hasher is not None:
+                self.hasher.save()
+            for job in self.jobs.values():
+                print(
+                    f"  {job.task_name}: {job.runs} ciclos, {job.skipped} omitidos, "
+                    f"{job.analyses} análisis con IA"
+                )
+
+    def _run_job_safe(self, job: WatchJob):
+        """Ejecuta un ciclo registrando cualquier error sin detener el bucle"""
+        try:
+            self.run_job(job)
+        except Exception as e:
+            logger.error(f"[vigilancia] Error en {job.task_name}: {str(e)}", exc_info=True)